@@ -1,10 +1,13 @@
 function Training-Backup {
+	# Arguments are passed on to TrainingBackup.py, e.g. "Training-Backup --check" or "Training-Backup --watch"
+	param([Parameter(ValueFromRemainingArguments = $true)] [string[]] $Arguments)
+
 	$currentDirectory = Get-Location
     
 	Set-Location -Path $MachineSpecificPaths.TrainingBackupDirectory
     
 	try {
-		& ".\TrainingBackup.bat"
+		& ".\TrainingBackup.bat" @Arguments
 		Write-Host -ForegroundColor Green "`n=> Training Backup Completed!"
 	}
 	catch {
@@ -5,4 +5,4 @@ set "python_script=C:\Users\Ivan\Development\GitHub\Training_Backup\TrainingBack
 :: Activate the conda environment and run the Python script
 call "C:\Users\Ivan\miniconda3\Scripts\activate.bat" "C:\Users\Ivan\miniconda3"
 call conda activate TrainingBackup
-python "%python_script%"
\ No newline at end of file
+python "%python_script%" %*
\ No newline at end of file
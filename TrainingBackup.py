@@ -1,20 +1,35 @@
 import os
 import os.path
+import sys
+import cProfile
+import contextlib
+import atexit
+import shutil
+import argparse
+import subprocess
+import tempfile
 import time
+import re
 import json
+import base64
+import hashlib
 import urllib
 import socket
-import requests
-from docx2pdf import convert
-from datetime import datetime
-from pypdf import PdfWriter, PdfReader
+import threading
+import random
+import fnmatch
+import zlib
+import io
+import mmap
+import heapq
+import itertools
+import contextvars
+import importlib
+import importlib.util
+from datetime import datetime, timezone
 from urllib.parse import urlparse, parse_qs, quote
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+# requests, googleapiclient, google-auth, pypdf and docx2pdf are imported by the functions that use them,
+# so the script (and `--check`) starts without loading them
 
 # --- Constants ---
 RESET = "\033[0m"
@@ -22,66 +37,58 @@ DARK_CYAN = "\033[36m"
 GREEN = "\033[92m"
 RED = "\033[91m"
 
-# --- Configuration Loading ---
-hostname = socket.gethostname()
-try:
-    with open("configuration.json") as f:
-        config = json.load(f)
-except FileNotFoundError:
-    print(RED + "=> Configuration file 'configuration.json' not found!" + RESET)
-    exit("Exiting due to configuration error.")
-except json.JSONDecodeError:
-    print(RED + "=> Error decoding 'configuration.json'. Please ensure it's valid JSON." + RESET)
-    exit("Exiting due to configuration error.")
-
-
-if hostname in config:
-    paths = config[hostname]
-    training_folder = paths.get("training_folder")
-    credentials_folder = paths.get("credentials_folder")
-    if not training_folder or not credentials_folder:
-        print(RED + '=> "training_folder" or "credentials_folder" missing in configuration for this host!' + RESET)
-        exit("Exiting due to configuration error.")
-else:
-    print(RED + f"=> Hostname '{hostname}' not found in configuration file!" + RESET)
-    exit("Exiting due to configuration error.")
-
 # --- Global Variable Definitions ---
 # File and Folder Names
 ONEDRIVE_TARGET_FOLDER = "Training"
 FILE_TO_DOWNLOAD_AND_EDIT = "ThePRogram2026.docx"
 PDF_OUTPUT_FILENAME = "ThePRogram2026.pdf"
-ONEDRIVE_TRAINING_PDF_FILENAME = "Training.pdf" # Last page of PDF_OUTPUT_FILENAME
+ONEDRIVE_TRAINING_PDF_FILENAME = "Training.pdf" # `context.training_pdf_pages` of PDF_OUTPUT_FILENAME
 GOOGLE_DRIVE_UPLOAD_FOLDER = "PRogram"
 GOOGLE_DRIVE_UPLOAD_FILENAME = "ThePRogram2026.pdf"
 
-# Local Paths
-docx_path = os.path.join(training_folder, FILE_TO_DOWNLOAD_AND_EDIT)
-pdf_path = os.path.join(training_folder, PDF_OUTPUT_FILENAME)
-training_pdf_path = os.path.join(training_folder, ONEDRIVE_TRAINING_PDF_FILENAME)
-
-# Credentials Paths
-google_token_path = os.path.join(credentials_folder, "google_token.json")
-google_credentials_path = os.path.join(credentials_folder, "google_credentials.json")
-
-onedrive_token_path = os.path.join(credentials_folder, "onedrive_token.json")
-one_drive_credentials_path = os.path.join(credentials_folder, "onedrive_credentials.json")
-
-try:
-    with open(one_drive_credentials_path, "r") as f:
-        onedrive_creds_json = json.load(f)
-except FileNotFoundError:
-    print(RED + f"=> OneDrive credentials file '{one_drive_credentials_path}' not found!" + RESET)
-    exit("Exiting due to configuration error.")
-except json.JSONDecodeError:
-    print(RED + f"=> Error decoding OneDrive credentials file '{one_drive_credentials_path}'." + RESET)
-    exit("Exiting due to configuration error.")
-
-onedrive_client_id = onedrive_creds_json.get("client_id")
-onedrive_client_secret = onedrive_creds_json.get("client_secret")
-if not onedrive_client_id or not onedrive_client_secret:
-    print(RED + "=> 'client_id' or 'client_secret' missing in OneDrive credentials file." + RESET)
-    exit("Exiting due to configuration error.")
+# Change Detection
+HASH_CHUNK_SIZE = 160 * 8192 # Multiple of the 160-byte quickXorHash block so every chunk starts block-aligned
+
+# DOCX to PDF Conversion
+CONVERTER_STARTUP_TIMEOUT = 60 # Seconds to wait for the LibreOffice listener to accept connections
+WORD_FORMAT_PDF = 17           # wdFormatPDF, the `SaveAs` file format of Microsoft Word
+
+# Run Reports
+REPORTS_TO_KEEP = 50 # Older run reports and profiles in `context.reports_folder` are deleted
+
+# Watch Mode
+WATCH_POLL_INTERVAL = 1.0    # Seconds between checks of the document
+WATCH_DEBOUNCE_SECONDS = 3.0 # Seconds the document must stay unchanged after a write
+
+# Token Cache
+TOKEN_REFRESH_MARGIN = 300         # Seconds before expiry at which tokens are refreshed in the background
+TOKEN_REFRESH_RETRY_INTERVAL = 60  # Seconds between attempts after a failed (or impossible) background refresh
+
+# State Files
+FILE_LOCK_TIMEOUT = 30 # Seconds to wait for a parallel run to release a token or spool file
+
+# Google Drive Client
+DRIVE_DISCOVERY_CACHE_MAX_AGE = 24 * 3600 # Seconds a discovery document fetched from google_drive_discovery_url is reused
+DRIVE_UPLOAD_CHUNK_SIZE = 4 * 256 * 1024  # Bytes per resumable upload request while "upload_bandwidth_limit" is set (a multiple of 256 KiB)
+
+# Upload Spool
+SPOOL_ORPHAN_AGE = 24 * 3600 # Seconds after which a spooled file that no upload job refers to is deleted
+
+# Version History
+VERSION_CHUNK_MIN_SIZE = 8 * 1024     # Bytes, shorter pieces between anchors are merged with the next one
+VERSION_CHUNK_MAX_SIZE = 1024 * 1024  # Bytes, longer stretches without an anchor are cut
+VERSION_CHUNK_ANCHOR = re.compile(rb"PK\x03\x04|PK\x01\x02|endobj") # Zip member and directory headers (.docx) and PDF object ends
+VERSION_COMPRESSION_LEVEL = 6         # zlib level of the stored chunks
+
+# Backup Daemon
+DAEMON_RECENT_JOBS = 20 # Finished jobs `--status` still shows
+
+# Upload Stage
+UPLOAD_MAX_WORKERS = 4 # Upper bound on concurrent uploads across all destinations
+UPLOAD_PRIORITY_TRAINING_PDF = 0 # Upload priorities, lower values go first (see get_upload_priority())
+UPLOAD_PRIORITY_PDF = 1
+UPLOAD_PRIORITY_DOCUMENT = 2
+UPLOAD_THROTTLE_BLOCK_SIZE = 64 * 1024 # Bytes read from an upload body per bandwidth grant
 
 # OneDrive OAuth Constants
 REDIRECT_URI = "http://localhost:8080/"
@@ -89,602 +96,5659 @@ TOKEN_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
 AUTH_URL = "https://login.microsoftonline.com/common/oauth2/v2.0/authorize"
 ONEDRIVE_SCOPES = "files.readwrite offline_access"
 
+# Microsoft Graph JSON Batching
+GRAPH_BATCH_LIMIT = 20    # Calls per $batch request (the Microsoft Graph maximum)
+GRAPH_BATCH_LINGER = 0.01 # Seconds the first metadata call waits for parallel calls to batch with, while other calls are in flight
+
+# OneDrive Upload Session Constants
+ONEDRIVE_SIMPLE_UPLOAD_LIMIT = 4 * 1024 * 1024 # Files above this size are uploaded through an upload session
+ONEDRIVE_UPLOAD_CHUNK_SIZE = 10 * 320 * 1024   # Must be a multiple of 320 KiB
+
 # Google Drive OAuth Constants
 GOOGLE_DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
 
 
-# --- Function Definitions ---
+# --- Configuration Loading ---
+hostname = socket.gethostname()
 
-def exchange_code_for_tokens(code):
+class BackupContext:
     """
-    Exchanges an OAuth 2.0 authorization code for an access token, refresh token,
-    and expiration time from Microsoft's token endpoint.
+    The configuration of this host, the paths derived from it, the OneDrive client
+    credentials and the shared network clients.
 
-    This function is part of the OneDrive authentication flow when a new authorization
-    is required.
+    Nothing is read or created until it is first used: the first access to any
+    configuration value reads `configuration.json` and sets all of them (see
+    `apply_configuration()`), the first access to `onedrive_client_id` or
+    `onedrive_client_secret` reads the OneDrive credentials file, and `graph_client`,
+    `graph_batcher`, `retry_policy`, `token_manager` and `upload_limiter` are created on first use. A missing or invalid configuration
+    still ends the script, but only once a stage needs it, so `--check` and other
+    commands that don't need everything start immediately.
 
     Parameters:
-    code (str): The authorization code obtained from the user after they
-                authorize the application via the authorization URL.
+    configuration_path (str): The path of the configuration file.
+    """
+
+    def __init__(self, configuration_path="configuration.json"):
+        self.configuration_path = configuration_path
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        # Only called for values that aren't loaded yet
+        if name.startswith("_"):
+            raise AttributeError(name)
+        with self._lock:
+            if name not in self.__dict__:
+                if name in ("onedrive_client_id", "onedrive_client_secret"):
+                    client_credentials = self.load_onedrive_client_credentials()
+                    if not client_credentials:
+                        exit("Exiting due to configuration error.")
+                    self.onedrive_client_id, self.onedrive_client_secret = client_credentials
+                elif name == "graph_client":
+                    self.graph_client = GraphClient()
+                elif name == "retry_policy":
+                    self.retry_policy = RetryPolicy()
+                elif name == "graph_batcher":
+                    self.graph_batcher = GraphBatcher()
+                elif name == "token_manager":
+                    self.token_manager = TokenManager()
+                elif name == "upload_limiter":
+                    self.upload_limiter = UploadBandwidthLimiter(self.upload_bandwidth_limit) if self.upload_bandwidth_limit else None
+                elif not self.configuration_loaded:
+                    host_configuration = self.load_host_configuration()
+                    if host_configuration is None:
+                        exit("Exiting due to configuration error.")
+                    self.apply_configuration(host_configuration)
+        if name not in self.__dict__:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return self.__dict__[name]
+
+    @property
+    def configuration_loaded(self):
+        """True once the configuration of this host has been read."""
+        return "paths" in self.__dict__
+
+    def load_host_configuration(self):
+        """
+        Reads the configuration of this host from `configuration_path`.
+
+        Parameters:
+        None
+
+        Returns:
+        dict: The configuration of this host, or None if it is missing or invalid
+              (the problem is printed).
+        """
+        try:
+            with open(self.configuration_path) as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            print(RED + "=> Configuration file 'configuration.json' not found!" + RESET)
+            return None
+        except json.JSONDecodeError:
+            print(RED + "=> Error decoding 'configuration.json'. Please ensure it's valid JSON." + RESET)
+            return None
+
+        if hostname not in config:
+            print(RED + f"=> Hostname '{hostname}' not found in configuration file!" + RESET)
+            return None
+        paths = config[hostname]
+        if not paths.get("training_folder") or not paths.get("credentials_folder"):
+            print(RED + '=> "training_folder" or "credentials_folder" missing in configuration for this host!' + RESET)
+            return None
+        return paths
+
+    def apply_configuration(self, paths):
+        """
+        Sets the configuration values and paths of the context from the configuration of this host.
+
+        Parameters:
+        paths (dict): The configuration of this host, as returned by `load_host_configuration()`.
+
+        Returns:
+        None.
+        """
+        self.paths = paths
+        self.training_folder = paths["training_folder"]
+        self.credentials_folder = paths["credentials_folder"]
+
+        # Settings
+        self.training_pdf_pages = paths.get("training_pdf_pages", "-1")          # Pages of the PDF extracted into ONEDRIVE_TRAINING_PDF_FILENAME ("-1" = last page)
+        self.download_chunk_size = paths.get("download_chunk_size", 1024 * 1024) # Bytes written per streamed chunk
+        self.converter_backend = paths.get("converter", "docx2pdf")              # "docx2pdf" (Microsoft Word) or "libreoffice"
+        self.soffice_path = paths.get("soffice_path", "soffice")                 # LibreOffice executable
+        self.unoserver_path = paths.get("unoserver_path", "unoserver")           # Long-lived LibreOffice listener (pip install unoserver)
+        self.unoserver_port = paths.get("unoserver_port", 2003)
+        self.pdf_optimization = paths.get("pdf_optimization", False)             # Upload a compressed copy of the PDF (see optimize_pdf())
+        self.pdf_max_image_dpi = paths.get("pdf_max_image_dpi", 150)             # Images above this resolution are downsampled by the optimization
+
+        # Uploads
+        self.upload_bandwidth_limit = paths.get("upload_bandwidth_limit", 0) # Bytes per second for all uploads together (0 = unlimited)
+        self.upload_provider_workers = {"onedrive": UPLOAD_MAX_WORKERS, "google_drive": 2, # Concurrent uploads per destination
+                                        **paths.get("upload_provider_workers", {})}
+
+        # Microsoft Graph
+        self.graph_api_url = paths.get("graph_api_url", "https://graph.microsoft.com/v1.0")
+        self.graph_api_hosts = {urlparse(self.graph_api_url).netloc, urlparse(TOKEN_URL).netloc}
+        self.graph_connect_timeout = paths.get("graph_connect_timeout", 10) # Seconds to establish a connection
+        self.graph_read_timeout = paths.get("graph_read_timeout", 120)      # Seconds to wait between bytes of a response
+
+        # Retries (shared by every Microsoft Graph and Google Drive call)
+        self.retry_max_attempts = paths.get("retry_max_attempts", 5)   # Attempts per call, including the first one
+        self.retry_base_delay = paths.get("retry_base_delay", 1.0)     # Seconds before the first retry, doubled for every further retry
+        self.retry_max_delay = paths.get("retry_max_delay", 60.0)      # Upper bound of the exponential backoff (Retry-After may exceed it)
+        self.retry_stage_budget = paths.get("retry_stage_budget", 600) # Seconds a stage may run before failed calls are no longer retried
+
+        # Batch Mode (--batch)
+        self.batch_documents = paths.get("batch_documents", [])                 # Names or glob patterns of the documents in ONEDRIVE_TARGET_FOLDER
+        self.batch_workers = paths.get("batch_workers", min(4, os.cpu_count() or 1)) # Processes converting documents in parallel
+
+        # Upload Destinations (see get_destinations())
+        self.destination_settings = paths.get("destinations", [{"type": "onedrive"}, {"type": "google_drive"}])
+
+        # Google Drive
+        self.google_drive_discovery_url = paths.get("google_drive_discovery_url") # Only set to use a different Drive API endpoint
+
+        # Local Paths
+        self.docx_path = os.path.join(self.training_folder, FILE_TO_DOWNLOAD_AND_EDIT)
+        self.pdf_path = os.path.join(self.training_folder, PDF_OUTPUT_FILENAME)
+        self.training_pdf_path = os.path.join(self.training_folder, ONEDRIVE_TRAINING_PDF_FILENAME)
+        self.optimized_pdf_path = os.path.splitext(self.pdf_path)[0] + ".optimized.pdf"
+
+        # Local State Paths
+        self.state_folder = os.path.join(self.training_folder, ".TrainingBackup")
+        self.manifest_path = os.path.join(self.state_folder, "manifest.json")
+        self.page_extraction_path = os.path.join(self.state_folder, "page_extraction.json")
+        self.reports_folder = os.path.join(self.state_folder, "reports")
+        self.spool_folder = os.path.join(self.state_folder, "spool")
+        self.batch_folder = os.path.join(self.training_folder, "Batch")
+        self.sync_folder = os.path.join(self.training_folder, "Mirror")
+        self.batch_manifest_path = os.path.join(self.state_folder, "batch_manifest.json")
+        self.sync_state_path = os.path.join(self.state_folder, "onedrive_delta.json")
+        self.drive_discovery_cache_path = os.path.join(self.state_folder, "drive_discovery.json")
+        self.daemon_key_path = os.path.join(self.state_folder, "daemon.key")
+        self.versions_folder = os.path.join(self.state_folder, "versions")
+        self.version_index_path = os.path.join(self.versions_folder, "index.json")
+
+        # Credentials Paths
+        self.google_token_path = os.path.join(self.credentials_folder, "google_token.json")
+        self.google_credentials_path = os.path.join(self.credentials_folder, "google_credentials.json")
+        self.google_drive_ids_path = os.path.join(self.credentials_folder, "google_drive_ids.json")
+
+        self.onedrive_token_path = os.path.join(self.credentials_folder, "onedrive_token.json")
+        self.one_drive_credentials_path = os.path.join(self.credentials_folder, "onedrive_credentials.json")
+        self.onedrive_upload_sessions_path = os.path.join(self.credentials_folder, "onedrive_upload_sessions.json")
+
+    def load_onedrive_client_credentials(self):
+        """
+        Reads the OneDrive app's client ID and secret from `one_drive_credentials_path`.
+
+        Parameters:
+        None
+
+        Returns:
+        tuple: (client_id, client_secret), or None if the file is missing or invalid
+               (the problem is printed).
+        """
+        try:
+            with open(self.one_drive_credentials_path, "r") as f:
+                onedrive_creds_json = json.load(f)
+        except FileNotFoundError:
+            print(RED + f"=> OneDrive credentials file '{self.one_drive_credentials_path}' not found!" + RESET)
+            return None
+        except json.JSONDecodeError:
+            print(RED + f"=> Error decoding OneDrive credentials file '{self.one_drive_credentials_path}'." + RESET)
+            return None
+
+        onedrive_client_id = onedrive_creds_json.get("client_id")
+        onedrive_client_secret = onedrive_creds_json.get("client_secret")
+        if not onedrive_client_id or not onedrive_client_secret:
+            print(RED + "=> 'client_id' or 'client_secret' missing in OneDrive credentials file." + RESET)
+            return None
+        return onedrive_client_id, onedrive_client_secret
+
+context = BackupContext()
+
+
+# --- Run Metrics ---
+
+class RunMetrics:
+    """
+    Collects timings and network statistics for a run of the script.
+
+    Every stage of the run is timed with `stage()`, and every network call is
+    recorded with `record_request()` together with its HTTP status, duration,
+    bytes transferred and the stage it belonged to. Retries are counted with
+    `record_retry()`. `write_report()` saves everything as a JSON run report.
+    Safe to use from the worker threads of the upload stage.
+    """
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.started_monotonic = time.monotonic()
+        self.stages = []
+        self.requests = []
+        self.retries = {}
+        self.artifacts = []
+        self.main_stage = None
+        self.main_stage_started = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def current_stage(self):
+        """Returns the stage of the calling thread, or the current stage of the main flow."""
+        return getattr(self._local, "stage", None) or self.main_stage
+
+    def current_stage_elapsed(self):
+        """Returns the seconds since the current stage (or, outside of any stage, the run) started."""
+        if getattr(self._local, "stage", None):
+            started = self._local.stage_started
+        else:
+            started = self.main_stage_started or self.started_monotonic
+        return time.monotonic() - started
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times a stage of the run.
+
+        Parameters:
+        name (str): The name of the stage, e.g. "download".
+        """
+        in_main_thread = threading.current_thread() is threading.main_thread()
+        previous_stage = self._local.__dict__.get("stage")
+        previous_stage_started = self._local.__dict__.get("stage_started")
+        started = time.monotonic()
+        self._local.stage = name
+        self._local.stage_started = started
+        if in_main_thread:
+            self.main_stage = name
+            self.main_stage_started = started
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.record_stage(name, started, status)
+            self._local.stage = previous_stage
+            self._local.stage_started = previous_stage_started
+            if in_main_thread:
+                self.main_stage = previous_stage
+                self.main_stage_started = previous_stage_started
+
+    def record_stage(self, name, started, status):
+        """
+        Records a stage that ended just now, e.g. one that was awaited on the event
+        loop instead of running in a thread.
+
+        Parameters:
+        name (str): The name of the stage.
+        started (float): The `time.monotonic()` the stage started at.
+        status (str): "ok" or "error".
+        """
+        with self._lock:
+            self.stages.append({
+                "name": name,
+                "started_at": round(started - self.started_monotonic, 4),
+                "duration": round(time.monotonic() - started, 4),
+                "status": status
+            })
+
+    def record_request(self, provider, operation, status, duration, bytes_sent=0, bytes_received=0):
+        """
+        Records a single network call.
+
+        Parameters:
+        provider (str): "onedrive", "google_drive", "microsoft-login" (the OneDrive token
+                        endpoint) or the name of another destination.
+        operation (str): A short description, e.g. "GET /me/drive/root:/Training/ThePRogram2026.docx".
+        status (int): The HTTP status, or None if no response was received.
+        duration (float): Wall time of the call in seconds.
+        bytes_sent (int): Request body size in bytes.
+        bytes_received (int): Response body size in bytes.
+        """
+        with self._lock:
+            self.requests.append({
+                "stage": self.current_stage(),
+                "provider": provider,
+                "operation": operation,
+                "status": status,
+                "duration": round(duration, 4),
+                "bytes_sent": bytes_sent,
+                "bytes_received": bytes_received
+            })
+
+    def record_retry(self, provider):
+        """
+        Counts a retried network call.
+
+        Parameters:
+        provider (str): "onedrive" or "google_drive".
+        """
+        with self._lock:
+            key = (self.current_stage(), provider)
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def record_artifact(self, name, original_bytes, optimized_bytes):
+        """
+        Records how much an artifact shrank before its upload, e.g. by `optimize_pdf()`.
+
+        Parameters:
+        name (str): The file name of the artifact.
+        original_bytes (int): The size before the optimization.
+        optimized_bytes (int): The size after the optimization.
+        """
+        with self._lock:
+            self.artifacts.append({
+                "name": name,
+                "original_bytes": original_bytes,
+                "optimized_bytes": optimized_bytes,
+                "saved_bytes": original_bytes - optimized_bytes
+            })
+
+    def build_report(self):
+        """
+        Builds the run report.
+
+        Returns:
+        dict: The report, with the stages, every request, per-stage totals and the optimized artifacts.
+        """
+        with self._lock:
+            totals = {}
+            for request in self.requests:
+                stage_totals = totals.setdefault(request["stage"] or "other", {"requests": 0, "bytes_sent": 0, "bytes_received": 0, "retries": 0})
+                stage_totals["requests"] += 1
+                stage_totals["bytes_sent"] += request["bytes_sent"]
+                stage_totals["bytes_received"] += request["bytes_received"]
+            for (stage_name, _), retry_count in self.retries.items():
+                stage_totals = totals.setdefault(stage_name or "other", {"requests": 0, "bytes_sent": 0, "bytes_received": 0, "retries": 0})
+                stage_totals["retries"] += retry_count
+            return {
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "hostname": hostname,
+                "duration": round(time.monotonic() - self.started_monotonic, 4),
+                "stages": sorted(self.stages, key=lambda stage: stage["started_at"]),
+                "stage_totals": totals,
+                "artifacts": list(self.artifacts),
+                "requests": list(self.requests)
+            }
+
+    def write_report(self, report_path):
+        """
+        Writes the run report as JSON.
+
+        Parameters:
+        report_path (str): The path of the report file.
+
+        Returns:
+        None.
+        """
+        try:
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, "w") as report_file:
+                json.dump(self.build_report(), report_file, indent=4)
+            print(f'=> Run report written to "{report_path}".')
+        except OSError as e:
+            print(RED + f'=> Error writing run report "{report_path}": {e}' + RESET)
+
+class CurrentRunMetrics:
+    """
+    The `RunMetrics` the calling code records into: the metrics bound to the current
+    context with `bind()` (e.g. by a daemon job, and inherited by its asyncio tasks
+    and `asyncio.to_thread()` workers), else `default`, the metrics of the run.
+    Every other attribute is looked up on these metrics.
+    """
+
+    def __init__(self):
+        self.default = RunMetrics()
+        self._bound = contextvars.ContextVar("run_metrics", default=None)
+
+    def current(self):
+        """Returns the metrics the calling code records into."""
+        return self._bound.get() or self.default
+
+    def bind(self, metrics):
+        """Makes the calling thread (and what it starts) record into `metrics`."""
+        self._bound.set(metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+run_metrics = CurrentRunMetrics()
+
+def run_in_stage(stage_name, function, *args):
+    """
+    Calls a function inside a timed `run_metrics` stage, e.g. from a worker thread.
+
+    Parameters:
+    stage_name (str): The name of the stage.
+    function (callable): The function to call.
+    *args: The arguments for the function.
 
     Returns:
-    tuple: A tuple containing (access_token, expires_at, refresh_token).
-           - access_token (str): The access token for Microsoft Graph API.
-           - expires_at (float): The Unix timestamp when the access token will expire.
-           - refresh_token (str): The refresh token to obtain new access tokens.
-           Returns (None, None, None) if the exchange fails.
+    The return value of the function.
     """
-    token_params = {
-        "client_id": onedrive_client_id,
-        "client_secret": onedrive_client_secret,
-        "code": code,
-        "redirect_uri": REDIRECT_URI,
-        "grant_type": "authorization_code"
-    }
-    try:
-        response = requests.post(TOKEN_URL, data=token_params)
-        response.raise_for_status()
-        token_data = response.json()
-        access_token = token_data.get("access_token")
-        expires_in = token_data.get("expires_in", 3600) # Default to 1 hour
-        expires_at = time.time() + expires_in
-        refresh_token = token_data.get("refresh_token")
-        if not all([access_token, refresh_token]):
-            print(RED + f"=> Failed to retrieve all necessary tokens from response: {token_data}" + RESET)
-            return None, None, None
-        return access_token, expires_at, refresh_token
-    except requests.exceptions.RequestException as e:
-        print(RED + f"=> Error exchanging code for tokens: {e}" + RESET)
-        if hasattr(e, 'response') and e.response is not None:
-            print(RED + f"Response content: {e.response.text}" + RESET)
-        return None, None, None
-    except json.JSONDecodeError:
-        print(RED + f"=> Error decoding JSON response from token endpoint." + RESET)
-        return None, None, None
+    with run_metrics.stage(stage_name):
+        return function(*args)
 
-def refresh_access_token(refresh_token):
+async def run_stage(stage_name, function, *args):
     """
-    Refreshes an expired OneDrive access token using a provided refresh token.
+    Runs a blocking function in a worker thread inside a timed `run_metrics` stage,
+    so the asyncio pipeline can overlap it with other stages.
 
-    This function is called when an existing access token is found to be expired
-    during OneDrive authentication.
+    Parameters:
+    stage_name (str): The name of the stage.
+    function (callable): The function to call.
+    *args: The arguments for the function.
+
+    Returns:
+    The return value of the function.
+    """
+    import asyncio
+    return await asyncio.to_thread(run_in_stage, stage_name, function, *args)
+
+def prune_reports(folder=None, keep=REPORTS_TO_KEEP):
+    """
+    Deletes all but the newest `keep` run reports and profiles in `folder`.
 
     Parameters:
-    refresh_token (str): The refresh token obtained during a previous authorization.
+    folder (str): The folder with the run reports, None for `context.reports_folder`.
+    keep (int): The number of reports (and profiles) to keep.
 
     Returns:
-    tuple: A tuple containing (access_token, expires_at, new_refresh_token).
-           - access_token (str): The new access token.
-           - expires_at (float): The Unix timestamp when the new access token expires.
-           - new_refresh_token (str): The new refresh token (often the same as input,
-                                      but sometimes a new one is issued).
-           Returns (None, None, None) if refreshing fails.
+    None.
     """
-    token_params = {
-        "client_id": onedrive_client_id,
-        "client_secret": onedrive_client_secret,
-        "refresh_token": refresh_token,
-        "grant_type": "refresh_token",
-        "scope": ONEDRIVE_SCOPES
-    }
-    try:
-        response = requests.post(TOKEN_URL, data=token_params)
-        response.raise_for_status()
-        token_data = response.json()
-        access_token = token_data.get("access_token")
-        expires_in = token_data.get("expires_in", 3600)
-        expires_at = time.time() + expires_in
-        new_refresh_token = token_data.get("refresh_token", refresh_token)
-        if not all([access_token, new_refresh_token]):
-            print(RED + f"=> Failed to retrieve all necessary tokens during refresh: {token_data}" + RESET)
-            return None, None, None
-        return access_token, expires_at, new_refresh_token
-    except requests.exceptions.RequestException as e:
-        print(RED + f"=> Error refreshing OneDrive token: {e}" + RESET)
-        if hasattr(e, 'response') and e.response is not None:
-            print(RED + f"Response content: {e.response.text}" + RESET)
-        return None, None, None
-    except json.JSONDecodeError:
-        print(RED + f"=> Error decoding JSON response during token refresh." + RESET)
-        return None, None, None
+    folder = folder or context.reports_folder
+    if not os.path.isdir(folder):
+        return
+    for extension in (".json", ".prof"):
+        reports = sorted(name for name in os.listdir(folder) if name.startswith("run-") and name.endswith(extension))
+        for name in reports[:-keep]:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                pass
 
-def authenticate_onedrive():
+
+# --- Retry Policy ---
+
+class RetryPolicy:
     """
-    Authenticates the user with OneDrive using OAuth 2.0.
+    The retry policy shared by every Microsoft Graph and Google Drive call.
+
+    Throttling responses (429, 503) are retried for every call, since the server
+    didn't process the request. Other transient failures (408, 500, 502, 504 and
+    network errors) are only retried for idempotent calls, because a POST may
+    already have been applied. Retries wait with exponential backoff and jitter,
+    or as long as the server's `Retry-After` header asks for, and stop once the
+    current stage has run for `stage_budget` seconds, so a throttled run slows
+    down instead of failing but can't hang forever. Every retry is counted in
+    `run_metrics`.
+
+    Parameters:
+    max_attempts (int): Attempts per call, including the first one.
+    base_delay (float): Seconds before the first retry, doubled for every further retry.
+    max_delay (float): Upper bound of the exponential backoff.
+    stage_budget (float): Seconds a stage may run before failed calls are no longer retried.
+    Each defaults to the configured `context.retry_*` value.
+    """
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    THROTTLING_STATUSES = {429, 503}
+    TRANSIENT_STATUSES = {408, 500, 502, 504}
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, stage_budget=None):
+        self.max_attempts = max_attempts or context.retry_max_attempts
+        self.base_delay = base_delay or context.retry_base_delay
+        self.max_delay = max_delay or context.retry_max_delay
+        self.stage_budget = stage_budget or context.retry_stage_budget
+
+    def is_retryable(self, status, idempotent):
+        """
+        Checks whether a failed call may be repeated.
+
+        Parameters:
+        status (int): The HTTP status, or None for a network error.
+        idempotent (bool): True if repeating the call can't apply it twice.
+
+        Returns:
+        bool: True if the call may be retried.
+        """
+        if status in self.THROTTLING_STATUSES:
+            return True
+        return idempotent and (status is None or status in self.TRANSIENT_STATUSES)
+
+    def get_delay(self, attempt, retry_after=None):
+        """
+        Returns the seconds to wait before the next attempt.
+
+        Parameters:
+        attempt (int): The number of attempts made so far (1 after the first failure).
+        retry_after (float): The delay the server asked for, or None.
+
+        Returns:
+        float: `retry_after` if given, else an exponential backoff with jitter
+               between half and the full backoff.
+        """
+        if retry_after is not None:
+            return retry_after
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return backoff / 2 + random.uniform(0, backoff / 2)
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Parses a `Retry-After` header.
+
+        Parameters:
+        value (str): The header value, in seconds or as an HTTP date, or None.
+
+        Returns:
+        float: The seconds to wait, or None if the header is missing or invalid.
+        """
+        from email.utils import parsedate_to_datetime
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def wait_before_retry(self, provider, operation, status, attempt, idempotent, retry_after=None):
+        """
+        Decides whether a failed call is retried and, if so, waits before the retry.
+
+        Parameters:
+        provider (str): "onedrive" or "google_drive".
+        operation (str): A short description of the call for the console.
+        status (int): The HTTP status, or None for a network error.
+        attempt (int): The number of attempts made so far.
+        idempotent (bool): True if repeating the call can't apply it twice.
+        retry_after (float): The delay the server asked for, or None.
+
+        Returns:
+        bool: True if the call should be retried now, False to give up.
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(status, idempotent):
+            return False
+        failure = f"HTTP {status}" if status else "network error"
+        delay = self.get_delay(attempt, retry_after)
+        if run_metrics.current_stage_elapsed() + delay > self.stage_budget:
+            print(RED + f'=> {operation} failed ({failure}) and the retry budget of stage "{run_metrics.current_stage()}" is used up. Giving up.' + RESET)
+            return False
+        print(f"=> {operation} failed ({failure}), retrying in {delay:.1f}s (attempt {attempt + 1} of {self.max_attempts})...")
+        run_metrics.record_retry(provider)
+        time.sleep(delay)
+        return True
+
+
+
+# --- Upload Scheduling ---
+
+_upload_priority = contextvars.ContextVar("upload_priority", default=UPLOAD_PRIORITY_DOCUMENT) # Set by run_upload() for its worker thread
+
+def get_upload_priority(remote_name):
+    """
+    Returns the priority of an upload, lower values go first: the training pages
+    (the file people open on their phones), then the other PDFs, then everything else.
+
+    Parameters:
+    remote_name (str): The name of the file at the destination.
+
+    Returns:
+    int: UPLOAD_PRIORITY_TRAINING_PDF, UPLOAD_PRIORITY_PDF or UPLOAD_PRIORITY_DOCUMENT.
+    """
+    if remote_name.endswith(ONEDRIVE_TRAINING_PDF_FILENAME):
+        return UPLOAD_PRIORITY_TRAINING_PDF
+    if remote_name.lower().endswith(".pdf"):
+        return UPLOAD_PRIORITY_PDF
+    return UPLOAD_PRIORITY_DOCUMENT
+
+def throttle_upload(byte_count, priority=None):
+    """
+    Waits until `byte_count` upload bytes may be sent under "upload_bandwidth_limit".
+    Returns at once if no limit is configured.
+
+    Parameters:
+    byte_count (int): The number of bytes about to be sent.
+    priority (int): The priority of the upload, None for the upload running in this thread.
+
+    Returns:
+    None.
+    """
+    if context.upload_limiter and byte_count > 0:
+        context.upload_limiter.consume(byte_count, _upload_priority.get() if priority is None else priority)
+
+class UploadBandwidthLimiter:
+    """
+    A token bucket shared by every upload thread that caps the bytes sent per second.
+
+    The bucket holds one second worth of bytes. Threads that wait for bytes are served
+    by priority (then in arrival order), so the next block of a high-priority upload
+    overtakes the blocks of the uploads already running. A grant may exceed the bytes
+    left in the bucket, the next one then waits until the debt is paid off.
+
+    Parameters:
+    rate (float): The bytes per second.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.waiters = [] # Heap of (priority, sequence)
+        self.sequence = itertools.count()
+
+    def consume(self, byte_count, priority=UPLOAD_PRIORITY_DOCUMENT):
+        """
+        Blocks until `byte_count` bytes may be sent.
+
+        Parameters:
+        byte_count (int): The number of bytes about to be sent.
+        priority (int): The priority of the upload, lower values are served first.
+
+        Returns:
+        None.
+        """
+        with self.condition:
+            waiter = (priority, next(self.sequence))
+            heapq.heappush(self.waiters, waiter)
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.waiters[0] != waiter:
+                    self.condition.wait() # Woken when the waiter in front of us got its bytes
+                elif self.tokens > 0:
+                    break
+                else:
+                    self.condition.wait(max(-self.tokens / self.rate, 0.001))
+            heapq.heappop(self.waiters)
+            self.tokens -= byte_count
+            self.condition.notify_all()
+
+class ThrottledUploadBody:
+    """
+    A request body that reads an upload (a file or bytes) in blocks of
+    UPLOAD_THROTTLE_BLOCK_SIZE, each one granted by an `UploadBandwidthLimiter`.
+    `requests` sends it with the Content-Length of the remaining bytes.
+
+    Parameters:
+    body (file or bytes): The upload, a file is read from its current position.
+    """
+
+    def __init__(self, body):
+        self.body = io.BytesIO(body) if isinstance(body, (bytes, bytearray)) else body
+        position = self.body.tell()
+        self.length = self.body.seek(0, os.SEEK_END) - position
+        self.body.seek(position)
+        self.priority = _upload_priority.get() # The body may be read in another thread, e.g. by boto3
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > UPLOAD_THROTTLE_BLOCK_SIZE:
+            size = UPLOAD_THROTTLE_BLOCK_SIZE
+        block = self.body.read(size)
+        throttle_upload(len(block), self.priority)
+        return block
+
+    def __iter__(self):
+        return iter(lambda: self.read(UPLOAD_THROTTLE_BLOCK_SIZE), b"")
+
+class UploadScheduler:
+    """
+    Decides when the uploads of a run start. At most `max_workers` uploads run at the
+    same time and at most `provider_workers[destination]` of them per destination.
+    Waiting uploads start in the order of their priority (see `get_upload_priority()`),
+    smaller files first, and an upload whose destination is at its limit doesn't hold
+    back the uploads to other destinations.
+
+    Parameters:
+    max_workers (int): The uploads running at the same time (UPLOAD_MAX_WORKERS).
+    provider_workers (dict): {destination: uploads running at the same time},
+                             default `context.upload_provider_workers`.
+    """
+
+    def __init__(self, max_workers=UPLOAD_MAX_WORKERS, provider_workers=None):
+        self.max_workers = max_workers
+        self.provider_workers = provider_workers if provider_workers is not None else context.upload_provider_workers
+        self.running = {} # {destination: count}
+        self.waiting = [] # Heap of (priority, size, sequence, destination, asyncio.Future)
+        self.sequence = itertools.count()
+
+    def dispatch(self):
+        """Starts waiting uploads while there are free slots."""
+        blocked = []
+        while self.waiting and sum(self.running.values()) < self.max_workers:
+            entry = heapq.heappop(self.waiting)
+            destination, started = entry[3], entry[4]
+            if started.cancelled():
+                continue
+            if self.running.get(destination, 0) >= self.provider_workers.get(destination, self.max_workers):
+                blocked.append(entry)
+                continue
+            self.running[destination] = self.running.get(destination, 0) + 1
+            started.set_result(None)
+        for entry in blocked:
+            heapq.heappush(self.waiting, entry)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, destination, priority, size):
+        """
+        Waits for a free slot for an upload and holds it while the upload runs.
+
+        Parameters:
+        destination (str): The name of the destination, e.g. "onedrive".
+        priority (int): The priority of the upload.
+        size (int): The size of the file in bytes.
+        """
+        import asyncio
+        started = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (priority, size, next(self.sequence), destination, started))
+        self.dispatch()
+        try:
+            await started
+            yield
+        finally:
+            if started.done() and not started.cancelled(): # Not if it was cancelled while waiting
+                self.running[destination] -= 1
+                self.dispatch()
+
+
+
+# --- Microsoft Graph HTTP Client ---
+
+class GraphClient:
+    """
+    A shared HTTP client for every Microsoft Graph and Microsoft identity platform call.
+
+    Wraps a single `requests.Session` so that connections to graph.microsoft.com and
+    login.microsoftonline.com are kept alive and reused from a connection pool
+    instead of paying a new TLS handshake on every request. Every request gets
+    the default headers, an optional bearer token and a (connect, read) timeout,
+    so a stalled socket can never hang the run indefinitely. Throttled and failed
+    requests are retried according to `context.retry_policy`.
+
+    Parameters:
+    connect_timeout (float): Seconds to wait while establishing a connection
+                             (default `context.graph_connect_timeout`).
+    read_timeout (float): Seconds to wait for the server between bytes of a response
+                          (default `context.graph_read_timeout`).
+    pool_size (int): Maximum number of pooled connections kept per host.
+    """
+
+    def __init__(self, connect_timeout=None, read_timeout=None, pool_size=UPLOAD_MAX_WORKERS):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.timeout = (connect_timeout or context.graph_connect_timeout, read_timeout or context.graph_read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": "application/json"})
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, access_token=None, headers=None, idempotent=None, provider="onedrive", **kwargs):
+        """
+        Sends a request through the pooled session, retrying it according to `context.retry_policy`.
+
+        Parameters:
+        method (str): The HTTP method ("GET", "PUT", "POST", "DELETE", ...).
+        url (str): The full request URL.
+        access_token (str): The OneDrive access token to send as a bearer token,
+                            or None for unauthenticated requests (e.g. the token endpoint).
+        headers (dict): Extra headers merged over the defaults.
+        idempotent (bool): Whether the request may be repeated after a transient error,
+                           None to decide by the HTTP method.
+        provider (str): The provider the request and its retries are recorded under in
+                        `run_metrics`, "microsoft-login" for the token endpoint.
+        **kwargs: Passed through to `requests.Session.request` (data, stream, ...).
+
+        Returns:
+        requests.Response: The response object. Error responses are returned once
+                           they can't be retried (any more).
+
+        Raises:
+        requests.exceptions.RequestException: If the last attempt failed with a network error.
+        """
+        import requests
+        request_headers = {}
+        if access_token:
+            request_headers["Authorization"] = "Bearer " + access_token
+        if headers:
+            request_headers.update(headers)
+        kwargs.setdefault("timeout", self.timeout)
+        if idempotent is None:
+            idempotent = method in RetryPolicy.IDEMPOTENT_METHODS
+        body = kwargs.get("data")
+        body_position = body.tell() if hasattr(body, "tell") else None # File bodies are rewound before a retry
+
+        parsed_url = urlparse(url)
+        if parsed_url.netloc in context.graph_api_hosts:
+            operation = f"{method} {parsed_url.path}"
+        else:
+            operation = f"{method} upload session" # Upload session URLs carry credentials, don't record them
+        throttled = context.upload_limiter is not None and (isinstance(body, (bytes, bytearray)) or hasattr(body, "read"))
+        attempt = 0
+        while True:
+            attempt += 1
+            if body_position is not None:
+                body.seek(body_position)
+            if throttled:
+                kwargs["data"] = ThrottledUploadBody(body) # Sent at the pace of "upload_bandwidth_limit"
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, headers=request_headers, **kwargs)
+            except requests.exceptions.RequestException:
+                run_metrics.record_request(provider, operation, None, time.monotonic() - started)
+                if context.retry_policy.wait_before_retry(provider, operation, None, attempt, idempotent):
+                    continue
+                raise
+            bytes_sent = int(response.request.headers.get("Content-Length") or 0)
+            if kwargs.get("stream"):
+                bytes_received = int(response.headers.get("Content-Length") or 0)
+            else:
+                bytes_received = len(response.content)
+            run_metrics.record_request(provider, operation, response.status_code, time.monotonic() - started, bytes_sent, bytes_received)
+            if response.status_code < 400:
+                return response
+            retry_after = RetryPolicy.parse_retry_after(response.headers.get("Retry-After"))
+            if not context.retry_policy.wait_before_retry(provider, operation, response.status_code, attempt, idempotent, retry_after):
+                return response
+            response.close()
+
+    def get(self, url, access_token=None, **kwargs):
+        return self.request("GET", url, access_token=access_token, **kwargs)
+
+    def put(self, url, access_token=None, **kwargs):
+        return self.request("PUT", url, access_token=access_token, **kwargs)
+
+    def post(self, url, access_token=None, **kwargs):
+        return self.request("POST", url, access_token=access_token, **kwargs)
+
+    def delete(self, url, access_token=None, **kwargs):
+        return self.request("DELETE", url, access_token=access_token, **kwargs)
+
+
+
+class GraphBatchResponse:
+    """
+    The response to a single call sent through `GraphBatcher`, with the parts of
+    `requests.Response` the callers use (`status_code`, `headers`, `json()`, `text`).
+
+    Parameters:
+    status_code (int): The HTTP status of the call.
+    headers (dict): The response headers of the call.
+    body: The decoded JSON body of the call, or None.
+    """
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = {name.lower(): value for name, value in (headers or {}).items()}
+        self.body = body
+
+    @property
+    def text(self):
+        return json.dumps(self.body) if self.body is not None else ""
+
+    def json(self):
+        if self.body is None:
+            raise json.JSONDecodeError("No JSON body in $batch response", "", 0)
+        return self.body
+
+class GraphBatcher:
+    """
+    Sends independent Microsoft Graph metadata calls (item lookups, hash checks,
+    deletes) through the JSON `$batch` endpoint, up to `limit` calls per request.
+
+    `request()` is a drop-in for `graph_client.request()`. While other calls are in
+    flight (e.g. the hash checks of parallel uploads), a call waits up to `linger`
+    seconds for more calls from parallel stages and sends them together, then hands
+    every caller its own response. A call made while no other call is in flight is
+    sent right away, and so is a call that finds no other call to batch with.
+    `request_all()` sends a known set of calls at once, e.g. the item lookups of
+    all batch documents. Calls that fail transiently inside a batch are retried
+    in the next batch according to `context.retry_policy`.
+
+    Parameters:
+    linger (float): Seconds the first call of a batch waits for more calls.
+    limit (int): Calls per `$batch` request (Microsoft Graph accepts up to 20).
+    """
+
+    def __init__(self, linger=GRAPH_BATCH_LINGER, limit=GRAPH_BATCH_LIMIT):
+        self.linger = linger
+        self.limit = limit
+        self._condition = threading.Condition()
+        self._pending = {} # {access_token: [call]}
+        self._in_flight = 0 # Calls sent and not answered yet
+
+    @staticmethod
+    def build_url(url, params=None):
+        """Returns the URL with the query parameters appended."""
+        if not params:
+            return url
+        return url + ("&" if "?" in url else "?") + urllib.parse.urlencode(params, safe="$,")
+
+    def request(self, method, url, access_token, headers=None, params=None):
+        """
+        Sends a Microsoft Graph call, batched with the calls other threads make at the same time.
+
+        Parameters:
+        method (str): The HTTP method ("GET", "DELETE", ...).
+        url (str): The full request URL, below `context.graph_api_url`.
+        access_token (str): The OneDrive access token.
+        headers (dict): Extra headers of the call.
+        params (dict): Query parameters of the call.
+
+        Returns:
+        requests.Response or GraphBatchResponse: The response to the call.
+
+        Raises:
+        requests.exceptions.RequestException: If the call (or its batch) failed with a network error.
+        """
+        if not url.startswith(context.graph_api_url + "/"):
+            return context.graph_client.request(method, url, access_token=access_token, headers=headers, params=params)
+        call = {"method": method, "url": self.build_url(url, params), "headers": headers, "done": threading.Event()}
+        with self._condition:
+            calls = self._pending.setdefault(access_token, [])
+            calls.append(call)
+            is_leader = len(calls) == 1
+            self._condition.notify_all()
+            if is_leader: # The first call collects the others, then sends them all
+                if self._in_flight: # Parallel stages are making calls, more are likely to follow
+                    self._condition.wait_for(lambda: len(calls) >= self.limit, timeout=self.linger)
+                del self._pending[access_token]
+                self._in_flight += len(calls)
+        if is_leader:
+            try:
+                if len(calls) == 1:
+                    call["response"] = context.graph_client.request(method, call["url"], access_token=access_token, headers=headers)
+                else:
+                    for batched_call, response in zip(calls, self.request_all(calls, access_token)):
+                        batched_call["response"] = response
+            except Exception as e:
+                for batched_call in calls:
+                    batched_call["error"] = e
+            finally:
+                with self._condition:
+                    self._in_flight -= len(calls)
+                for batched_call in calls:
+                    batched_call["done"].set()
+        call["done"].wait()
+        if call.get("error"):
+            raise call["error"]
+        return call["response"]
+
+    def request_all(self, calls, access_token):
+        """
+        Sends calls through `$batch`, `limit` calls per request, and retries the
+        calls that failed with a retryable status in the next batch.
+
+        Parameters:
+        calls (list): The calls, as dicts with "method", "url" (full URL, with the
+                      query) and optionally "headers".
+        access_token (str): The OneDrive access token.
+
+        Returns:
+        list: A response for every call, in the order of `calls`. A call whose batch
+              failed as a whole gets the response of the `$batch` request.
+
+        Raises:
+        requests.exceptions.RequestException: If a `$batch` request failed with a network error.
+        """
+        responses = [None] * len(calls)
+        idempotent = [call["method"] in RetryPolicy.IDEMPOTENT_METHODS for call in calls]
+        pending_indices = list(range(len(calls)))
+        attempt = 0
+        while pending_indices:
+            attempt += 1
+            retry_indices = []
+            retry_after = None
+            for chunk_start in range(0, len(pending_indices), self.limit):
+                chunk = pending_indices[chunk_start:chunk_start + self.limit]
+                batch_requests = []
+                for index in chunk:
+                    batch_request = {"id": str(index), "method": calls[index]["method"],
+                                     "url": calls[index]["url"][len(context.graph_api_url):]}
+                    if calls[index].get("headers"):
+                        batch_request["headers"] = calls[index]["headers"]
+                    batch_requests.append(batch_request)
+                batch_response = context.graph_client.post(context.graph_api_url + "/$batch", access_token=access_token,
+                                                           json={"requests": batch_requests},
+                                                           idempotent=all(idempotent[index] for index in chunk))
+                if batch_response.status_code != 200:
+                    for index in chunk:
+                        responses[index] = batch_response
+                    continue
+                for item in batch_response.json().get("responses", []):
+                    index = int(item["id"])
+                    responses[index] = GraphBatchResponse(item.get("status"), item.get("headers"), item.get("body"))
+                    if context.retry_policy.is_retryable(responses[index].status_code, idempotent[index]):
+                        retry_indices.append(index)
+                        item_retry_after = RetryPolicy.parse_retry_after(responses[index].headers.get("retry-after"))
+                        if item_retry_after is not None:
+                            retry_after = max(retry_after or 0.0, item_retry_after)
+            if not retry_indices or not context.retry_policy.wait_before_retry(
+                    "onedrive", f"{len(retry_indices)} call(s) in POST /$batch", responses[retry_indices[0]].status_code,
+                    attempt, all(idempotent[index] for index in retry_indices), retry_after):
+                break
+            pending_indices = retry_indices
+        return [response or GraphBatchResponse(502, {}, {"error": {"code": "missingBatchResponse"}}) for response in responses]
+
+
+# --- DOCX to PDF Converters ---
+
+class Docx2PdfConverter:
+    """
+    Converts documents through Microsoft Word automation.
+
+    Only available on Windows (and macOS) with Microsoft Word installed. On Windows
+    every conversion starts a private Word instance (`DispatchEx`, unlike `docx2pdf`,
+    which attaches to the Word the user has open and quits it), opens the document
+    read-only and quits only that instance. So the document being edited stays open,
+    and parallel conversions (e.g. of the batch workers) don't quit each other's Word.
+    On macOS `docx2pdf` drives the user's Word (and leaves it running), so the
+    conversions share it (`shares_user_application`).
+    """
+    shares_user_application = sys.platform != "win32"
+
+    def convert(self, docx_path, pdf_path):
+        if sys.platform != "win32":
+            from docx2pdf import convert
+            convert(docx_path, pdf_path, keep_active=True)
+            return
+        import pythoncom # COM has to be initialized in every thread that automates Word, e.g. pipeline worker threads
+        import win32com.client
+        pythoncom.CoInitialize()
+        try:
+            word = win32com.client.DispatchEx("Word.Application")
+            try:
+                word.Visible = False
+                word.DisplayAlerts = 0 # wdAlertsNone
+                document = word.Documents.Open(os.path.abspath(docx_path), ReadOnly=True, AddToRecentFiles=False, Visible=False)
+                try:
+                    document.SaveAs(os.path.abspath(pdf_path), FileFormat=WORD_FORMAT_PDF)
+                finally:
+                    document.Close(0) # wdDoNotSaveChanges
+            finally:
+                word.Quit()
+        finally:
+            pythoncom.CoUninitialize()
+
+    def warm_up(self):
+        # Word itself is started per conversion, only the import is done ahead of time
+        importlib.import_module("win32com.client" if sys.platform == "win32" else "docx2pdf")
+
+    def close(self):
+        pass
+
+class LibreOfficeConverter:
+    """
+    Converts documents with a headless LibreOffice.
+
+    If `unoserver` is installed, a single long-lived LibreOffice listener is started
+    on the first conversion and kept warm until the process exits, and every
+    conversion is handed to it with `unoconvert`, so only the first conversion pays
+    the start-up cost of the office suite. Without `unoserver` it falls back to
+    running `soffice --headless --convert-to pdf` for each conversion, using a
+    dedicated profile so it doesn't interfere with a LibreOffice the user has open.
+
+    Parameters:
+    soffice_path (str): The LibreOffice executable (default `context.soffice_path`).
+    unoserver_path (str): The `unoserver` executable (default `context.unoserver_path`).
+    port (int): The local port the `unoserver` listener accepts conversions on
+                (default `context.unoserver_port`).
+    """
+    shares_user_application = False
+
+    def __init__(self, soffice_path=None, unoserver_path=None, port=None):
+        self.soffice_path = soffice_path or context.soffice_path
+        self.unoserver_path = unoserver_path or context.unoserver_path
+        self.port = port or context.unoserver_port
+        self.listener = None
+        self.profile_folder = tempfile.mkdtemp(prefix="TrainingBackup-LibreOffice-")
+        self.isolated_listener = False # True to give the listener its own profile, so several listeners can run side by side
+
+    def get_profile_url(self):
+        """Returns the dedicated LibreOffice profile as a file URL."""
+        return "file:///" + self.profile_folder.replace(os.sep, "/").lstrip("/")
+
+    def start_listener(self):
+        """
+        Starts the `unoserver` listener if it's available and not already running.
+
+        Returns:
+        bool: True if a listener is accepting conversions, False otherwise.
+        """
+        if self.listener and self.listener.poll() is None:
+            return True
+        if not shutil.which(self.unoserver_path) or not shutil.which("unoconvert"):
+            return False
+        listener_command = [self.unoserver_path, "--interface", "127.0.0.1", "--port", str(self.port), "--executable", self.soffice_path]
+        if self.isolated_listener:
+            listener_command += ["--user-installation", self.get_profile_url()]
+        self.listener = subprocess.Popen(listener_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + CONVERTER_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.listener.poll() is not None:
+                break
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    print(GREEN + f"=> LibreOffice listener started on port {self.port}." + RESET)
+                    return True
+            except OSError:
+                time.sleep(0.5)
+        print(RED + "=> LibreOffice listener did not start. Falling back to one LibreOffice process per conversion." + RESET)
+        self.close()
+        return False
+
+    def convert(self, docx_path, pdf_path):
+        if self.start_listener():
+            subprocess.run(
+                ["unoconvert", "--host", "127.0.0.1", "--port", str(self.port), "--convert-to", "pdf", docx_path, pdf_path],
+                check=True, capture_output=True
+            )
+            return
+        os.makedirs(self.profile_folder, exist_ok=True)
+        output_folder = tempfile.mkdtemp(prefix="TrainingBackup-Output-")
+        try:
+            subprocess.run(
+                [self.soffice_path, "--headless", "--norestore",
+                 f"-env:UserInstallation={self.get_profile_url()}",
+                 "--convert-to", "pdf", "--outdir", output_folder, docx_path],
+                check=True, capture_output=True
+            )
+            converted_pdf = os.path.join(output_folder, os.path.splitext(os.path.basename(docx_path))[0] + ".pdf")
+            os.replace(converted_pdf, pdf_path)
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
+
+    def close(self):
+        if self.listener and self.listener.poll() is None:
+            self.listener.terminate()
+            try:
+                self.listener.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.listener.kill()
+        self.listener = None
+        shutil.rmtree(self.profile_folder, ignore_errors=True)
+
+    def warm_up(self):
+        self.start_listener()
+
+CONVERTERS = {
+    "docx2pdf": Docx2PdfConverter,
+    "libreoffice": LibreOfficeConverter
+}
+_converter = None
+
+def get_converter():
+    """
+    Returns the converter selected with the "converter" configuration key.
+
+    The converter is created on first use and reused for the rest of the process,
+    so a backend with a long-lived process (e.g. LibreOffice) stays warm between
+    conversions, for example in watch mode. It is closed when the process exits.
+
+    Parameters:
+    None
+
+    Returns:
+    object: A converter with `convert(context.docx_path, context.pdf_path)`, `warm_up()`
+            (prepares it ahead of the first conversion) and `close()` methods.
+    """
+    global _converter
+    if _converter is None:
+        converter_class = CONVERTERS.get(context.converter_backend)
+        if converter_class is None:
+            print(RED + f'=> Unknown converter "{context.converter_backend}" in configuration. Using "docx2pdf".' + RESET)
+            converter_class = Docx2PdfConverter
+        _converter = converter_class()
+        atexit.register(_converter.close)
+    return _converter
+
+
+# --- Upload Destinations ---
+
+class ArtifactReader(io.RawIOBase):
+    """
+    A read-only file object over the shared view of an `UploadArtifact`. Every upload
+    gets its own reader (its own position), none of them copies the artifact.
+
+    Parameters:
+    view (memoryview): The content of the artifact.
+    """
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        end = len(self.view) if size is None or size < 0 else min(len(self.view), self.position + size)
+        block = self.view[self.position:end].tobytes() if end > self.position else b""
+        self.position += len(block)
+        return block
+
+    def readinto(self, buffer):
+        block = self.read(len(buffer))
+        buffer[:len(block)] = block
+        return len(block)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self.position, os.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+class UploadArtifact:
+    """
+    A file that is uploaded to one or more destinations, read from disk once.
+
+    The file is memory-mapped read-only and every destination reads it through its own
+    `open()` reader over the same pages, so an extra destination costs no extra disk
+    reads. The hashes the destinations compare against are computed once, on first
+    use. Close the artifact (or use it as a context manager) once its uploads are
+    done: Windows doesn't delete or replace a mapped file.
+
+    Parameters:
+    path (str): The file.
+
+    Raises:
+    OSError: If the file can't be opened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.stat = os.fstat(self._file.fileno())
+        self.size = self.stat.st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None # Empty files can't be mapped
+        self.view = memoryview(self._map if self._map is not None else b"")
+        self._hashes = None
+        self._hashes_lock = threading.Lock()
+
+    @property
+    def hashes(self):
+        """The hashes of the content, see `compute_file_hashes()`."""
+        with self._hashes_lock:
+            if self._hashes is None:
+                self._hashes = compute_content_hashes(self.view[start:start + HASH_CHUNK_SIZE]
+                                                      for start in range(0, self.size, HASH_CHUNK_SIZE))
+            return self._hashes
+
+    def open(self):
+        """Returns a new reader positioned at the start of the artifact."""
+        return ArtifactReader(self.view)
+
+    def close(self):
+        self.view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass # A reader still holds a slice, the mapping is closed with it
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def get_content_type(remote_name):
+    """Returns the MIME type an upload is stored with, derived from its name."""
+    import mimetypes
+    return mimetypes.guess_type(remote_name)[0] or "application/octet-stream"
+
+class UploadDestination:
+    """
+    The base class of the backup destinations configured in "destinations".
+
+    A destination receives the artifacts listed in its "artifacts" setting ("docx",
+    "pdf" and/or "training_pdf", default `default_artifacts`). Subclasses implement
+    `get_label()`, `upload()` and `matches()`, and set `credentials_key` if they need
+    the OneDrive access token ("onedrive") or the Google Drive credentials
+    ("google_drive") from the `credentials` dict passed to them.
+
+    Parameters:
+    name (str): The name of the destination, used in the upload spool, the run report
+                and "upload_provider_workers".
+    settings (dict): The entry of the destination in "destinations".
+    """
+    default_artifacts = ("docx", "pdf", "training_pdf")
+    credentials_key = None
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.artifacts = tuple(settings.get("artifacts", self.default_artifacts))
+
+    def is_available(self, credentials):
+        """Returns True if the destination is authenticated (or doesn't need to be)."""
+        return self.credentials_key is None or bool(credentials.get(self.credentials_key))
+
+    def get_label(self, remote_name):
+        """Returns the label of `remote_name` at this destination, as shown in the upload summary."""
+        raise NotImplementedError
+
+    def upload(self, artifact, remote_name, credentials):
+        """
+        Uploads an artifact, unless the destination already has the same content.
+
+        Parameters:
+        artifact (UploadArtifact): The artifact.
+        remote_name (str): The name of the file at the destination.
+        credentials (dict): {"onedrive": access token, "google_drive": credentials object}.
+
+        Returns:
+        bool: True if the upload succeeded (or wasn't needed), False otherwise.
+        """
+        raise NotImplementedError
+
+    def matches(self, remote_name, hashes, credentials):
+        """Returns True if the file at the destination has the `hashes` of `compute_file_hashes()`."""
+        return False
+
+    def check(self):
+        """Returns (ok, description) for `--check`, or None if there is nothing to check."""
+        return None
+
+class OneDriveDestination(UploadDestination):
+    """Uploads to ONEDRIVE_TARGET_FOLDER in OneDrive, by default the .docx and the training pages."""
+    default_artifacts = ("docx", "training_pdf")
+    credentials_key = "onedrive"
+
+    def get_label(self, remote_name):
+        return f'OneDrive "{ONEDRIVE_TARGET_FOLDER}/{remote_name}"'
+
+    def upload(self, artifact, remote_name, credentials):
+        return upload_file_to_onedrive(credentials["onedrive"], remote_name, artifact.path, artifact)
+
+    def matches(self, remote_name, hashes, credentials):
+        remote_hash = get_onedrive_item_hash(credentials["onedrive"], ONEDRIVE_TARGET_FOLDER, remote_name)
+        return remote_hash is not None and remote_hash == hashes.get("quick_xor_hash")
+
+class GoogleDriveDestination(UploadDestination):
+    """Uploads to GOOGLE_DRIVE_UPLOAD_FOLDER in Google Drive, by default the PDF."""
+    default_artifacts = ("pdf",)
+    credentials_key = "google_drive"
+
+    def get_label(self, remote_name):
+        return f'Google Drive "{GOOGLE_DRIVE_UPLOAD_FOLDER}/{remote_name}"'
+
+    def upload(self, artifact, remote_name, credentials):
+        return upload_to_google_drive(credentials["google_drive"], artifact.path, remote_name, artifact)
+
+    def matches(self, remote_name, hashes, credentials):
+        remote_md5 = get_google_drive_file_md5(credentials["google_drive"], remote_name)
+        return remote_md5 is not None and remote_md5 == hashes.get("md5")
+
+class FolderDestination(UploadDestination):
+    """
+    Copies the artifacts into a local or network folder ("path", e.g. a NAS share).
+
+    A copy gets the modification time of its artifact, so an unchanged file is
+    recognized by its size and modification time without reading it again.
+    """
+
+    def __init__(self, name, settings):
+        super().__init__(name, settings)
+        self.path = settings["path"]
+
+    def get_label(self, remote_name):
+        return f'Folder "{os.path.join(self.path, remote_name)}"'
+
+    def upload(self, artifact, remote_name, credentials):
+        target_path = os.path.join(self.path, remote_name)
+        try:
+            target_stat = os.stat(target_path)
+            if target_stat.st_size == artifact.size and target_stat.st_mtime_ns == artifact.stat.st_mtime_ns:
+                print(GREEN + f'=> "{target_path}" is already up to date. Skipping copy.' + RESET)
+                return True
+        except OSError:
+            pass
+        try:
+            os.makedirs(self.path, exist_ok=True)
+        except OSError as e:
+            print(RED + f"=> Error creating folder '{self.path}': {e}" + RESET)
+            return False
+        if not write_file_atomically(target_path, artifact.view):
+            return False
+        try:
+            os.utime(target_path, ns=(artifact.stat.st_atime_ns, artifact.stat.st_mtime_ns))
+        except OSError:
+            pass # The next run copies it again
+        print(GREEN + f'=> Copied "{remote_name}" to "{self.path}" successfully!' + RESET)
+        return True
+
+    def matches(self, remote_name, hashes, credentials):
+        target_path = os.path.join(self.path, remote_name)
+        return os.path.exists(target_path) and compute_file_hashes(target_path)["md5"] == hashes.get("md5")
+
+    def check(self):
+        return os.path.isdir(self.path), f"Destination \"{self.name}\": folder '{self.path}'"
+
+class S3Destination(UploadDestination):
+    """
+    Uploads to a bucket of Amazon S3 or an S3-compatible storage (MinIO, Backblaze B2,
+    Cloudflare R2, ...) with `boto3`, under "prefix". "endpoint_url" and "region" select
+    the service, and "credentials_file" (in the credentials folder) holds
+    {"access_key_id": ..., "secret_access_key": ...}; without it `boto3` looks for
+    credentials itself (environment, ~/.aws). The MD5 of every upload is stored in
+    the object metadata, so unchanged files are skipped after a HEAD request.
+    """
+
+    def __init__(self, name, settings):
+        super().__init__(name, settings)
+        self.bucket = settings["bucket"]
+        self.prefix = settings.get("prefix", "")
+        self.endpoint_url = settings.get("endpoint_url")
+        self.region = settings.get("region")
+        self.credentials_file = settings.get("credentials_file")
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def get_label(self, remote_name):
+        return f'S3 "{self.bucket}/{self.prefix}{remote_name}"'
+
+    def get_client(self):
+        """Returns the S3 client, created on first use and shared by all uploads."""
+        import boto3
+        from botocore.config import Config
+        with self._client_lock:
+            if self._client is None:
+                keys = {}
+                if self.credentials_file:
+                    with open(os.path.join(context.credentials_folder, self.credentials_file), "r") as credentials_file:
+                        stored_keys = json.load(credentials_file)
+                    keys = {"aws_access_key_id": stored_keys["access_key_id"], "aws_secret_access_key": stored_keys["secret_access_key"]}
+                config = Config(retries={"max_attempts": context.retry_max_attempts, "mode": "standard"},
+                                connect_timeout=context.graph_connect_timeout, read_timeout=context.graph_read_timeout)
+                self._client = boto3.client("s3", endpoint_url=self.endpoint_url, region_name=self.region, config=config, **keys)
+            return self._client
+
+    def get_object_md5(self, remote_name):
+        """Returns the MD5 of an object (None if it doesn't exist), from its metadata or single-part ETag."""
+        from botocore.exceptions import ClientError
+        started = time.monotonic()
+        try:
+            response = self.get_client().head_object(Bucket=self.bucket, Key=self.prefix + remote_name)
+        except ClientError as e:
+            status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            run_metrics.record_request(self.name, "HEAD object", status, time.monotonic() - started)
+            if status == 404:
+                return None
+            raise
+        run_metrics.record_request(self.name, "HEAD object", 200, time.monotonic() - started)
+        etag = response.get("ETag", "").strip('"')
+        return response.get("Metadata", {}).get("md5") or (etag if "-" not in etag else None)
+
+    def upload(self, artifact, remote_name, credentials):
+        from botocore.exceptions import BotoCoreError, ClientError
+        label = self.get_label(remote_name)
+        try:
+            if self.get_object_md5(remote_name) == artifact.hashes["md5"]:
+                print(GREEN + f"=> {label} is already up to date. Skipping upload." + RESET)
+                return True
+            body = artifact.open()
+            if context.upload_limiter:
+                body = ThrottledUploadBody(body) # Sent at the pace of "upload_bandwidth_limit"
+            started = time.monotonic()
+            self.get_client().upload_fileobj(body, self.bucket, self.prefix + remote_name, ExtraArgs={
+                "ContentType": get_content_type(remote_name), "Metadata": {"md5": artifact.hashes["md5"]}})
+            run_metrics.record_request(self.name, "PUT object", 200, time.monotonic() - started, artifact.size)
+            print(GREEN + f"=> Uploaded {label} successfully!" + RESET)
+            return True
+        except (BotoCoreError, ClientError) as e:
+            print(RED + f"=> Error uploading {label}: {e}" + RESET)
+        except (OSError, KeyError, json.JSONDecodeError) as e:
+            print(RED + f"=> Error reading the S3 credentials '{self.credentials_file}' of destination \"{self.name}\": {e}" + RESET)
+        return False
+
+    def matches(self, remote_name, hashes, credentials):
+        try:
+            return self.get_object_md5(remote_name) == hashes.get("md5")
+        except Exception as e:
+            print(RED + f"=> Error checking {self.get_label(remote_name)}: {e}" + RESET)
+            return False
+
+    def check(self):
+        missing = importlib.util.find_spec("boto3") is None
+        return not missing, f'Destination "{self.name}": S3 bucket "{self.bucket}"' + (" (missing boto3, pip install boto3)" if missing else "")
+
+DESTINATIONS = {
+    "onedrive": OneDriveDestination,
+    "google_drive": GoogleDriveDestination,
+    "folder": FolderDestination,
+    "s3": S3Destination
+}
+_destinations = None
+
+def get_destinations():
+    """
+    Returns the destinations configured in "destinations" (default: OneDrive and Google Drive).
+
+    Every entry has a "type": one of DESTINATIONS, or "module.Class" for a subclass
+    of `UploadDestination` in an importable module (a destination plugin). Entries
+    that can't be used are reported and left out. The destinations are created on
+    first use and reused for the rest of the process.
+
+    Parameters:
+    None
+
+    Returns:
+    list: The `UploadDestination` objects, in the configured order.
+    """
+    global _destinations
+    if _destinations is None:
+        destinations = []
+        for settings in context.destination_settings:
+            destination_type = settings.get("type", "")
+            destination_class = DESTINATIONS.get(destination_type)
+            if destination_class is None and "." in destination_type:
+                module_name, _, class_name = destination_type.rpartition(".")
+                try:
+                    destination_class = getattr(importlib.import_module(module_name), class_name)
+                except (ImportError, AttributeError) as e:
+                    print(RED + f'=> Destination plugin "{destination_type}" can\'t be loaded: {e}' + RESET)
+                    continue
+            if destination_class is None:
+                print(RED + f'=> Unknown destination type "{destination_type}" in configuration, use one of {", ".join(DESTINATIONS)}. Skipping it.' + RESET)
+                continue
+            name = settings.get("name", destination_type)
+            if any(destination.name == name for destination in destinations):
+                print(RED + f'=> Destination name "{name}" is used twice in configuration. Skipping the second one.' + RESET)
+                continue
+            try:
+                destinations.append(destination_class(name, settings))
+            except KeyError as e:
+                print(RED + f'=> Destination "{name}" is missing the setting {e} in configuration. Skipping it.' + RESET)
+        _destinations = destinations
+    return _destinations
+
+def get_destination(name):
+    """Returns the configured destination called `name`, or None."""
+    return next((destination for destination in get_destinations() if destination.name == name), None)
+
+def needs_credentials(credentials_key):
+    """Returns True if a configured destination needs the "onedrive" or "google_drive" credentials."""
+    return any(destination.credentials_key == credentials_key for destination in get_destinations())
+
+
+
+# --- Durable Files ---
+
+@contextlib.contextmanager
+def file_lock(file_path, timeout=FILE_LOCK_TIMEOUT):
+    """
+    Holds an exclusive lock on a state file across processes, so parallel runs on
+    this host don't update (e.g. refresh and rewrite a token in) the same file at
+    the same time.
+
+    The lock is taken on a ".lock" file next to the file, with `msvcrt` on Windows
+    and `fcntl` elsewhere. If it can't be taken within `timeout` seconds, the
+    caller goes ahead without it (state files are written with
+    `write_file_atomically()`, so they can't end up half-written either way).
+
+    Parameters:
+    file_path (str): The path of the file.
+    timeout (float): Seconds to wait for another process to release the lock.
+    """
+    try:
+        lock_descriptor = os.open(file_path + ".lock", os.O_RDWR | os.O_CREAT)
+    except OSError as e:
+        print(RED + f"=> Could not open the lock file of '{file_path}': {e}. Continuing without it." + RESET)
+        yield
+        return
+    if sys.platform == "win32":
+        import msvcrt
+        lock = lambda: msvcrt.locking(lock_descriptor, msvcrt.LK_NBLCK, 1)
+        unlock = lambda: (os.lseek(lock_descriptor, 0, os.SEEK_SET), msvcrt.locking(lock_descriptor, msvcrt.LK_UNLCK, 1))
+    else:
+        import fcntl
+        lock = lambda: fcntl.flock(lock_descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        unlock = lambda: fcntl.flock(lock_descriptor, fcntl.LOCK_UN)
+    deadline = time.monotonic() + timeout
+    locked = False
+    try:
+        while not locked:
+            try:
+                lock()
+                locked = True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    print(RED + f"=> Timed out waiting for another run to release '{file_path}'. Continuing without the lock." + RESET)
+                    break
+                time.sleep(0.1)
+        yield
+    finally:
+        if locked:
+            unlock()
+        os.close(lock_descriptor)
+
+def write_file_atomically(file_path, content=None, source_path=None):
+    """
+    Writes a file atomically: through a temporary file in the same folder, flushed
+    to disk and moved into place with `os.replace`, so a reader never sees a
+    half-written file, a crash leaves the previous version intact, and parallel
+    writers don't share a temporary file.
+
+    Parameters:
+    file_path (str): The path of the file.
+    content (str or bytes): The text or data to write, or None to copy `source_path` instead.
+    source_path (str): The file to copy, if `content` is None.
+
+    Returns:
+    bool: True if the file was written, False otherwise.
+    """
+    temporary_path = None
+    try:
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".",
+                                                           prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+        with os.fdopen(file_descriptor, "w" if isinstance(content, str) else "wb") as target_file:
+            if content is not None:
+                target_file.write(content)
+            else:
+                with open(source_path, "rb") as source_file:
+                    shutil.copyfileobj(source_file, target_file, HASH_CHUNK_SIZE)
+            target_file.flush()
+            os.fsync(target_file.fileno())
+        os.replace(temporary_path, file_path)
+        return True
+    except OSError as e:
+        print(RED + f"=> Error saving '{file_path}': {e}" + RESET)
+        if temporary_path and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return False
+
+
+# --- Version History ---
+
+def split_version_chunks(content):
+    """
+    Splits file content into content-defined chunks for the version store.
+
+    Chunks end before a zip member or directory header (the parts of a .docx) or after a PDF
+    object, so an edit only changes the chunks around it, while the chunks after
+    it keep their content even if their offset moved. Anchors closer than
+    VERSION_CHUNK_MIN_SIZE are skipped, and stretches without an anchor are cut
+    every VERSION_CHUNK_MAX_SIZE bytes.
+
+    Parameters:
+    content (bytes): The file content.
+
+    Returns:
+    list: The chunks (bytes), which add up to `content`.
+    """
+    chunks = []
+    start = 0
+    anchors = [match.end() if match.group() == b"endobj" else match.start() for match in VERSION_CHUNK_ANCHOR.finditer(content)]
+    for boundary in anchors + [len(content)]:
+        while boundary - start > VERSION_CHUNK_MAX_SIZE:
+            chunks.append(content[start:start + VERSION_CHUNK_MAX_SIZE])
+            start += VERSION_CHUNK_MAX_SIZE
+        if boundary - start >= VERSION_CHUNK_MIN_SIZE or (boundary == len(content) and boundary > start):
+            chunks.append(content[start:boundary])
+            start = boundary
+    return chunks
+
+def get_version_object_path(chunk_hash):
+    """Returns the path of a stored chunk in the version store."""
+    return os.path.join(context.versions_folder, "objects", chunk_hash[:2], chunk_hash)
+
+def load_version_index():
+    """
+    Loads the list of recorded revisions.
+
+    Parameters:
+    None
+
+    Returns:
+    list: The revisions, oldest first, as dicts with "id", "file", "recorded_at",
+          "size", "sha256", "chunks" (the SHA-256 of every chunk) and "stored_bytes"
+          (the compressed size of the chunks the revision added). Empty if nothing
+          was recorded yet or the index can't be read.
+    """
+    try:
+        with open(context.version_index_path, "r") as index_file:
+            return json.load(index_file).get("revisions", [])
+    except FileNotFoundError:
+        return []
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Error reading the version history index: {e}" + RESET)
+        return []
+
+def record_revision(file_path):
+    """
+    Records the current content of a file as a new revision in the local version
+    store, unless it is identical to the file's latest revision.
+
+    The content is split into chunks (see `split_version_chunks()`) and every chunk
+    is stored once, zlib compressed and named by its SHA-256, so the store only
+    grows by the chunks a revision changed.
+
+    Parameters:
+    file_path (str): The path of the file, e.g. `context.docx_path`.
+
+    Returns:
+    dict: The recorded (or identical latest) revision, or None if the file couldn't be recorded.
+    """
+    file_name = os.path.basename(file_path)
+    try:
+        with open(file_path, "rb") as source_file:
+            content = source_file.read()
+    except OSError as e:
+        print(RED + f'=> Error reading "{file_name}" for the version history: {e}' + RESET)
+        return None
+    content_hash = hashlib.sha256(content).hexdigest()
+    os.makedirs(context.versions_folder, exist_ok=True)
+    with file_lock(context.version_index_path):
+        revisions = load_version_index()
+        latest = next((revision for revision in reversed(revisions) if revision["file"] == file_name), None)
+        if latest and latest["sha256"] == content_hash:
+            return latest
+        chunk_hashes = []
+        stored_bytes = 0
+        for chunk in split_version_chunks(content):
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            chunk_hashes.append(chunk_hash)
+            object_path = get_version_object_path(chunk_hash)
+            if os.path.exists(object_path):
+                continue
+            compressed_chunk = zlib.compress(chunk, VERSION_COMPRESSION_LEVEL)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            if not write_file_atomically(object_path, compressed_chunk):
+                return None
+            stored_bytes += len(compressed_chunk)
+        revision = {
+            "id": revisions[-1]["id"] + 1 if revisions else 1,
+            "file": file_name,
+            "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "size": len(content),
+            "sha256": content_hash,
+            "chunks": chunk_hashes,
+            "stored_bytes": stored_bytes
+        }
+        revisions.append(revision)
+        if not write_file_atomically(context.version_index_path, json.dumps({"revisions": revisions}, indent=4)):
+            return None
+    print(GREEN + f'=> Recorded revision {revision["id"]} of "{file_name}" in the version history ({format_byte_count(stored_bytes)} stored).' + RESET)
+    return revision
+
+def format_byte_count(byte_count):
+    """Returns a byte count as a short human-readable string, e.g. "1.5 MB"."""
+    for unit in ("B", "KB", "MB"):
+        if abs(byte_count) < 1024 or unit == "MB":
+            return f"{byte_count:.0f} {unit}" if unit == "B" else f"{byte_count:.1f} {unit}"
+        byte_count /= 1024
+
+def get_revision(revision_id):
+    """
+    Returns a recorded revision by its id.
+
+    Parameters:
+    revision_id (int): The revision id shown by `--versions`.
+
+    Returns:
+    dict: The revision, or None (with an error printed) if there's no such revision.
+    """
+    revision = next((revision for revision in load_version_index() if revision["id"] == revision_id), None)
+    if revision is None:
+        print(RED + f"=> There's no revision {revision_id} in the version history. See --versions." + RESET)
+    return revision
+
+def list_revisions():
+    """
+    Prints every recorded revision (`--versions`).
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True (an empty history isn't an error).
+    """
+    revisions = load_version_index()
+    if not revisions:
+        print(GREEN + "=> The version history is empty. Revisions are recorded by every backup run." + RESET)
+        return True
+    print(f"{'id':>5}  {'recorded (UTC)':<25}  {'file':<30}  {'size':>10}  {'stored':>10}")
+    for revision in revisions:
+        print(f"{revision['id']:>5}  {revision['recorded_at']:<25}  {revision['file']:<30}  "
+              f"{format_byte_count(revision['size']):>10}  {format_byte_count(revision['stored_bytes']):>10}")
+    stored_total = sum(revision["stored_bytes"] for revision in revisions)
+    full_total = sum(revision["size"] for revision in revisions)
+    print(f"=> {len(revisions)} revision(s), {format_byte_count(full_total)} of content in {format_byte_count(stored_total)} of storage.")
+    return True
+
+def diff_revisions(old_revision_id, new_revision_id):
+    """
+    Prints how two revisions differ in their metadata and chunks (`--diff`).
+
+    Parameters:
+    old_revision_id (int): The id of the first revision.
+    new_revision_id (int): The id of the second revision.
+
+    Returns:
+    bool: True if both revisions exist, False otherwise.
+    """
+    old_revision, new_revision = get_revision(old_revision_id), get_revision(new_revision_id)
+    if not old_revision or not new_revision:
+        return False
+    for label, revision in (("-", old_revision), ("+", new_revision)):
+        print(f"{label} revision {revision['id']}: \"{revision['file']}\", recorded {revision['recorded_at']}, "
+              f"{format_byte_count(revision['size'])}, SHA-256 {revision['sha256'][:16]}")
+    if old_revision["sha256"] == new_revision["sha256"]:
+        print(GREEN + "=> The revisions have identical content." + RESET)
+        return True
+    old_chunks, new_chunks = set(old_revision["chunks"]), set(new_revision["chunks"])
+    shared_chunks = old_chunks & new_chunks
+    print(f"=> Size changed by {new_revision['size'] - old_revision['size']:+d} bytes. "
+          f"{len(shared_chunks)} chunk(s) shared, {len(old_chunks - new_chunks)} removed, {len(new_chunks - old_chunks)} added.")
+    return True
+
+def restore_revision(revision_id, target_path=None):
+    """
+    Restores a revision from the local version store (`--restore`), without any download.
+
+    Parameters:
+    revision_id (int): The id of the revision.
+    target_path (str): Where to write the file, None for "<name> (revision <id>)<ext>"
+                       in `context.training_folder` (so the working copy isn't overwritten).
+
+    Returns:
+    bool: True if the revision was restored and its content verified, False otherwise.
+    """
+    revision = get_revision(revision_id)
+    if not revision:
+        return False
+    if target_path is None:
+        name, extension = os.path.splitext(revision["file"])
+        target_path = os.path.join(context.training_folder, f"{name} (revision {revision_id}){extension}")
+    try:
+        chunks = []
+        for chunk_hash in revision["chunks"]:
+            with open(get_version_object_path(chunk_hash), "rb") as object_file:
+                chunks.append(zlib.decompress(object_file.read()))
+    except (OSError, zlib.error) as e:
+        print(RED + f"=> Error reading revision {revision_id} from the version history: {e}" + RESET)
+        return False
+    content = b"".join(chunks)
+    if hashlib.sha256(content).hexdigest() != revision["sha256"]:
+        print(RED + f"=> Revision {revision_id} is damaged in the version history (checksum mismatch). Nothing restored." + RESET)
+        return False
+    if not write_file_atomically(target_path, content):
+        return False
+    print(GREEN + f'=> Restored revision {revision_id} of "{revision["file"]}" ({revision["recorded_at"]}) to "{target_path}".' + RESET)
+    return True
+
+
+# --- Token Cache ---
+
+def get_google_token_expires_at(google_creds):
+    """
+    Returns the expiry of Google Drive credentials as a Unix timestamp.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The credentials.
+
+    Returns:
+    float: The expiry, infinity if the token doesn't expire, or None without a token.
+    """
+    if not google_creds.token:
+        return None
+    if google_creds.expiry is None:
+        return float("inf")
+    return google_creds.expiry.replace(tzinfo=timezone.utc).timestamp() # google-auth keeps expiry as naive UTC
+
+class TokenManager:
+    """
+    Caches the OneDrive and Google Drive tokens for the lifetime of the process and
+    refreshes them before they expire.
+
+    `get_onedrive_token()` and `get_google_creds()` return the cached token as long
+    as it stays valid for more than `refresh_margin` seconds, so every stage (and
+    every save in watch mode) gets a token without a network call. Otherwise they
+    re-read the token file, which a parallel run may have refreshed, refresh the
+    token with its refresh token, and only then fall back to a browser sign-in.
+    Refreshes hold `file_lock()` and save the token with `write_file_atomically()`.
+
+    `start()` starts a background thread that loads the stored tokens right away
+    and from then on refreshes each one `refresh_margin` seconds before it expires,
+    so neither refresh round trip sits on the critical path. The background thread
+    never starts a browser sign-in. The Google Drive credentials are refreshed in
+    place, so every holder of the object sees the new token.
+
+    Parameters:
+    refresh_margin (float): Seconds before expiry at which a token is refreshed.
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._onedrive_token = None # {"access_token", "expires_at", "refresh_token"}
+        self._google_creds = None
+        self._onedrive_lock = threading.Lock()
+        self._google_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher = None
+        self._users = 0 # Callers that started the refresher and haven't stopped it yet
+        self._users_lock = threading.Lock()
+
+    def is_fresh(self, expires_at):
+        """Returns True if a token with this expiry doesn't need a refresh yet."""
+        return expires_at is not None and expires_at - time.time() > self.refresh_margin
+
+    def get_onedrive_token(self, interactive=True):
+        """
+        Returns a valid OneDrive access token.
+
+        Parameters:
+        interactive (bool): True to fall back to the browser sign-in if the token
+                            can't be loaded or refreshed.
+
+        Returns:
+        str: The access token, or None if authentication failed.
+        """
+        with self._onedrive_lock:
+            token_data = self._onedrive_token
+            if token_data and self.is_fresh(token_data["expires_at"]):
+                return token_data["access_token"]
+            token_data = self._load_onedrive_token(announce=interactive)
+            if token_data is None and interactive:
+                token_data = authorize_onedrive()
+                if token_data:
+                    with file_lock(context.onedrive_token_path):
+                        write_file_atomically(context.onedrive_token_path, json.dumps(token_data))
+            if token_data:
+                self._onedrive_token = token_data
+                return token_data["access_token"]
+            return None
+
+    def _load_onedrive_token(self, announce):
+        """Loads the OneDrive token from its file, refreshing it if needed. Returns the token data or None."""
+        with file_lock(context.onedrive_token_path):
+            token_data = read_onedrive_token_file()
+            if not token_data:
+                return None
+            if token_data.get("access_token") and self.is_fresh(token_data.get("expires_at")):
+                return token_data
+            if not token_data.get("refresh_token"):
+                return None
+            if announce:
+                print("OneDrive token expired or about to expire, attempting to refresh...")
+            access_token, expires_at, refresh_token = refresh_access_token(token_data["refresh_token"])
+            if not access_token:
+                print(RED + "=> Failed to refresh OneDrive token." + RESET)
+                return None
+            token_data = {"access_token": access_token, "expires_at": expires_at, "refresh_token": refresh_token}
+            write_file_atomically(context.onedrive_token_path, json.dumps(token_data))
+            if announce:
+                print(GREEN + "=> OneDrive token refreshed successfully!" + RESET)
+            return token_data
+
+    def get_google_creds(self, interactive=True):
+        """
+        Returns valid Google Drive credentials.
+
+        Parameters:
+        interactive (bool): True to fall back to the browser sign-in if the token
+                            can't be loaded or refreshed.
+
+        Returns:
+        google.oauth2.credentials.Credentials: The credentials, or None if
+                                               authentication failed.
+        """
+        with self._google_lock:
+            google_creds = self._google_creds
+            if google_creds and self.is_fresh(get_google_token_expires_at(google_creds)):
+                return google_creds
+            google_creds = self._load_google_creds(announce=interactive)
+            if google_creds is None and interactive:
+                google_creds = authorize_google_drive()
+                if google_creds:
+                    with file_lock(context.google_token_path):
+                        write_file_atomically(context.google_token_path, google_creds.to_json())
+            if google_creds:
+                self._google_creds = google_creds
+            return google_creds
+
+    def _load_google_creds(self, announce):
+        """Loads the Google Drive token from its file, refreshing it if needed. Returns the credentials or None."""
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        with file_lock(context.google_token_path):
+            stored_creds = None
+            if os.path.exists(context.google_token_path):
+                try:
+                    stored_creds = Credentials.from_authorized_user_file(context.google_token_path, GOOGLE_DRIVE_SCOPES)
+                except Exception as e:
+                    print(RED + f"=> Error loading Google credentials from token file '{context.google_token_path}': {e}" + RESET)
+            google_creds = self._google_creds
+            if stored_creds and self.is_fresh(get_google_token_expires_at(stored_creds)):
+                if google_creds is None:
+                    return stored_creds
+                google_creds.token, google_creds.expiry = stored_creds.token, stored_creds.expiry # Refreshed by a parallel run
+                return google_creds
+            google_creds = google_creds or stored_creds
+            if not google_creds or not google_creds.refresh_token:
+                return None
+            if announce:
+                print("Google Drive token expired or about to expire, attempting to refresh...")
+            try:
+                google_creds.refresh(Request())
+            except Exception as e:
+                print(RED + f"=> Error refreshing Google Drive token: {e}" + RESET)
+                return None
+            write_file_atomically(context.google_token_path, google_creds.to_json())
+            if announce:
+                print(GREEN + "=> Google Drive token refreshed successfully!" + RESET)
+            return google_creds
+
+    def start(self):
+        """Starts the background refresh thread, if it isn't running yet."""
+        with self._users_lock:
+            self._users += 1
+            if self._refresher is None:
+                self._stop_event.clear()
+                self._refresher = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+                self._refresher.start()
+
+    def stop(self):
+        """Stops the background refresh thread once every caller of `start()` stopped it (e.g. the daemon and its jobs)."""
+        with self._users_lock:
+            self._users = max(self._users - 1, 0)
+            if self._users or self._refresher is None:
+                return
+            self._stop_event.set()
+            refresher, self._refresher = self._refresher, None
+        refresher.join(timeout=5)
+
+    def _refresh_loop(self):
+        while not self._stop_event.is_set():
+            next_refresh_at = time.time() + TOKEN_REFRESH_RETRY_INTERVAL
+            for refresh in (self._refresh_onedrive_in_background, self._refresh_google_in_background):
+                try:
+                    next_refresh_at = min(next_refresh_at, refresh())
+                except Exception as e: # Keep refreshing the other token, and try this one again later
+                    print(RED + f"=> Background token refresh failed: {e}" + RESET)
+            self._stop_event.wait(max(next_refresh_at - time.time(), 1.0))
+
+    def _refresh_onedrive_in_background(self):
+        """Loads or refreshes the OneDrive token if it is due. Returns when it is due next."""
+        if not self._onedrive_lock.acquire(blocking=False):
+            return time.time() + 1.0 # The foreground is loading it (or signing in) right now
+        try:
+            token_data = self._onedrive_token
+            if not (token_data and self.is_fresh(token_data["expires_at"])):
+                with run_metrics.stage("token refresh"):
+                    token_data = self._load_onedrive_token(announce=False) or token_data
+                self._onedrive_token = token_data
+            if token_data and self.is_fresh(token_data["expires_at"]):
+                return token_data["expires_at"] - self.refresh_margin
+            return time.time() + TOKEN_REFRESH_RETRY_INTERVAL
+        finally:
+            self._onedrive_lock.release()
+
+    def _refresh_google_in_background(self):
+        """Loads or refreshes the Google Drive token if it is due. Returns when it is due next."""
+        if not self._google_lock.acquire(blocking=False):
+            return time.time() + 1.0 # The foreground is loading it (or signing in) right now
+        try:
+            google_creds = self._google_creds
+            if not (google_creds and self.is_fresh(get_google_token_expires_at(google_creds))):
+                with run_metrics.stage("token refresh"):
+                    google_creds = self._load_google_creds(announce=False) or google_creds
+                self._google_creds = google_creds
+            if google_creds and self.is_fresh(get_google_token_expires_at(google_creds)):
+                return get_google_token_expires_at(google_creds) - self.refresh_margin
+            return time.time() + TOKEN_REFRESH_RETRY_INTERVAL
+        finally:
+            self._google_lock.release()
+
+
+# --- Function Definitions ---
+
+def exchange_code_for_tokens(code):
+    """
+    Exchanges an OAuth 2.0 authorization code for an access token, refresh token,
+    and expiration time from Microsoft's token endpoint.
+
+    This function is part of the OneDrive authentication flow when a new authorization
+    is required.
+
+    Parameters:
+    code (str): The authorization code obtained from the user after they
+                authorize the application via the authorization URL.
+
+    Returns:
+    tuple: A tuple containing (access_token, expires_at, refresh_token).
+           - access_token (str): The access token for Microsoft Graph API.
+           - expires_at (float): The Unix timestamp when the access token will expire.
+           - refresh_token (str): The refresh token to obtain new access tokens.
+           Returns (None, None, None) if the exchange fails.
+    """
+    import requests
+    token_params = {
+        "client_id": context.onedrive_client_id,
+        "client_secret": context.onedrive_client_secret,
+        "code": code,
+        "redirect_uri": REDIRECT_URI,
+        "grant_type": "authorization_code"
+    }
+    try:
+        response = context.graph_client.post(TOKEN_URL, data=token_params, provider="microsoft-login")
+        response.raise_for_status()
+        token_data = response.json()
+        access_token = token_data.get("access_token")
+        expires_in = token_data.get("expires_in", 3600) # Default to 1 hour
+        expires_at = time.time() + expires_in
+        refresh_token = token_data.get("refresh_token")
+        if not all([access_token, refresh_token]):
+            print(RED + f"=> Failed to retrieve all necessary tokens from response: {token_data}" + RESET)
+            return None, None, None
+        return access_token, expires_at, refresh_token
+    except requests.exceptions.RequestException as e:
+        print(RED + f"=> Error exchanging code for tokens: {e}" + RESET)
+        if hasattr(e, 'response') and e.response is not None:
+            print(RED + f"Response content: {e.response.text}" + RESET)
+        return None, None, None
+    except json.JSONDecodeError:
+        print(RED + f"=> Error decoding JSON response from token endpoint." + RESET)
+        return None, None, None
+
+def refresh_access_token(refresh_token):
+    """
+    Refreshes an expired OneDrive access token using a provided refresh token.
+
+    This function is called when an existing access token is found to be expired
+    during OneDrive authentication.
+
+    Parameters:
+    refresh_token (str): The refresh token obtained during a previous authorization.
+
+    Returns:
+    tuple: A tuple containing (access_token, expires_at, new_refresh_token).
+           - access_token (str): The new access token.
+           - expires_at (float): The Unix timestamp when the new access token expires.
+           - new_refresh_token (str): The new refresh token (often the same as input,
+                                      but sometimes a new one is issued).
+           Returns (None, None, None) if refreshing fails.
+    """
+    import requests
+    token_params = {
+        "client_id": context.onedrive_client_id,
+        "client_secret": context.onedrive_client_secret,
+        "refresh_token": refresh_token,
+        "grant_type": "refresh_token",
+        "scope": ONEDRIVE_SCOPES
+    }
+    try:
+        response = context.graph_client.post(TOKEN_URL, data=token_params, provider="microsoft-login")
+        response.raise_for_status()
+        token_data = response.json()
+        access_token = token_data.get("access_token")
+        expires_in = token_data.get("expires_in", 3600)
+        expires_at = time.time() + expires_in
+        new_refresh_token = token_data.get("refresh_token", refresh_token)
+        if not all([access_token, new_refresh_token]):
+            print(RED + f"=> Failed to retrieve all necessary tokens during refresh: {token_data}" + RESET)
+            return None, None, None
+        return access_token, expires_at, new_refresh_token
+    except requests.exceptions.RequestException as e:
+        print(RED + f"=> Error refreshing OneDrive token: {e}" + RESET)
+        if hasattr(e, 'response') and e.response is not None:
+            print(RED + f"Response content: {e.response.text}" + RESET)
+        return None, None, None
+    except json.JSONDecodeError:
+        print(RED + f"=> Error decoding JSON response during token refresh." + RESET)
+        return None, None, None
+
+def read_onedrive_token_file():
+    """
+    Reads the stored OneDrive token from `context.onedrive_token_path`.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: The token data with "access_token", "expires_at" and "refresh_token", or
+          None if the file doesn't exist or can't be read.
+    """
+    if not os.path.exists(context.onedrive_token_path):
+        return None
+    try:
+        with open(context.onedrive_token_path, "r") as token_file:
+            token_data = json.load(token_file)
+        if not isinstance(token_data, dict):
+            raise ValueError("not a JSON object")
+        return token_data
+    except (OSError, json.JSONDecodeError, ValueError) as e:
+        print(RED + f"=> Error reading or parsing OneDrive token file ({context.onedrive_token_path}): {e}." + RESET)
+        return None
+
+def authorize_onedrive():
+    """
+    Runs the OneDrive OAuth 2.0 authorization code grant flow, prompting the user
+    to authorize the application in their browser.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: The token data with "access_token", "expires_at" and "refresh_token",
+          or None if the authorization failed.
+    """
+    print("No valid OneDrive token found or refresh failed. Proceeding to full authentication!")
+    auth_params = {
+        "client_id": context.onedrive_client_id,
+        "redirect_uri": REDIRECT_URI,
+        "scope": ONEDRIVE_SCOPES,
+        "response_type": "code"
+    }
+
+    full_auth_url = AUTH_URL + "?" + urllib.parse.urlencode(auth_params)
+    print("\nClick on this link to authenticate with OneDrive:\n")
+    print(DARK_CYAN + full_auth_url + RESET)
+    url_input = input("\nCopy the redirected URL from your browser and paste it here:\n\n")
+
+    try:
+        code = parse_qs(urlparse(url_input).query).get('code', [''])[0]
+        if not code:
+            print(RED + "=> Could not extract authorization code from the redirected URL." + RESET)
+            return None
+    except Exception as e:
+        print(RED + f"=> Error parsing the redirected URL: {e}" + RESET)
+        return None
+
+    access_token, expires_at, refresh_token = exchange_code_for_tokens(code)
+
+    if access_token:
+        print(GREEN + "=> OneDrive authenticated successfully via new authorization!" + RESET)
+        return {
+            "access_token": access_token,
+            "expires_at": expires_at,
+            "refresh_token": refresh_token
+        }
+    else:
+        print(RED + "=> Failed to obtain OneDrive tokens after authorization." + RESET)
+        return None
+
+def authenticate_onedrive():
+    """
+    Authenticates the user with OneDrive using OAuth 2.0.
+
+    Returns the token cached by `context.token_manager` while it stays valid. Otherwise
+    the stored token is loaded and, if it expired or is about to, refreshed. If no
+    token exists or refreshing fails, the full OAuth 2.0 authorization code grant
+    flow runs (see `authorize_onedrive()`). The tokens (access and refresh) are
+    saved locally for future use.
+
+    Parameters:
+    None
+
+    Returns:
+    str: The access token if authentication is successful, otherwise None.
+         This token is used for subsequent API calls to OneDrive.
+    """
+    access_token = context.token_manager.get_onedrive_token()
+    if access_token:
+        print(GREEN + "=> OneDrive token authenticated successfully!" + RESET)
+    return access_token
+
+def get_onedrive_access_token():
+    """
+    Returns the current OneDrive access token from `context.token_manager`, without
+    a browser sign-in.
+
+    Stages fetch the token when they start instead of being handed the one from the
+    authentication, so a stage that starts after a long edit (e.g. an upload) gets
+    the token the background refresh renewed in the meantime.
+
+    Parameters:
+    None
+
+    Returns:
+    str: The access token, or None if there's no valid token.
+    """
+    return context.token_manager.get_onedrive_token(interactive=False)
+
+def get_download_cache_path(local_target_path):
+    """
+    Returns the path of the download cache file stored next to a downloaded file.
+
+    Parameters:
+    local_target_path (str): The full local path of the downloaded file.
+
+    Returns:
+    str: The cache path, e.g. "C:\\Training\\.ThePRogram2026.docx.cache.json".
+    """
+    local_dir, local_filename = os.path.split(local_target_path)
+    return os.path.join(local_dir, f".{local_filename}.cache.json")
+
+def save_download_cache(local_target_path, item_metadata):
+    """
+    Records which OneDrive version a local file corresponds to.
+
+    The item's eTag, cTag and size are stored together with the size and
+    modification time of the local file, so a later run can tell that the local
+    copy is still identical to the remote one without downloading it again.
+
+    Parameters:
+    local_target_path (str): The full local path of the file.
+    item_metadata (dict): The driveItem returned by Microsoft Graph for the file.
+
+    Returns:
+    None.
+    """
+    try:
+        local_stat = os.stat(local_target_path)
+        cache = {
+            "eTag": item_metadata.get("eTag"),
+            "cTag": item_metadata.get("cTag"),
+            "size": item_metadata.get("size"),
+            "local_size": local_stat.st_size,
+            "local_mtime_ns": local_stat.st_mtime_ns
+        }
+        with open(get_download_cache_path(local_target_path), "w") as cache_file:
+            json.dump(cache, cache_file)
+    except OSError as e:
+        print(RED + f'=> Error saving download cache for "{local_target_path}": {e}' + RESET)
+
+def is_download_cache_current(local_target_path, item_metadata):
+    """
+    Checks whether the local file is still identical to the given OneDrive version.
+
+    Parameters:
+    local_target_path (str): The full local path of the file.
+    item_metadata (dict): The driveItem returned by Microsoft Graph for the file.
+
+    Returns:
+    bool: True if the cache matches both the remote eTag/cTag/size and the local
+          file's size/modification time, False otherwise (including a missing cache).
+    """
+    cache_path = get_download_cache_path(local_target_path)
+    if not os.path.exists(local_target_path) or not os.path.exists(cache_path):
+        return False
+    try:
+        with open(cache_path, "r") as cache_file:
+            cache = json.load(cache_file)
+        local_stat = os.stat(local_target_path)
+    except (OSError, json.JSONDecodeError):
+        return False
+    return (cache.get("eTag") == item_metadata.get("eTag")
+            and cache.get("cTag") == item_metadata.get("cTag")
+            and cache.get("size") == item_metadata.get("size")
+            and cache.get("local_size") == local_stat.st_size
+            and cache.get("local_mtime_ns") == local_stat.st_mtime_ns)
+
+def get_onedrive_items_metadata(access_token, onedrive_folder, file_names):
+    """
+    Looks up the metadata of several files in an OneDrive folder with JSON `$batch`
+    requests instead of one request per file.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_folder (str): The name of the folder in OneDrive containing the files.
+    file_names (list): The names of the files.
+
+    Returns:
+    dict: A mapping of {file_name: metadata} with the "id", "eTag", "cTag" and "size"
+          of every file that was found. Files that are missing or couldn't be looked
+          up are left out (`download_file_from_onedrive()` looks them up again).
+    """
+    import requests
+    item_urls = [f"{context.graph_api_url}/me/drive/root:{quote(f'/{onedrive_folder}/{file_name}')}" for file_name in file_names]
+    calls = [{"method": "GET", "url": GraphBatcher.build_url(item_url, {"$select": "id,eTag,cTag,size"})} for item_url in item_urls]
+    try:
+        responses = context.graph_batcher.request_all(calls, access_token)
+    except requests.exceptions.RequestException as e:
+        print(RED + f'=> Could not look up the files in OneDrive folder "{onedrive_folder}" in a batch: {e}' + RESET)
+        return {}
+    return {file_name: response.json() for file_name, response in zip(file_names, responses) if response.status_code == 200}
+
+def download_file_from_onedrive(access_token, onedrive_folder, onedrive_filename, local_target_path, chunk_size=None, item_metadata=None):
+    """
+    Downloads a specific file from a specified folder in OneDrive to a local path.
+
+    First requests the item's metadata from the Microsoft Graph API. If the local
+    file is still identical to that version (see `is_download_cache_current()`),
+    the content download is skipped. Otherwise the file content is streamed to a
+    temporary file that replaces the local path once complete (and is removed if
+    the download fails), and the download cache next to the file is updated.
+    Creates parent directories for the local path if they don't exist.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_folder (str): The name of the folder in OneDrive containing the file.
+    onedrive_filename (str): The name of the file to download from OneDrive.
+    local_target_path (str): The full local file path where the downloaded file
+                             should be saved.
+    chunk_size (int): The number of bytes written per streamed chunk, None for
+                      `context.download_chunk_size`.
+    item_metadata (dict): The item's "id", "eTag", "cTag" and "size" if they were
+                          already looked up (e.g. with `get_onedrive_items_metadata()`),
+                          None to look them up here.
+
+    Returns:
+    bool: True if the download was successful (or the local copy is already
+          up to date), False otherwise.
+    """
+    import requests
+    chunk_size = chunk_size or context.download_chunk_size
+    local_dir = os.path.dirname(local_target_path)
+    if local_dir and not os.path.exists(local_dir):
+        try:
+            os.makedirs(local_dir, exist_ok=True)
+            print(f"Created directory: {local_dir}")
+        except OSError as e:
+            print(RED + f"Error creating directory {local_dir}: {e}" + RESET)
+            return False
+
+
+    item_path = f"/{onedrive_folder}/{onedrive_filename}"
+    encoded_item_path = quote(item_path)
+
+    item_url = f"{context.graph_api_url}/me/drive/root:{encoded_item_path}"
+    download_url = f"{item_url}:/content"
+
+    try:
+        if item_metadata is None:
+            response = context.graph_batcher.request("GET", item_url, access_token, params={"$select": "id,eTag,cTag,size"})
+            if response.status_code == 200:
+                item_metadata = response.json()
+        if item_metadata is not None:
+            if is_download_cache_current(local_target_path, item_metadata):
+                print(GREEN + f'=> Local "{onedrive_filename}" is already up to date with OneDrive. Skipping download.' + RESET)
+                return True
+            response = context.graph_client.get(download_url, access_token=access_token, stream=True)
+        if response.status_code == 200:
+            temporary_path = local_target_path + ".download"
+            try:
+                with open(temporary_path, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                os.replace(temporary_path, local_target_path)
+            finally:
+                if os.path.exists(temporary_path): # Interrupted download
+                    os.remove(temporary_path)
+            save_download_cache(local_target_path, item_metadata)
+            print(GREEN + f'=> Downloaded "{onedrive_filename}" to "{local_target_path}" successfully!' + RESET)
+            return True
+        else:
+            error_message = f'=> Error downloading "{onedrive_filename}" from OneDrive: {response.status_code}'
+            try:
+                error_details = response.json()
+                if error_details.get("error", {}).get("code") == "itemNotFound":
+                    error_message += f' - File not found in OneDrive folder "{onedrive_folder}".'
+                else:
+                    error_message += f' - Response: {response.text}'
+            except json.JSONDecodeError:
+                 error_message += f' - Response: {response.text}'
+            print(RED + error_message + RESET)
+            return False
+    except requests.exceptions.RequestException as e:
+        print(RED + f"=> Network or request error during OneDrive download: {e}" + RESET)
+        return False
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f'=> Error writing "{onedrive_filename}" to "{local_target_path}": {e}' + RESET)
+        return False
+
+def delete_file_from_onedrive(access_token, onedrive_folder, onedrive_filename):
+    """
+    Deletes a specific file from a specified folder in OneDrive.
+
+    Constructs the Microsoft Graph API URL for the item and makes a DELETE request.
+    A 404 (Not Found) status is treated as a successful deletion for the
+    purpose of this script's workflow (i.e., the file is no longer there).
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_folder (str): The name of the folder in OneDrive from which to delete the file.
+    onedrive_filename (str): The name of the file to delete from OneDrive.
+
+    Returns:
+    bool: True if the file was successfully deleted or if it was not found (which
+          also means it's "gone"). False if an an unexpected error occurred during deletion.
+    """
+    import requests
+    item_path = f"/{onedrive_folder}/{onedrive_filename}"
+    encoded_item_path = quote(item_path)
+    delete_url = f"{context.graph_api_url}/me/drive/root:{encoded_item_path}"
+
+    try:
+        response = context.graph_batcher.request("DELETE", delete_url, access_token)
+        if response.status_code == 204: # No Content - successful deletion
+            print(GREEN + f'=> Successfully deleted "{onedrive_filename}" from OneDrive folder "{onedrive_folder}"!' + RESET)
+            return True
+        elif response.status_code == 404: # Not Found
+            print(f'=> File "{onedrive_filename}" not found in OneDrive folder "{onedrive_folder}" for deletion (considered success for workflow).' + RESET)
+            return True # File is not there, so effectively "deleted" for our purposes
+        else:
+            print(RED + f'=> Error deleting "{onedrive_filename}" from OneDrive: {response.status_code}' + RESET)
+            print(RED + f'URL: {delete_url}' + RESET)
+            print(RED + f'Response: {response.text}\n' + RESET)
+            return False
+    except requests.exceptions.RequestException as e:
+        print(RED + f"=> Network or request error during OneDrive deletion: {e}" + RESET)
+        return False
+
+def parse_page_range(page_range, page_count):
+    """
+    Resolves a page range specification into zero-based page indices.
+
+    The specification is a comma-separated list of 1-based page numbers and
+    ranges, where negative numbers count from the end of the document:
+    "-1" is the last page, "2" the second page, "3-5" pages 3 to 5 and "3--1"
+    page 3 to the last page.
+
+    Parameters:
+    page_range (str): The page range specification.
+    page_count (int): The number of pages in the document.
+
+    Returns:
+    list: The zero-based page indices, in the order given.
+
+    Raises:
+    ValueError: If the specification is malformed or refers to a page that doesn't exist.
+    """
+    def resolve(page_number):
+        index = page_number - 1 if page_number > 0 else page_count + page_number
+        if page_number == 0 or not 0 <= index < page_count:
+            raise ValueError(f'Page {page_number} does not exist in a document with {page_count} pages.')
+        return index
+
+    page_indices = []
+    for part in str(page_range).replace(" ", "").split(","):
+        single_page = re.fullmatch(r"-?\d+", part)
+        page_span = re.fullmatch(r"(\d+)-(-?\d+)", part)
+        if single_page:
+            page_indices.append(resolve(int(part)))
+        elif page_span:
+            first, last = resolve(int(page_span.group(1))), resolve(int(page_span.group(2)))
+            page_indices.extend(range(first, last + 1))
+        else:
+            raise ValueError(f'Invalid page range "{part}".')
+    return page_indices
+
+def load_page_extraction_memo():
+    """Returns the memo of `extract_pdf_pages()` ({output_pdf_path: {...}}), empty if it can't be read."""
+    if not os.path.exists(context.page_extraction_path):
+        return {}
+    try:
+        with open(context.page_extraction_path, "r") as memo_file:
+            return json.load(memo_file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def extract_pdf_pages(source_pdf_path, output_pdf_path, page_range=None):
+    """
+    Writes the configured pages of a PDF to a new PDF (e.g. "Training.pdf").
+
+    The source PDF is read lazily from an open file handle, so only the cross
+    reference table, the page tree and the objects referenced by the extracted
+    pages (content streams, fonts, images) are loaded, instead of the whole file.
+    The result is memoized in `context.page_extraction_path` against the quickXorHash of
+    the source PDF and the page range: if neither changed and the output file is
+    still the one that was written, the extraction is skipped.
+
+    Parameters:
+    source_pdf_path (str): The path of the full PDF.
+    output_pdf_path (str): The path the extracted pages are written to.
+    page_range (str): The pages to extract, see `parse_page_range()`. None for
+                      `context.training_pdf_pages`.
+
+    Returns:
+    bool: True if the output PDF is available, False otherwise.
+    """
+    from pypdf import PdfReader, PdfWriter
+    page_range = page_range or context.training_pdf_pages
+    source_hash = compute_file_hashes(source_pdf_path)["quick_xor_hash"]
+    output_memo = load_page_extraction_memo().get(output_pdf_path, {})
+    if (output_memo.get("source_hash") == source_hash and output_memo.get("page_range") == str(page_range)
+            and list(get_file_signature(output_pdf_path) or []) == output_memo.get("output_signature")):
+        print(GREEN + f'=> "{os.path.basename(output_pdf_path)}" is already up to date with "{os.path.basename(source_pdf_path)}".' + RESET)
+        return True
+
+    try:
+        with open(source_pdf_path, "rb") as source_pdf:
+            reader = PdfReader(source_pdf)
+            page_count = len(reader.pages)
+            if not page_count:
+                print(RED + f'=> "{os.path.basename(source_pdf_path)}" contains no pages. Cannot create "{os.path.basename(output_pdf_path)}".' + RESET)
+                return False
+            writer = PdfWriter()
+            for page_index in parse_page_range(page_range, page_count):
+                writer.add_page(reader.pages[page_index])
+            with open(output_pdf_path, "wb") as output_pdf:
+                writer.write(output_pdf)
+    except Exception as e:
+        print(RED + f"=> Error creating '{os.path.basename(output_pdf_path)}' from '{os.path.basename(source_pdf_path)}': {e}" + RESET)
+        return False
+
+    output_memo = {
+        "source_hash": source_hash,
+        "page_range": str(page_range),
+        "output_signature": list(get_file_signature(output_pdf_path))
+    }
+    try:
+        os.makedirs(context.state_folder, exist_ok=True)
+    except OSError as e:
+        print(RED + f"=> Error saving page extraction state '{context.page_extraction_path}': {e}" + RESET)
+    else:
+        with file_lock(context.page_extraction_path): # Batch conversions extract pages in parallel processes
+            memo = load_page_extraction_memo()
+            memo[output_pdf_path] = output_memo
+            write_file_atomically(context.page_extraction_path, json.dumps(memo))
+    print(GREEN + f'=> Created "{os.path.basename(output_pdf_path)}" (pages "{page_range}") from "{os.path.basename(source_pdf_path)}" successfully!' + RESET)
+    return True
+
+def upload_file_to_onedrive(access_token, onedrive_filename, local_file_path_to_upload, artifact=None):
+    """
+    Uploads a single local file to the 'Training' folder in OneDrive.
+
+    The upload is skipped if the quickXorHash of the file already in OneDrive
+    matches the local file. Files up to ONEDRIVE_SIMPLE_UPLOAD_LIMIT are sent in a
+    single PUT to the `:/content` endpoint, larger files go through
+    `upload_large_file_to_onedrive()`.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_filename (str): The name the file should have in OneDrive.
+    local_file_path_to_upload (str): The full local path of the file to upload.
+    artifact (UploadArtifact): The file, already read for other destinations, or None to read it here.
+
+    Returns:
+    bool: True if the upload was successful, False otherwise.
+    """
+    import requests
+    if artifact is None:
+        if not os.path.exists(local_file_path_to_upload):
+            print(f'File "{local_file_path_to_upload}" for OneDrive upload as "{onedrive_filename}" not found. Skipping this file!')
+            return False
+        with UploadArtifact(local_file_path_to_upload) as artifact:
+            return upload_file_to_onedrive(access_token, onedrive_filename, local_file_path_to_upload, artifact)
+
+    remote_hash = get_onedrive_item_hash(access_token, ONEDRIVE_TARGET_FOLDER, onedrive_filename)
+    if remote_hash and remote_hash == artifact.hashes["quick_xor_hash"]:
+        print(GREEN + f'=> "{onedrive_filename}" in OneDrive folder "{ONEDRIVE_TARGET_FOLDER}" is already up to date. Skipping upload.' + RESET)
+        return True
+
+    if artifact.size > ONEDRIVE_SIMPLE_UPLOAD_LIMIT:
+        return upload_large_file_to_onedrive(access_token, onedrive_filename, local_file_path_to_upload, artifact)
+
+    item_path = f"/{ONEDRIVE_TARGET_FOLDER}/{onedrive_filename}"
+    encoded_item_path = quote(item_path)
+    upload_url = f"{context.graph_api_url}/me/drive/root:{encoded_item_path}:/content"
+    headers = {"Content-Type": "application/octet-stream"}
+
+    try:
+        with artifact.open() as file_content:
+            response = context.graph_client.put(upload_url, access_token=access_token, headers=headers, data=file_content)
+
+        if response.status_code == 200 or response.status_code == 201: # 200 OK (updated), 201 Created
+            print(GREEN + f'=> Uploaded "{onedrive_filename}" to OneDrive folder "{ONEDRIVE_TARGET_FOLDER}" successfully!' + RESET)
+            if os.path.exists(get_download_cache_path(local_file_path_to_upload)):
+                save_download_cache(local_file_path_to_upload, response.json())
+            return True
+        else:
+            print(RED + f'Error uploading "{onedrive_filename}" to OneDrive: {response.status_code}' + RESET)
+            print(RED + f'URL: {upload_url}\nResponse: {response.text}\n' + RESET)
+    except requests.exceptions.RequestException as e:
+        print(RED + f"Network or request error during OneDrive upload of '{onedrive_filename}': {e}" + RESET)
+    except IOError as e:
+        print(RED + f"IOError reading file '{local_file_path_to_upload}' for upload: {e}" + RESET)
+    except Exception as e:
+        print(RED + f"An unexpected error occurred during OneDrive upload of '{onedrive_filename}': {e}" + RESET)
+    return False
+
+_upload_sessions_lock = threading.Lock()
+
+def load_upload_sessions():
+    """
+    Loads the persisted OneDrive upload session state from `context.onedrive_upload_sessions_path`.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: A mapping of {onedrive_item_path: session_state}. Empty if the file
+          doesn't exist or can't be read.
+    """
+    if not os.path.exists(context.onedrive_upload_sessions_path):
+        return {}
+    try:
+        with open(context.onedrive_upload_sessions_path, "r") as sessions_file:
+            return json.load(sessions_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Error reading upload session state '{context.onedrive_upload_sessions_path}': {e}. Starting fresh." + RESET)
+        return {}
+
+def save_upload_session(item_path, session_state):
+    """
+    Persists (or removes) the upload session state of a single OneDrive item.
+
+    The whole state file is rewritten with `write_file_atomically()`, so an
+    interrupted run never leaves a half-written file behind, under `file_lock()`,
+    so parallel runs don't drop each other's sessions.
+
+    Parameters:
+    item_path (str): The OneDrive item path the session uploads to.
+    session_state (dict): The session state to store, or None to remove it.
+
+    Returns:
+    None.
+    """
+    with _upload_sessions_lock, file_lock(context.onedrive_upload_sessions_path):
+        sessions = load_upload_sessions()
+        if session_state is None:
+            if item_path not in sessions:
+                return
+            sessions.pop(item_path)
+        else:
+            sessions[item_path] = session_state
+        write_file_atomically(context.onedrive_upload_sessions_path, json.dumps(sessions))
+
+def get_upload_session_offset(upload_url):
+    """
+    Asks an existing OneDrive upload session which byte it expects next.
+
+    Parameters:
+    upload_url (str): The pre-authenticated upload URL of the session.
+
+    Returns:
+    int: The offset of the first byte the session still needs, or None if the
+         session no longer exists or its status could not be retrieved.
+    """
+    import requests
+    try:
+        response = context.graph_client.get(upload_url)
+        if response.status_code != 200:
+            return None
+        next_expected_ranges = response.json().get("nextExpectedRanges") or []
+        if not next_expected_ranges:
+            return None
+        return int(next_expected_ranges[0].split("-")[0])
+    except (requests.exceptions.RequestException, json.JSONDecodeError, ValueError):
+        return None
+
+def create_upload_session(access_token, item_path):
+    """
+    Creates a new OneDrive upload session for an item with Graph `createUploadSession`.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    item_path (str): The OneDrive item path to upload to (e.g. "/Training/Training.pdf").
+
+    Returns:
+    dict: The session's {"upload_url", "expiration"}, or None if it couldn't be created.
+    """
+    import requests
+    session_url = f"{context.graph_api_url}/me/drive/root:{quote(item_path)}:/createUploadSession"
+    body = {"item": {"@microsoft.graph.conflictBehavior": "replace"}}
+    try:
+        response = context.graph_client.post(session_url, access_token=access_token, json=body)
+        if response.status_code != 200:
+            print(RED + f'=> Error creating upload session for "{item_path}": {response.status_code}' + RESET)
+            print(RED + f'Response: {response.text}\n' + RESET)
+            return None
+        session_data = response.json()
+        return {"upload_url": session_data["uploadUrl"], "expiration": session_data.get("expirationDateTime")}
+    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
+        print(RED + f'=> Network or request error creating upload session for "{item_path}": {e}' + RESET)
+        return None
+
+def upload_large_file_to_onedrive(access_token, onedrive_filename, local_file_path_to_upload, artifact=None):
+    """
+    Uploads a local file to the 'Training' folder in OneDrive through a resumable upload session.
+
+    The file is sent in fixed-size byte ranges of ONEDRIVE_UPLOAD_CHUNK_SIZE. A failed
+    chunk is retried by `context.graph_client` only (see `RetryPolicy`). If it still
+    fails, the session is asked for the last acknowledged offset, and the upload
+    continues from there only if the server received more than the failed chunk's
+    start (e.g. the chunk arrived but its response was lost), so no byte is sent twice. The session URL and the
+    size/modification time of the local file are persisted in
+    `context.onedrive_upload_sessions_path`, so an upload interrupted in one run is resumed
+    by the next run as long as the local file hasn't changed and the session hasn't expired.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_filename (str): The name the file should have in OneDrive.
+    local_file_path_to_upload (str): The full local path of the file to upload.
+    artifact (UploadArtifact): The file, already read for other destinations, or None to read it here.
+
+    Returns:
+    bool: True if the upload was completed, False otherwise.
+    """
+    import requests
+    if artifact is None:
+        with UploadArtifact(local_file_path_to_upload) as artifact:
+            return upload_large_file_to_onedrive(access_token, onedrive_filename, local_file_path_to_upload, artifact)
+    item_path = f"/{ONEDRIVE_TARGET_FOLDER}/{onedrive_filename}"
+    file_stat = artifact.stat
+    total_size = file_stat.st_size
+
+    offset = None
+    session_state = load_upload_sessions().get(item_path)
+    if session_state and session_state.get("size") == total_size and session_state.get("mtime_ns") == file_stat.st_mtime_ns:
+        offset = get_upload_session_offset(session_state["upload_url"])
+        if offset is not None:
+            print(f'Resuming upload session for "{onedrive_filename}" at byte {offset} of {total_size}...')
+    elif session_state:
+        try:
+            context.graph_client.delete(session_state["upload_url"]) # Cancel the session of an outdated file
+        except requests.exceptions.RequestException:
+            pass
+
+    if offset is None:
+        session = create_upload_session(access_token, item_path)
+        if not session:
+            save_upload_session(item_path, None)
+            return False
+        session_state = {**session, "size": total_size, "mtime_ns": file_stat.st_mtime_ns}
+        save_upload_session(item_path, session_state)
+        offset = 0
+
+    upload_url = session_state["upload_url"]
+    try:
+        with artifact.open() as file_content:
+            while True:
+                file_content.seek(offset)
+                chunk = file_content.read(ONEDRIVE_UPLOAD_CHUNK_SIZE)
+                chunk_end = offset + len(chunk) - 1
+                headers = {"Content-Length": str(len(chunk)), "Content-Range": f"bytes {offset}-{chunk_end}/{total_size}"}
+                try:
+                    # The upload URL is pre-authenticated, so no Authorization header is sent
+                    response = context.graph_client.put(upload_url, headers=headers, data=chunk)
+                except requests.exceptions.RequestException as e:
+                    response = None
+                    print(RED + f'=> Network error uploading bytes {offset}-{chunk_end} of "{onedrive_filename}": {e}' + RESET)
+
+                if response is not None and response.status_code in (200, 201):
+                    save_upload_session(item_path, None)
+                    print(GREEN + f'=> Uploaded "{onedrive_filename}" to OneDrive folder "{ONEDRIVE_TARGET_FOLDER}" successfully!' + RESET)
+                    if os.path.exists(get_download_cache_path(local_file_path_to_upload)):
+                        save_download_cache(local_file_path_to_upload, response.json())
+                    return True
+
+                if response is not None and response.status_code == 202:
+                    next_expected_ranges = response.json().get("nextExpectedRanges") or [f"{chunk_end + 1}-"]
+                    offset = int(next_expected_ranges[0].split("-")[0])
+                    continue
+
+                if response is not None and response.status_code == 404:
+                    print(RED + f'=> Upload session for "{onedrive_filename}" expired or was not found. It will be recreated on the next run.' + RESET)
+                    save_upload_session(item_path, None)
+                    return False
+
+                if response is not None:
+                    print(RED + f'=> Error uploading bytes {offset}-{chunk_end} of "{onedrive_filename}": {response.status_code}' + RESET)
+                acknowledged_offset = get_upload_session_offset(upload_url)
+                if acknowledged_offset is None or acknowledged_offset <= offset:
+                    print(RED + f'=> Giving up on "{onedrive_filename}" for now. The upload will resume from the last acknowledged byte on the next run.' + RESET)
+                    return False
+                offset = acknowledged_offset # Not a retry: the server already has the failed chunk
+    except IOError as e:
+        print(RED + f"IOError reading file '{local_file_path_to_upload}' for upload: {e}" + RESET)
+    except (json.JSONDecodeError, ValueError) as e:
+        print(RED + f"=> Unexpected upload session response for '{onedrive_filename}': {e}" + RESET)
+    return False
+
+def authorize_google_drive():
+    """
+    Runs the Google Drive OAuth 2.0 installed app flow in the browser.
+
+    Parameters:
+    None
+
+    Returns:
+    google.oauth2.credentials.Credentials: The new credentials, or None if the
+                                           authorization failed.
+    """
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    print("No valid Google Drive token found or refresh failed. Performing new Google Drive authentication flow...")
+    try:
+        if not os.path.exists(context.google_credentials_path):
+            print(RED + f"Google API credentials file ('{context.google_credentials_path}') not found. Cannot proceed with Google auth." + RESET)
+            return None
+        flow = InstalledAppFlow.from_client_secrets_file(context.google_credentials_path, GOOGLE_DRIVE_SCOPES)
+        google_creds = flow.run_local_server(port=0)
+        print(GREEN + "=> Google Drive authenticated successfully via new authorization!" + RESET)
+        return google_creds
+    except Exception as e:
+        print(RED + f"Error during new Google authentication flow: {e}" + RESET)
+        return None
+
+def authenticate_google_drive():
+    """
+    Authenticates the user with Google Drive using OAuth 2.0.
+
+    Similar to OneDrive authentication, it returns the credentials cached by
+    `context.token_manager`, loads and refreshes the local token if needed, or
+    initiates a new authorization flow via the browser (see `authorize_google_drive()`).
+    The obtained credentials are saved locally.
+
+    Parameters:
+    None
+
+    Returns:
+    google.oauth2.credentials.Credentials: A Credentials object if authentication
+                                           is successful, otherwise None. This object
+                                           is used to build the Google Drive API service.
+                                           None without a Google Drive destination.
+    """
+    if not needs_credentials("google_drive"):
+        print("=> No Google Drive destination is configured. Skipping its authentication.")
+        return None
+    google_creds = context.token_manager.get_google_creds()
+    if google_creds:
+        try: # Built here, while the document is downloaded and edited, instead of by the first upload
+            get_drive_service(google_creds)
+        except Exception as e:
+            print(RED + f"=> Could not prepare the Google Drive client yet ({e}). The uploads will try again." + RESET)
+        print(GREEN + "=> Google Drive token authenticated successfully!" + RESET)
+    else:
+        print(RED + "=> Google Drive authentication ultimately failed." + RESET)
+    return google_creds
+
+class DriveDiscoveryCache:
+    """
+    Keeps the Google Drive discovery documents fetched from
+    `context.google_drive_discovery_url` in `context.drive_discovery_cache_path`, so
+    only the first run (and then one run every DRIVE_DISCOVERY_CACHE_MAX_AGE seconds)
+    downloads them. Implements the `get()` / `set()` interface of
+    `googleapiclient.discovery_cache.base.Cache`.
+    """
+
+    def load(self):
+        try:
+            with open(context.drive_discovery_cache_path, "r", encoding="utf-8") as cache_file:
+                return json.load(cache_file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def get(self, url):
+        cached_document = self.load().get(url)
+        if cached_document and time.time() - cached_document.get("fetched_at", 0) < DRIVE_DISCOVERY_CACHE_MAX_AGE:
+            return cached_document["content"]
+        return None
+
+    def set(self, url, content):
+        os.makedirs(context.state_folder, exist_ok=True)
+        with file_lock(context.drive_discovery_cache_path):
+            cached_documents = self.load()
+            cached_documents[url] = {"fetched_at": time.time(), "content": content}
+            write_file_atomically(context.drive_discovery_cache_path, json.dumps(cached_documents))
+
+_drive_service_lock = threading.Lock()
+_drive_service = {}            # {"credentials", "service"} of the shared Drive service
+_drive_http = threading.local() # The authorized HTTP transport of each thread
+
+def get_drive_http(google_creds):
+    """
+    Returns the calling thread's authorized HTTP transport for the Drive API.
+
+    httplib2 connections can't be shared between threads, so every thread keeps its
+    own transport, and with it its keep-alive connections, for all its Drive calls.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object.
+
+    Returns:
+    google_auth_httplib2.AuthorizedHttp: The transport.
+    """
+    import google_auth_httplib2
+    from googleapiclient.http import build_http
+    authorized_http = getattr(_drive_http, "authorized_http", None)
+    if authorized_http is None or authorized_http.credentials is not google_creds:
+        authorized_http = google_auth_httplib2.AuthorizedHttp(google_creds, http=build_http())
+        _drive_http.authorized_http = authorized_http
+    return authorized_http
+
+def build_drive_request(http, *args, **kwargs):
+    """
+    Creates the requests of the shared Drive service on the calling thread's
+    transport (see `get_drive_http()`), instead of the transport of the thread
+    that built the service.
+    """
+    from googleapiclient.http import HttpRequest
+    return HttpRequest(get_drive_http(http.credentials), *args, **kwargs)
+
+def get_drive_service(google_creds):
+    """
+    Returns the Google Drive API v3 service, built once per process and shared by
+    all Drive operations (and threads).
+
+    Uses the discovery document bundled with the client library, unless
+    context.google_drive_discovery_url is configured, in which case the discovery
+    document (and with it the API endpoint) is loaded from that URL, through
+    `DriveDiscoveryCache`. The service is rebuilt if it is used with other credentials.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object.
+
+    Returns:
+    googleapiclient.discovery.Resource: The Drive service.
+    """
+    with _drive_service_lock:
+        if _drive_service.get("credentials") is google_creds:
+            return _drive_service["service"]
+        from googleapiclient.discovery import build
+        if context.google_drive_discovery_url:
+            service = build("drive", "v3", http=get_drive_http(google_creds), requestBuilder=build_drive_request,
+                            discoveryServiceUrl=context.google_drive_discovery_url,
+                            static_discovery=False, cache_discovery=True, cache=DriveDiscoveryCache())
+        else:
+            service = build("drive", "v3", http=get_drive_http(google_creds), requestBuilder=build_drive_request,
+                            cache_discovery=False)
+        _drive_service.update({"credentials": google_creds, "service": service})
+        return service
+
+def execute_drive_request(request, operation):
+    """
+    Executes a Google Drive API request, retrying it according to `context.retry_policy`,
+    and records every attempt in `run_metrics`.
+
+    Drive reports rate limits as "403 rateLimitExceeded" as well as 429, so those are
+    retried like throttling. A resumable upload continues from the last byte Drive
+    acknowledged when it is retried.
+
+    Parameters:
+    request (googleapiclient.http.HttpRequest): The request to execute.
+    operation (str): A short description for the run report, e.g. "files.list".
+
+    Returns:
+    dict: The decoded response.
+
+    Raises:
+    HttpError: If the Google Drive API returned an error that can't be retried (any more).
+    """
+    from googleapiclient.errors import HttpError
+    import httplib2
+    bytes_sent = request.resumable.size() if request.resumable else len(request.body or "")
+    # Repeating a resumable upload only continues (or restarts) the upload session
+    idempotent = request.method in RetryPolicy.IDEMPOTENT_METHODS or request.resumable is not None
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.monotonic()
+        try:
+            if request.resumable:
+                # Chunk by chunk (DRIVE_UPLOAD_CHUNK_SIZE while "upload_bandwidth_limit" is set), like `execute()`
+                response = None
+                while response is None:
+                    throttle_upload(min(request.resumable.chunksize(), request.resumable.size() - request.resumable_progress))
+                    _, response = request.next_chunk()
+            else:
+                response = request.execute()
+        except HttpError as e:
+            run_metrics.record_request("google_drive", operation, e.resp.status, time.monotonic() - started, bytes_sent)
+            status = e.resp.status
+            if status == 403 and re.search(rb"rateLimitExceeded", e.content or b"", re.IGNORECASE):
+                status = 429
+            if context.retry_policy.wait_before_retry("google_drive", f"Google Drive {operation}", status, attempt, idempotent,
+                                              RetryPolicy.parse_retry_after(e.resp.get("retry-after"))):
+                continue
+            raise
+        except (OSError, httplib2.HttpLib2Error):
+            run_metrics.record_request("google_drive", operation, None, time.monotonic() - started, bytes_sent)
+            if context.retry_policy.wait_before_retry("google_drive", f"Google Drive {operation}", None, attempt, idempotent):
+                continue
+            raise
+        except Exception:
+            run_metrics.record_request("google_drive", operation, None, time.monotonic() - started, bytes_sent)
+            raise
+        run_metrics.record_request("google_drive", operation, 200, time.monotonic() - started, bytes_sent, len(json.dumps(response)))
+        return response
+
+_google_drive_ids_lock = threading.Lock()
+_google_drive_folder_lock = threading.Lock()
+
+def load_google_drive_ids(file_name=GOOGLE_DRIVE_UPLOAD_FILENAME):
+    """
+    Loads the cached Google Drive IDs of GOOGLE_DRIVE_UPLOAD_FOLDER and a file in it
+    from `context.google_drive_ids_path`.
+
+    The cache holds {"folder_name", "folder_id", "files": {file_name: {"id", "md5"}}},
+    where "md5" is the md5Checksum Google Drive last reported for the file (caches
+    with a single "file_name" / "file_id" or without MD5s are read as well).
+
+    Parameters:
+    file_name (str): The name of the file, GOOGLE_DRIVE_UPLOAD_FILENAME by default.
+
+    Returns:
+    dict: {"folder_id", "file_id", "md5"}. The IDs are missing if they aren't cached
+          or the cached folder no longer has the configured name, and the dict is
+          empty if the file doesn't exist or can't be read.
+    """
+    if not os.path.exists(context.google_drive_ids_path):
+        return {}
+    try:
+        with open(context.google_drive_ids_path, "r") as ids_file:
+            cached_ids = json.load(ids_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Error reading Google Drive ID cache '{context.google_drive_ids_path}': {e}. Looking the IDs up again." + RESET)
+        return {}
+    if cached_ids.get("folder_name") != GOOGLE_DRIVE_UPLOAD_FOLDER or not cached_ids.get("folder_id"):
+        return {}
+    drive_ids = {"folder_id": cached_ids["folder_id"]}
+    file_ids = cached_ids.get("files") or {cached_ids.get("file_name"): cached_ids.get("file_id")}
+    cached_file = file_ids.get(file_name)
+    if isinstance(cached_file, str):
+        cached_file = {"id": cached_file}
+    if cached_file and cached_file.get("id"):
+        drive_ids["file_id"] = cached_file["id"]
+        if cached_file.get("md5"):
+            drive_ids["md5"] = cached_file["md5"]
+    return drive_ids
+
+def save_google_drive_ids(folder_id, file_id, file_name=GOOGLE_DRIVE_UPLOAD_FILENAME, md5=None):
+    """
+    Caches the Google Drive IDs of the upload folder and a file in it, and the MD5
+    of the file, in `context.google_drive_ids_path`.
+
+    The IDs of the other files stay cached as long as the folder ID doesn't change.
+    Safe to call from parallel uploads (and runs).
+
+    Parameters:
+    folder_id (str): The ID of GOOGLE_DRIVE_UPLOAD_FOLDER, or None to clear the cache.
+    file_id (str): The ID of the file, or None if it isn't known.
+    file_name (str): The name of the file, GOOGLE_DRIVE_UPLOAD_FILENAME by default.
+    md5 (str): The md5Checksum Google Drive reported for the file, or None if it isn't known.
+
+    Returns:
+    None.
+    """
+    with _google_drive_ids_lock, file_lock(context.google_drive_ids_path):
+        cached_ids = {}
+        if folder_id and os.path.exists(context.google_drive_ids_path):
+            try:
+                with open(context.google_drive_ids_path, "r") as ids_file:
+                    cached_ids = json.load(ids_file)
+            except (OSError, json.JSONDecodeError):
+                cached_ids = {}
+        file_ids = {}
+        if cached_ids.get("folder_name") == GOOGLE_DRIVE_UPLOAD_FOLDER and cached_ids.get("folder_id") == folder_id:
+            file_ids = cached_ids.get("files") or {cached_ids.get("file_name"): cached_ids.get("file_id")}
+            file_ids.pop(None, None)
+        drive_ids = {}
+        if folder_id:
+            if file_id:
+                file_ids[file_name] = {"id": file_id, "md5": md5}
+            else:
+                file_ids.pop(file_name, None)
+            drive_ids = {"folder_name": GOOGLE_DRIVE_UPLOAD_FOLDER, "folder_id": folder_id, "files": file_ids}
+        write_file_atomically(context.google_drive_ids_path, json.dumps(drive_ids))
+
+def get_cached_google_drive_item(service, item_id, fields):
+    """
+    Fetches the metadata of a cached Google Drive ID.
+
+    Parameters:
+    service (googleapiclient.discovery.Resource): The Drive service.
+    item_id (str): The cached file or folder ID.
+    fields (str): The fields to request, must include "trashed".
+
+    Returns:
+    dict: The metadata, or None if the item no longer exists or is in the trash.
+
+    Raises:
+    HttpError: For any error other than "404 Not Found".
+    """
+    from googleapiclient.errors import HttpError
+    try:
+        item = execute_drive_request(service.files().get(fileId=item_id, fields=fields), "files.get")
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+    return None if item.get("trashed") else item
+
+def find_google_drive_folder(service, drive_ids, create=True):
+    """
+    Returns the ID of GOOGLE_DRIVE_UPLOAD_FOLDER, preferring the cached ID.
+
+    The cached ID is only validated here, i.e. when the cached file ID could not be
+    used. If it is gone, the folder is looked up by name and created if missing
+    (by one upload at a time, so parallel uploads don't create it twice).
+
+    Parameters:
+    service (googleapiclient.discovery.Resource): The Drive service.
+    drive_ids (dict): The IDs loaded with `load_google_drive_ids()`.
+    create (bool): False to return None instead of creating a missing folder.
+
+    Returns:
+    str: The folder ID, or None if it doesn't exist (and `create` is False) or
+         couldn't be created.
+    """
+    folder_id = drive_ids.get("folder_id")
+    if folder_id and get_cached_google_drive_item(service, folder_id, "id, trashed"):
+        return folder_id
+    with _google_drive_folder_lock:
+        return find_or_create_google_drive_folder(service, create)
+
+def find_or_create_google_drive_folder(service, create):
+    """Looks GOOGLE_DRIVE_UPLOAD_FOLDER up by name and creates it if missing (see `find_google_drive_folder()`)."""
+    response = execute_drive_request(service.files().list(
+        q=f"name='{GOOGLE_DRIVE_UPLOAD_FOLDER}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
+        spaces="drive",
+        fields="files(id, name)"
+    ), "files.list")
+    if response["files"]:
+        return response["files"][0]["id"]
+    if not create:
+        return None
+
+    print(f'Folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" not found in Google Drive, creating it...')
+    folder_metadata = { "name": GOOGLE_DRIVE_UPLOAD_FOLDER, "mimeType": "application/vnd.google-apps.folder" }
+    created_folder = execute_drive_request(service.files().create(body=folder_metadata, fields="id"), "files.create folder")
+    folder_id = created_folder.get("id")
+    print(GREEN + f"Folder '{GOOGLE_DRIVE_UPLOAD_FOLDER}' created with ID: {folder_id}" + RESET)
+    return folder_id
+
+def find_google_drive_files(service, folder_id, file_name=GOOGLE_DRIVE_UPLOAD_FILENAME):
+    """
+    Lists the files with a given name in a Google Drive folder.
+
+    Parameters:
+    service (googleapiclient.discovery.Resource): The Drive service.
+    folder_id (str): The ID of GOOGLE_DRIVE_UPLOAD_FOLDER.
+    file_name (str): The name of the files, GOOGLE_DRIVE_UPLOAD_FILENAME by default.
+
+    Returns:
+    list: The files, as dicts with "id", "name" and "md5Checksum".
+    """
+    escaped_file_name = file_name.replace("\\", "\\\\").replace("'", "\\'")
+    response = execute_drive_request(service.files().list(
+        q=f"name='{escaped_file_name}' and parents in '{folder_id}' and trashed=false",
+        spaces="drive", fields="files(id, name, md5Checksum)"
+    ), "files.list")
+    return response.get("files", [])
+
+def upload_to_google_drive(google_creds, local_file_path=None, remote_name=None, artifact=None):
+    """
+    Uploads the "ThePRogram2026.pdf" (from `context.pdf_path`) to a specified folder
+    (GOOGLE_DRIVE_UPLOAD_FOLDER) in Google Drive.
+
+    It will:
+    1. If the ID of the file is cached (`context.google_drive_ids_path`) and its cached
+       md5Checksum matches the local PDF, the upload is skipped without a request.
+       Otherwise upload the local PDF as a new revision of that file with
+       `files().update` (a single request), which keeps the file ID (and with it shared
+       links) and the earlier revisions. The cache is kept in line with the files in
+       Google Drive by every check of their state (see `get_google_drive_file_md5()`).
+    2. Otherwise, or if the cached file is gone, trashed or moved (as reported by the
+       update), find (or create) the target folder and look the file up by name. If
+       its md5Checksum matches the local PDF, the upload is skipped. If it exists, it
+       is updated in place (and any duplicates are deleted), else a new file is created.
+    3. Cache the folder and file IDs and the MD5 for the next run.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object.
+    local_file_path (str): The PDF to upload, None for `context.pdf_path`.
+    remote_name (str): The name of the file in Google Drive, None for GOOGLE_DRIVE_UPLOAD_FILENAME.
+    artifact (UploadArtifact): The file, already read for other destinations, or None to read it here.
+
+    Returns:
+    bool: True if the upload was successful, False otherwise.
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload, DEFAULT_CHUNK_SIZE
+    local_file_path = local_file_path or context.pdf_path
+    remote_name = remote_name or GOOGLE_DRIVE_UPLOAD_FILENAME
+    if artifact is None:
+        if not os.path.exists(local_file_path):
+             print(RED + f"=> Local file '{local_file_path}' (for Google Drive upload as '{remote_name}') not found. Skipping upload." + RESET)
+             return False
+        with UploadArtifact(local_file_path) as artifact:
+            return upload_to_google_drive(google_creds, local_file_path, remote_name, artifact)
+
+    chunk_size = DRIVE_UPLOAD_CHUNK_SIZE if context.upload_limiter else DEFAULT_CHUNK_SIZE # Smaller chunks let other uploads overtake
+    try:
+        service = get_drive_service(google_creds)
+        drive_ids = load_google_drive_ids(remote_name)
+
+        # 1. Compare with the cached MD5, then update the cached file in place
+        if drive_ids.get("file_id"):
+            if drive_ids.get("md5") == artifact.hashes["md5"]:
+                print(GREEN + f'=> "{remote_name}" in Google Drive folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" is already up to date. Skipping upload.' + RESET)
+                return True
+            try:
+                media = MediaIoBaseUpload(artifact.open(), get_content_type(remote_name), chunksize=chunk_size, resumable=True)
+                updated_file = execute_drive_request(service.files().update(
+                    fileId=drive_ids["file_id"], media_body=media, fields="id, md5Checksum, trashed, parents"
+                ), "files.update")
+                if not updated_file.get("trashed") and drive_ids["folder_id"] in updated_file.get("parents", []):
+                    save_google_drive_ids(drive_ids["folder_id"], drive_ids["file_id"], remote_name, updated_file.get("md5Checksum"))
+                    print(GREEN + f'=> Uploaded "{remote_name}" to Google Drive folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" successfully (new revision)!' + RESET)
+                    return True
+                print(f'Cached Google Drive file "{remote_name}" is trashed or moved, looking it up again...')
+            except HttpError as e:
+                if e.resp.status != 404:
+                    raise
+                print(f'Cached Google Drive file "{remote_name}" no longer exists, looking it up again...')
+            drive_ids.pop("file_id")
+
+        # 2. Find or create the target folder, then find the existing file
+        folder_id = find_google_drive_folder(service, drive_ids)
+        if not folder_id:
+            print(RED + f"Could not obtain folder ID for '{GOOGLE_DRIVE_UPLOAD_FOLDER}'. Cannot upload." + RESET)
+            save_google_drive_ids(None, None, remote_name)
+            return False
+
+        existing_files = find_google_drive_files(service, folder_id, remote_name)
+        local_md5 = artifact.hashes["md5"]
+        for existing_file in existing_files:
+            if existing_file.get("md5Checksum") == local_md5:
+                save_google_drive_ids(folder_id, existing_file["id"], remote_name, local_md5)
+                print(GREEN + f'=> "{remote_name}" in Google Drive folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" is already up to date. Skipping upload.' + RESET)
+                return True
+
+        media = MediaIoBaseUpload(artifact.open(), get_content_type(remote_name), chunksize=chunk_size, resumable=True)
+        if existing_files:
+            file_id = existing_files[0]["id"]
+            uploaded_file = execute_drive_request(service.files().update(fileId=file_id, media_body=media, fields="id, md5Checksum"), "files.update")
+            for duplicate_file in existing_files[1:]:
+                execute_drive_request(service.files().delete(fileId=duplicate_file["id"]), "files.delete")
+                print(GREEN + f'=> Successfully deleted duplicate file "{duplicate_file["name"]}"!' + RESET)
+        else:
+            file_metadata = { "name": remote_name, "parents": [folder_id] }
+            uploaded_file = execute_drive_request(service.files().create(body=file_metadata, media_body=media, fields="id, md5Checksum"), "files.create")
+            file_id = uploaded_file["id"]
+
+        # 3. Cache the IDs and the MD5 for the next run
+        save_google_drive_ids(folder_id, file_id, remote_name, uploaded_file.get("md5Checksum"))
+        print(GREEN + f'=> Uploaded "{remote_name}" to Google Drive folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" successfully!' + RESET)
+        return True
+
+    except HttpError as e:
+        error_content = e.content.decode() if e.content else "No additional error content."
+        print(RED + f"=> An HTTP error occurred with Google Drive API: {e._get_reason()}\nDetails: {error_content}" + RESET)
+    except Exception as e:
+        print(RED + f"=> An unexpected error occurred during Google Drive operations: {str(e)}" + RESET)
+    return False
+
+def get_upload_credentials(google_creds):
+    """
+    Returns the credentials of the destinations for an upload (or check) that starts
+    now: the current OneDrive token (see `get_onedrive_access_token()`) and the Google
+    Drive credentials, which `context.token_manager` refreshes in place.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The Google Drive credentials, or None.
+
+    Returns:
+    dict: {"onedrive": access token, "google_drive": credentials object}.
+    """
+    return {"onedrive": get_onedrive_access_token(), "google_drive": google_creds}
+
+async def run_upload(scheduler, destination, remote_name, size, function, *args):
+    """
+    Runs a single upload in a worker thread, as its own "upload ..." stage, once
+    `scheduler` gives it a slot. Its priority (see `get_upload_priority()`) also
+    decides which upload sends next under "upload_bandwidth_limit".
+
+    Parameters:
+    scheduler (UploadScheduler): Limits and orders the uploads running at the same time.
+    destination (UploadDestination): The destination.
+    remote_name (str): The name of the file at the destination.
+    size (int): The size of the file in bytes (breaks priority ties).
+    function (callable): The upload function, e.g. `upload_artifact`.
+    *args: The arguments for the upload function.
+
+    Returns:
+    bool: True if the upload succeeded, False otherwise.
+    """
+    destination_label = destination.get_label(remote_name)
+    priority = get_upload_priority(remote_name)
+    async with scheduler.slot(destination.name, priority, size):
+        _upload_priority.set(priority) # Copied into the worker thread by `asyncio.to_thread()`
+        try:
+            return bool(await run_stage(f"upload {destination_label}", function, *args))
+        except Exception as e:
+            print(RED + f"=> Unexpected error in upload task for {destination_label}: {e}" + RESET)
+            return False
+
+async def fan_out_upload(scheduler, kind, remote_name, local_file_path, google_creds):
+    """
+    Uploads an artifact to every destination that receives its kind (see
+    `get_destinations()`), all at the same time. The file is read from disk once
+    (see `UploadArtifact`) for all of them, and the failed uploads are spooled from
+    the same copy in memory once all are done (see `spool_failed_uploads()`).
+    Destinations that aren't authenticated are left out.
+
+    Parameters:
+    scheduler (UploadScheduler): Limits and orders the uploads running at the same time.
+    kind (str): "docx", "pdf" or "training_pdf".
+    remote_name (str): The name of the file at the destinations.
+    local_file_path (str): The file to upload.
+    google_creds: The Google Drive credentials, None, or a future resolving to either,
+                  which is only awaited if a Google Drive destination receives `kind`.
+
+    Returns:
+    dict: A mapping of {destination_label: bool}.
+    """
+    import asyncio
+    destinations = [destination for destination in get_destinations() if kind in destination.artifacts]
+    if any(destination.credentials_key == "google_drive" for destination in destinations):
+        google_creds = await resolve_google_creds(google_creds)
+    else:
+        google_creds = None
+    credentials = await asyncio.to_thread(get_upload_credentials, google_creds)
+    destinations = [destination for destination in destinations if destination.is_available(credentials)]
+    if not destinations:
+        return {}
+    labels = [destination.get_label(remote_name) for destination in destinations]
+    try:
+        artifact = UploadArtifact(local_file_path)
+    except OSError as e:
+        print(RED + f"=> Local file '{local_file_path}' (for upload as '{remote_name}') can't be read: {e}. Skipping upload." + RESET)
+        return dict.fromkeys(labels, False)
+    with artifact:
+        results = await asyncio.gather(*(
+            run_upload(scheduler, destination, remote_name, artifact.size, upload_artifact, destination, remote_name, artifact, google_creds)
+            for destination in destinations
+        ))
+        await asyncio.to_thread(spool_failed_uploads, remote_name, artifact, list(zip(destinations, results)))
+    return dict(zip(labels, results))
+
+def print_upload_summary(results):
+    """
+    Prints the status of every upload of the run.
+
+    Parameters:
+    results (dict): A mapping of {destination_label: bool}.
+
+    Returns:
+    bool: True if every upload succeeded (and there was at least one).
+    """
+    if not results:
+        print(RED + "=> No files are available or prepared for upload. Skipping." + RESET)
+        return False
+    print("\nUpload summary:")
+    for label, succeeded in results.items():
+        if succeeded:
+            print(GREEN + f"  [OK]     {label}" + RESET)
+        else:
+            print(RED + f"  [FAILED] {label}" + RESET)
+    return all(results.values())
+
+def get_spooled_upload_path(destination, remote_name):
+    """Returns the path of the spool job file of an upload target (one per target)."""
+    return os.path.join(context.spool_folder, re.sub(r"[^\w.-]", "_", f"{destination}-{remote_name}") + ".json")
+
+def read_spooled_upload(job_path):
+    """Returns the spooled upload job stored in `job_path`, or None if there is none."""
+    try:
+        with open(job_path, "r") as job_file:
+            return json.load(job_file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def read_spooled_uploads():
+    """Returns every upload job in the spool, including those whose copy of the file is missing."""
+    jobs = []
+    for name in os.listdir(context.spool_folder):
+        if name.endswith(".json"):
+            job = read_spooled_upload(os.path.join(context.spool_folder, name))
+            if job:
+                jobs.append(job)
+    return jobs
+
+def remove_spooled_artifact(job):
+    """
+    Deletes the spooled copy of the file of an upload job, if it still exists and
+    no other job (e.g. for another destination) refers to it.
+    """
+    with file_lock(os.path.join(context.spool_folder, "artifacts")):
+        if any(other_job.get("artifact") == job["artifact"] for other_job in read_spooled_uploads()):
+            return
+        try:
+            os.remove(os.path.join(context.spool_folder, job["artifact"]))
+        except OSError:
+            pass # Already gone, or still open in a parallel run (see `load_spooled_uploads()`)
+
+def spool_upload(destination, remote_name, artifact):
+    """
+    Writes an upload job and a copy of its file to the upload spool (`context.spool_folder`)
+    after the upload failed, so it can be replayed without converting again. Uploads
+    that succeed never touch the spool; if a run is interrupted, the next run converts
+    and uploads the local files again.
+
+    There is a single job per target: a newer job replaces (coalesces) the older
+    one, whose copy of the file is deleted, so a replay only sends the newest version.
+    The copy is named after the MD5 of the content and shared by the jobs of all
+    destinations of the artifact, so it is written once. The copy and the job are
+    written with `write_file_atomically()`.
+
+    Parameters:
+    destination (str): The name of the destination, e.g. "onedrive".
+    remote_name (str): The name of the file at the destination.
+    artifact (UploadArtifact): The file to upload.
+
+    Returns:
+    dict: The job, or None if it couldn't be spooled.
+    """
+    job_path = get_spooled_upload_path(destination, remote_name)
+    job_id = f"{time.time_ns()}-{os.getpid()}"
+    artifact_name = artifact.hashes["md5"] + os.path.splitext(remote_name)[1]
+    artifact_path = os.path.join(context.spool_folder, artifact_name)
+    try:
+        os.makedirs(context.spool_folder, exist_ok=True)
+    except OSError as e:
+        print(RED + f"=> Error creating upload spool '{context.spool_folder}': {e}" + RESET)
+        return None
+    job = {
+        "id": job_id,
+        "destination": destination,
+        "remote_name": remote_name,
+        "artifact": artifact_name,
+        "spooled_at": datetime.now().isoformat(timespec="seconds")
+    }
+    with file_lock(os.path.join(context.spool_folder, "artifacts")): # Not removed while the job is written
+        if not os.path.exists(artifact_path) and not write_file_atomically(artifact_path, artifact.view):
+            return None
+        with file_lock(job_path):
+            superseded_job = read_spooled_upload(job_path)
+            written = write_file_atomically(job_path, json.dumps(job))
+    if not written:
+        remove_spooled_artifact(job)
+        return None
+    if superseded_job and superseded_job.get("artifact") != artifact_name:
+        remove_spooled_artifact(superseded_job)
+    return job
+
+def complete_spooled_upload(job):
+    """
+    Records that the upload of a spooled job succeeded, by removing the job and its
+    copy of the file from the spool. A job that was superseded by a newer version
+    of the same target in the meantime leaves the newer job in place.
+
+    Parameters:
+    job (dict): The job returned by `spool_upload()` or `load_spooled_uploads()`.
+
+    Returns:
+    None.
+    """
+    job_path = get_spooled_upload_path(job["destination"], job["remote_name"])
+    with file_lock(job_path):
+        current_job = read_spooled_upload(job_path)
+        if current_job and current_job.get("id") == job["id"]:
+            try:
+                os.remove(job_path)
+            except OSError as e:
+                print(RED + f"=> Error removing completed upload '{job_path}' from the spool: {e}" + RESET)
+    remove_spooled_artifact(job)
+
+def load_spooled_uploads():
+    """
+    Loads the pending upload jobs from the upload spool, oldest first.
+
+    Copies of files that no job refers to any more (e.g. because they were still
+    open when their job was superseded) are deleted once they are older than
+    SPOOL_ORPHAN_AGE.
+
+    Parameters:
+    None
+
+    Returns:
+    list: The jobs (see `spool_upload()`), empty if the spool is empty or missing.
+    """
+    if not os.path.isdir(context.spool_folder):
+        return []
+    jobs = [job for job in read_spooled_uploads() if os.path.exists(os.path.join(context.spool_folder, job.get("artifact", "")))]
+    referenced_artifacts = {job["artifact"] for job in jobs}
+    for name in os.listdir(context.spool_folder):
+        artifact_path = os.path.join(context.spool_folder, name)
+        if name.endswith((".json", ".lock", ".tmp")) or name in referenced_artifacts:
+            continue
+        try:
+            if time.time() - os.path.getmtime(artifact_path) > SPOOL_ORPHAN_AGE:
+                os.remove(artifact_path)
+        except OSError:
+            pass
+    return sorted(jobs, key=lambda job: job["id"])
+
+def upload_artifact(destination, remote_name, artifact, google_creds):
+    """
+    Uploads an artifact to a destination, with the OneDrive token fetched when the
+    upload starts (see `get_upload_credentials()`).
+
+    Parameters:
+    destination (UploadDestination): The destination.
+    remote_name (str): The name of the file at the destination.
+    artifact (UploadArtifact): The file to upload.
+    google_creds (google.oauth2.credentials.Credentials): The Google Drive credentials, or None.
+
+    Returns:
+    bool: True if the upload succeeded, False otherwise.
+    """
+    return destination.upload(artifact, remote_name, get_upload_credentials(google_creds))
+
+def spool_failed_uploads(remote_name, artifact, results):
+    """
+    Spools the failed uploads of a fan-out (see `spool_upload()`), so the copy of
+    the file is written once for all of them, and only if one failed. A successful
+    upload removes an older job for the same target left in the spool, so a later
+    replay doesn't overwrite the newer version.
+
+    Parameters:
+    remote_name (str): The name of the file at the destinations.
+    artifact (UploadArtifact): The uploaded file.
+    results (list): The (UploadDestination, bool) pairs of the fan-out.
+
+    Returns:
+    None.
+    """
+    for destination, succeeded in results:
+        if succeeded:
+            superseded_job = read_spooled_upload(get_spooled_upload_path(destination.name, remote_name))
+            if superseded_job:
+                complete_spooled_upload(superseded_job)
+        elif spool_upload(destination.name, remote_name, artifact):
+            print(RED + f'=> Kept {destination.get_label(remote_name)} in the upload spool. It is uploaded by "--replay" or the next run.' + RESET)
+
+def replay_spooled_upload(job, destination, google_creds):
+    """
+    Uploads the spooled copy of the file of an upload job, and removes the job from
+    the spool once it succeeded. The upload is skipped if the file at the destination
+    already matches, e.g. because an earlier replay was interrupted after the upload.
+
+    Parameters:
+    job (dict): The job returned by `load_spooled_uploads()`.
+    destination (UploadDestination): The destination of the job.
+    google_creds (google.oauth2.credentials.Credentials): The Google Drive credentials, or None.
+
+    Returns:
+    bool: True if the upload succeeded (or wasn't needed), False otherwise.
+    """
+    credentials = get_upload_credentials(google_creds)
+    with UploadArtifact(os.path.join(context.spool_folder, job["artifact"])) as artifact:
+        if destination.matches(job["remote_name"], artifact.hashes, credentials):
+            print(GREEN + f'=> {destination.get_label(job["remote_name"])} is already up to date. Skipping upload.' + RESET)
+            succeeded = True
+        else:
+            succeeded = destination.upload(artifact, job["remote_name"], credentials)
+    if succeeded:
+        complete_spooled_upload(job)
+    return succeeded
+
+async def replay_spooled_uploads(google_creds):
+    """
+    Uploads everything left in the upload spool by earlier runs (see `spool_upload()`),
+    without converting again. Jobs whose destination isn't authenticated (or no longer
+    configured) stay in the spool.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          None, or a future resolving
+                                                          to either, which is only
+                                                          awaited if there's a Google
+                                                          Drive job.
+
+    Returns:
+    dict: A mapping of {destination_label: bool}, empty if the spool is empty.
+    """
+    import asyncio
+    jobs = load_spooled_uploads()
+    if not jobs:
+        return {}
+    print(DARK_CYAN + f"\n[Replay {len(jobs)} spooled upload(s) from earlier runs]" + RESET)
+    upload_scheduler = UploadScheduler()
+    if any(getattr(get_destination(job["destination"]), "credentials_key", None) == "google_drive" for job in jobs):
+        google_creds = await resolve_google_creds(google_creds)
+    else:
+        google_creds = None
+    credentials = await asyncio.to_thread(get_upload_credentials, google_creds)
+    results = {}
+    uploads = {} # {destination_label: asyncio.Task}
+    for job in jobs:
+        destination = get_destination(job["destination"])
+        if destination is None:
+            label = f'"{job["remote_name"]}" for destination "{job["destination"]}"'
+            print(RED + f"=> {label} is no longer configured. Keeping it in the upload spool." + RESET)
+            results[label] = False
+            continue
+        label = destination.get_label(job["remote_name"])
+        if not destination.is_available(credentials):
+            print(RED + f"=> Not authenticated for {label}. Keeping it in the upload spool." + RESET)
+            results[label] = False
+            continue
+        uploads[label] = asyncio.create_task(run_upload(upload_scheduler, destination, job["remote_name"],
+                                                        os.path.getsize(os.path.join(context.spool_folder, job["artifact"])),
+                                                        replay_spooled_upload, job, destination, google_creds))
+    results.update(zip(uploads, await asyncio.gather(*uploads.values())))
+    print_upload_summary(results)
+    return results
+
+def replay_uploads():
+    """
+    Runs `--replay`: authenticates with the destinations of the spooled uploads and
+    uploads them (see `replay_spooled_uploads()`), without downloading or converting.
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True if the spool is empty afterwards, False otherwise.
+    """
+    import asyncio
+    jobs = load_spooled_uploads()
+    if not jobs:
+        print(GREEN + "=> The upload spool is empty. Nothing to replay." + RESET)
+        return True
+    context.token_manager.start()
+    google_creds = None
+    credentials_keys = {getattr(get_destination(job["destination"]), "credentials_key", None) for job in jobs}
+    if "onedrive" in credentials_keys:
+        print(DARK_CYAN + "\n[OneDrive Authentication]" + RESET)
+        run_in_stage("onedrive authentication", authenticate_onedrive) # Signs in if needed, the uploads fetch the token
+    if "google_drive" in credentials_keys:
+        print(DARK_CYAN + "\n[Google Drive Authentication]" + RESET)
+        google_creds = run_in_stage("google drive authentication", authenticate_google_drive)
+    results = asyncio.run(replay_spooled_uploads(google_creds))
+    context.token_manager.stop()
+    return all(results.values())
+
+def compute_file_hashes(file_path):
+    """
+    Computes the content hashes the cloud providers report for a local file.
+
+    The file is read once, in HASH_CHUNK_SIZE chunks (see `compute_content_hashes()`).
+
+    Parameters:
+    file_path (str): The path of the file to hash.
+
+    Returns:
+    dict: {"quick_xor_hash": str, "md5": str}.
+    """
+    with open(file_path, "rb") as file_content:
+        return compute_content_hashes(iter(lambda: file_content.read(HASH_CHUNK_SIZE), b""))
+
+def compute_content_hashes(chunks):
+    """
+    Computes the content hashes the cloud providers report, in a single pass over the content:
+    - The OneDrive quickXorHash (160-bit, base64 encoded), as returned by Microsoft Graph.
+    - The MD5 hex digest, as returned by Google Drive in `md5Checksum`.
+
+    quickXorHash XORs byte `i` into a 160-bit register at bit `(i * 11) % 160`, so
+    every byte whose index is congruent modulo 160 lands on the same bit offset.
+    The chunks are therefore folded into a single 160-byte block first and only
+    that block is shifted into the register.
+
+    Parameters:
+    chunks (iterable): The content, as bytes-like chunks whose lengths are multiples
+                       of 160 (except the last one), e.g. of HASH_CHUNK_SIZE.
+
+    Returns:
+    dict: {"quick_xor_hash": str, "md5": str}.
+    """
+    md5 = hashlib.md5()
+    folded_blocks = 0
+    total_length = 0
+    for chunk in chunks:
+        md5.update(chunk)
+        total_length += len(chunk)
+        chunk_view = memoryview(chunk)
+        for block_start in range(0, len(chunk), 160):
+            folded_blocks ^= int.from_bytes(chunk_view[block_start:block_start + 160], "little")
+
+    register = 0
+    register_mask = (1 << 160) - 1
+    for index, byte_value in enumerate(folded_blocks.to_bytes(160, "little")):
+        if byte_value:
+            shift = (index * 11) % 160
+            register ^= ((byte_value << shift) | (byte_value >> (160 - shift))) & register_mask
+    digest = bytearray(register.to_bytes(20, "little"))
+    for index, length_byte in enumerate(total_length.to_bytes(8, "little")):
+        digest[12 + index] ^= length_byte
+
+    return {"quick_xor_hash": base64.b64encode(bytes(digest)).decode(), "md5": md5.hexdigest()}
+
+def load_manifest():
+    """
+    Loads the local manifest of content hashes from `context.manifest_path`.
+
+    The manifest records the hashes of the .docx that was last converted and of
+    the PDFs that were produced from it:
+    {"docx": {...}, "pdf": {...}, "training_pdf": {...}} (see `compute_file_hashes()`).
+
+    Parameters:
+    None
+
+    Returns:
+    dict: The manifest, or an empty dict if it doesn't exist or can't be read.
+    """
+    if not os.path.exists(context.manifest_path):
+        return {}
+    try:
+        with open(context.manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Error reading manifest '{context.manifest_path}': {e}. Ignoring it." + RESET)
+        return {}
+
+def save_manifest(manifest):
+    """
+    Writes the manifest of content hashes to `context.manifest_path`.
+
+    Parameters:
+    manifest (dict): The manifest to save.
+
+    Returns:
+    None.
+    """
+    try:
+        os.makedirs(context.state_folder, exist_ok=True)
+    except OSError as e:
+        print(RED + f"=> Error saving manifest '{context.manifest_path}': {e}" + RESET)
+        return
+    write_file_atomically(context.manifest_path, json.dumps(manifest, indent=4))
+
+def get_onedrive_item_hash(access_token, onedrive_folder, onedrive_filename):
+    """
+    Retrieves the quickXorHash Microsoft Graph reports for a file in OneDrive.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    onedrive_folder (str): The name of the folder in OneDrive containing the file.
+    onedrive_filename (str): The name of the file in OneDrive.
+
+    Returns:
+    str: The base64 quickXorHash, or None if the file doesn't exist or has no hash.
+    """
+    import requests
+    item_url = f"{context.graph_api_url}/me/drive/root:{quote(f'/{onedrive_folder}/{onedrive_filename}')}"
+    try:
+        response = context.graph_batcher.request("GET", item_url, access_token, params={"$select": "file"})
+        if response.status_code != 200:
+            return None
+        return response.json().get("file", {}).get("hashes", {}).get("quickXorHash")
+    except (requests.exceptions.RequestException, json.JSONDecodeError):
+        return None
+
+def get_google_drive_file_md5(google_creds, file_name=GOOGLE_DRIVE_UPLOAD_FILENAME):
+    """
+    Retrieves the md5Checksum Google Drive reports for a file (GOOGLE_DRIVE_UPLOAD_FILENAME
+    by default) in GOOGLE_DRIVE_UPLOAD_FOLDER.
+
+    Uses the cached file ID if it is still valid (a single request), otherwise looks
+    the folder and file up by name and caches their IDs. The cached MD5 is updated
+    with what Google Drive reports (see `upload_to_google_drive()`).
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object.
+    file_name (str): The name of the file in Google Drive.
+
+    Returns:
+    str: The MD5 hex digest, or None if the folder or file doesn't exist.
+    """
+    try:
+        service = get_drive_service(google_creds)
+        drive_ids = load_google_drive_ids(file_name)
+        if drive_ids.get("file_id"):
+            cached_file = get_cached_google_drive_item(service, drive_ids["file_id"], "md5Checksum, trashed, parents")
+            if cached_file and drive_ids["folder_id"] in cached_file.get("parents", []):
+                if cached_file.get("md5Checksum") != drive_ids.get("md5"): # Changed outside of this script
+                    save_google_drive_ids(drive_ids["folder_id"], drive_ids["file_id"], file_name, cached_file.get("md5Checksum"))
+                return cached_file.get("md5Checksum")
+        folder_id = find_google_drive_folder(service, drive_ids, create=False)
+        if not folder_id:
+            return None
+        files = find_google_drive_files(service, folder_id, file_name)
+        save_google_drive_ids(folder_id, files[0]["id"] if files else None, file_name, files[0].get("md5Checksum") if files else None)
+        return files[0].get("md5Checksum") if files else None
+    except Exception as e:
+        print(RED + f"=> Error checking '{file_name}' in Google Drive: {e}" + RESET)
+        return None
+
+def remote_pdfs_match_manifest(google_creds, manifest):
+    """
+    Checks whether the PDFs at every destination are the ones recorded in the manifest.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          or None if Google Drive is skipped.
+    manifest (dict): The manifest loaded with `load_manifest()`.
+
+    Returns:
+    bool: True if every remote PDF matches the manifest, False otherwise.
+    """
+    credentials = get_upload_credentials(google_creds)
+    expected_pdfs = [
+        ("training_pdf", ONEDRIVE_TRAINING_PDF_FILENAME, manifest.get("training_pdf")),
+        ("pdf", GOOGLE_DRIVE_UPLOAD_FILENAME, manifest.get("uploaded_pdf", manifest.get("pdf")))
+    ]
+    for kind, remote_name, hashes in expected_pdfs:
+        for destination in get_destinations():
+            if kind not in destination.artifacts or not destination.is_available(credentials):
+                continue
+            if not hashes or not destination.matches(remote_name, hashes, credentials):
+                return False
+    return True
+
+def clean_local_folder(file_path_to_delete):
+    """
+    Deletes a specified file from the local filesystem.
+
+    Checks if the file exists before attempting deletion. Prints a success message
+    if deleted, or a message if the file does not exist.
+
+    Parameters:
+    file_path_to_delete (str): The absolute or relative path to the file
+                               that should be deleted.
+
+    Returns:
+    None.
+    """
+    file_name_only = os.path.basename(file_path_to_delete)
+    if os.path.exists(file_path_to_delete):
+        try:
+            os.remove(file_path_to_delete)
+            print(GREEN + f'=> Local file "{file_name_only}" deleted successfully from "{os.path.dirname(file_path_to_delete)}"!' + RESET)
+        except OSError as e:
+            print(RED + f'=> Error deleting local file "{file_name_only}": {e}' + RESET)
+    else:
+        print(f'=> Local file "{file_name_only}" does not exist at "{file_path_to_delete}", no need to delete.')
+
+
+async def resolve_google_creds(google_creds):
+    """
+    Returns the Google Drive credentials, waiting for them if they are still being obtained.
+
+    Parameters:
+    google_creds: The credentials, None, or an asyncio future resolving to either.
+
+    Returns:
+    google.oauth2.credentials.Credentials: The credentials, or None.
+    """
+    import asyncio
+    return await google_creds if asyncio.isfuture(google_creds) else google_creds
+
+def convert_document(docx_path=None, pdf_path=None):
+    """
+    Converts a document (`context.docx_path` by default) to PDF (`context.pdf_path`)
+    with the configured converter.
+
+    Parameters:
+    docx_path (str): The document to convert, None for `context.docx_path`.
+    pdf_path (str): The PDF to create, None for `context.pdf_path`.
+
+    Returns:
+    bool: True if the PDF was created, False otherwise.
+    """
+    docx_path = docx_path or context.docx_path
+    pdf_path = pdf_path or context.pdf_path
+    try:
+        get_converter().convert(docx_path, pdf_path)
+        if os.path.exists(pdf_path):
+            print(GREEN + f'=> Converted "{os.path.basename(docx_path)}" to "{os.path.basename(pdf_path)}" successfully!' + RESET)
+            return True
+        print(RED + f"=> Conversion reported success, but PDF file '{pdf_path}' was not found. Check conversion tool." + RESET)
+    except Exception as e:
+        print(RED + f"=> Error during DOCX to PDF conversion of '{os.path.basename(docx_path)}': {e}" + RESET)
+        print(RED + "Attempting to proceed with uploads, but PDF-related parts might fail or use stale/missing data." + RESET)
+    return False
+
+def extract_training_pdf(pdf_path=None, training_pdf_path=None):
+    """
+    Extracts the pages of "Training.pdf" (context.training_pdf_pages) from the converted PDF.
+
+    Parameters:
+    pdf_path (str): The converted PDF, None for `context.pdf_path`.
+    training_pdf_path (str): The PDF to create, None for `context.training_pdf_path`.
+
+    Returns:
+    bool: True if the training PDF is ready to be uploaded, False otherwise.
+    """
+    pdf_path = pdf_path or context.pdf_path
+    training_pdf_path = training_pdf_path or context.training_pdf_path
+    if not os.path.exists(pdf_path):
+        print(RED + f'=> "{os.path.basename(pdf_path)}" not found. Cannot create "{os.path.basename(training_pdf_path)}" for OneDrive upload.' + RESET)
+        return False
+    return extract_pdf_pages(pdf_path, training_pdf_path) and os.path.exists(training_pdf_path)
+
+def downsample_pdf_images(page, max_image_dpi):
+    """
+    Downsamples the images of a PDF page whose resolution exceeds `max_image_dpi`.
+
+    The resolution is estimated from the image width and the page width, i.e. for
+    an image spanning the whole page, so an image is never reduced below
+    `max_image_dpi` where it is shown. Needs Pillow (pip install pypdf[image]).
+
+    Parameters:
+    page (pypdf.PageObject): A page of a `PdfWriter`.
+    max_image_dpi (int): The highest resolution to keep.
+
+    Returns:
+    int: The number of downsampled images.
+    """
+    page_width_inches = float(page.mediabox.width) / 72
+    downsampled_count = 0
+    for image_file in page.images:
+        try:
+            image = image_file.image
+            image_dpi = image.width / page_width_inches
+            if image_dpi <= max_image_dpi:
+                continue
+            scale = max_image_dpi / image_dpi
+            image_file.replace(image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale)))), quality=85)
+            downsampled_count += 1
+        except Exception as e: # Image formats Pillow can't decode are kept as they are
+            print(f'=> Keeping image "{image_file.name}" as it is: {e}')
+    return downsampled_count
+
+def optimize_pdf(pdf_path=None, optimized_pdf_path=None):
+    """
+    Writes a smaller copy of the converted PDF for the uploads, if "pdf_optimization"
+    is enabled in the configuration. The converted PDF itself is kept.
+
+    Content streams are compressed, images above `context.pdf_max_image_dpi` are
+    downsampled (if Pillow is installed) and identical objects, such as fonts
+    embedded once per section, are stored once (if the installed pypdf provides
+    `PdfWriter.compress_identical_objects()`). The sizes before and after are
+    recorded in the run report.
+
+    Parameters:
+    pdf_path (str): The converted PDF, None for `context.pdf_path`.
+    optimized_pdf_path (str): The PDF to create, None for `context.optimized_pdf_path`.
+
+    Returns:
+    str: The PDF to upload: `optimized_pdf_path`, or `pdf_path` if optimization is
+         disabled, failed or didn't make the PDF smaller.
+    """
+    pdf_path = pdf_path or context.pdf_path
+    optimized_pdf_path = optimized_pdf_path or context.optimized_pdf_path
+    if not context.pdf_optimization or not os.path.exists(pdf_path):
+        return pdf_path
+    from pypdf import PdfWriter
+    temporary_path = optimized_pdf_path + ".tmp"
+    try:
+        writer = PdfWriter(clone_from=pdf_path)
+        downsampled_count = 0
+        downsample_images = context.pdf_max_image_dpi and importlib.util.find_spec("PIL") is not None
+        for page in writer.pages:
+            page.compress_content_streams(level=9)
+            if downsample_images:
+                downsampled_count += downsample_pdf_images(page, context.pdf_max_image_dpi)
+        if hasattr(writer, "compress_identical_objects"):
+            writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+        with open(temporary_path, "wb") as optimized_pdf:
+            writer.write(optimized_pdf)
+        os.replace(temporary_path, optimized_pdf_path)
+    except Exception as e:
+        print(RED + f'=> Error optimizing "{os.path.basename(pdf_path)}", uploading it as it is: {e}' + RESET)
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return pdf_path
+
+    original_size, optimized_size = os.path.getsize(pdf_path), os.path.getsize(optimized_pdf_path)
+    run_metrics.record_artifact(os.path.basename(pdf_path), original_size, optimized_size)
+    if optimized_size >= original_size:
+        print(f'=> "{os.path.basename(pdf_path)}" is already compact ({format_byte_count(original_size)}). Uploading it as it is.')
+        clean_local_folder(optimized_pdf_path)
+        return pdf_path
+    print(GREEN + f'=> Optimized "{os.path.basename(pdf_path)}" from {format_byte_count(original_size)} to {format_byte_count(optimized_size)} '
+          f'({1 - optimized_size / original_size:.0%} smaller, {downsampled_count} image(s) downsampled).' + RESET)
+    return optimized_pdf_path
+
+async def process_document_async(google_creds):
+    """
+    Converts the edited document to PDF and uploads all artifacts, as an asyncio pipeline.
+
+    Every step runs in a worker thread and starts as soon as the step it depends
+    on is done, instead of after all previous steps:
+    - The .docx upload (to OneDrive by default) starts right after change detection
+      and runs while the document is converted.
+    - The PDF upload (to Google Drive by default) starts right after the conversion and
+      runs while "Training.pdf" is extracted, whose upload follows the extraction.
+    Each file is uploaded to all of its destinations at once (see `fan_out_upload()`).
+
+    The conversion is skipped if the document hasn't changed since the last
+    conversion (see `load_manifest()`), and the PDF uploads are skipped as well
+    if the PDFs in the cloud are still the ones produced from it. A failed upload
+    is spooled (see `spool_failed_uploads()`) and replayed by `--replay` or the next
+    run without converting again. The stages fetch the
+    OneDrive token when they start (see `get_onedrive_access_token()`).
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          None to skip Google Drive,
+                                                          or a future resolving to either
+                                                          (e.g. a still running
+                                                          authentication), which is only
+                                                          awaited once Google Drive is needed.
+
+    Returns:
+    bool: True if every upload succeeded, False otherwise.
+    """
+    import asyncio
+    # Convert DOCX to PDF (skipped if the document hasn't changed since the last conversion)
+    print(DARK_CYAN + '\n[Convert ".docx" to ".pdf"]' + RESET)
+    if not os.path.exists(context.docx_path):
+        print(RED + f"=> Document '{context.docx_path}' not found. Cannot convert to PDF." + RESET)
+        return False
+    conversion_needed = True
+    pdf_uploads_needed = True
+    manifest = load_manifest()
+    docx_hashes = await run_stage("change detection", compute_file_hashes, context.docx_path)
+    revisions = [asyncio.create_task(run_stage("version history", record_revision, context.docx_path))]
+    if manifest.get("docx") == docx_hashes:
+        if os.path.exists(context.pdf_path) and await run_stage("change detection", compute_file_hashes, context.pdf_path) == manifest.get("pdf"):
+            print(GREEN + f'=> "{os.path.basename(context.docx_path)}" is unchanged since the last conversion. Reusing "{os.path.basename(context.pdf_path)}".' + RESET)
+            conversion_needed = False
+        elif await run_stage("change detection", remote_pdfs_match_manifest, await resolve_google_creds(google_creds), manifest):
+            print(GREEN + f'=> "{os.path.basename(context.docx_path)}" is unchanged and the PDFs in the cloud are up to date. Skipping conversion and PDF uploads.' + RESET)
+            conversion_needed = False
+            pdf_uploads_needed = False
+
+    # Upload the .docx while the PDFs are produced
+    upload_scheduler = UploadScheduler()
+    uploads = [asyncio.create_task(fan_out_upload(upload_scheduler, "docx", FILE_TO_DOWNLOAD_AND_EDIT, context.docx_path,
+                                                  google_creds))]
+
+    if conversion_needed and await run_stage("conversion", convert_document):
+        manifest = {"docx": docx_hashes, "pdf": await run_stage("conversion", compute_file_hashes, context.pdf_path)}
+        revisions.append(asyncio.create_task(run_stage("version history", record_revision, context.pdf_path)))
+
+    if pdf_uploads_needed:
+        # Extract the pages of "Training.pdf" while the PDF is uploaded
+        print(DARK_CYAN + f'\n[Create "{ONEDRIVE_TRAINING_PDF_FILENAME}" and upload the PDFs]' + RESET)
+        upload_pdf_path = await run_stage("pdf optimization", optimize_pdf)
+        extraction = asyncio.create_task(run_stage("page extraction", extract_training_pdf, upload_pdf_path))
+        if os.path.exists(upload_pdf_path):
+            uploads.append(asyncio.create_task(fan_out_upload(upload_scheduler, "pdf", GOOGLE_DRIVE_UPLOAD_FILENAME, upload_pdf_path,
+                                                              google_creds)))
+        else:
+            print(RED + f"=> Local file '{context.pdf_path}' (for upload as '{GOOGLE_DRIVE_UPLOAD_FILENAME}') not found. Skipping upload." + RESET)
+        if await extraction:
+            uploads.append(asyncio.create_task(fan_out_upload(upload_scheduler, "training_pdf", ONEDRIVE_TRAINING_PDF_FILENAME, context.training_pdf_path,
+                                                              google_creds)))
+
+    results = {label: succeeded for fan_out_results in await asyncio.gather(*uploads) for label, succeeded in fan_out_results.items()}
+    await asyncio.gather(*revisions)
+    uploads_succeeded = print_upload_summary(results)
+    if not uploads_succeeded:
+        print(RED + "=> Warning: One or more uploads failed. See the upload summary above." + RESET)
+    if pdf_uploads_needed and manifest.get("docx") == docx_hashes:
+        if os.path.exists(context.training_pdf_path):
+            manifest["training_pdf"] = await run_stage("manifest", compute_file_hashes, context.training_pdf_path)
+        if upload_pdf_path != context.pdf_path and os.path.exists(upload_pdf_path): # The destinations have the optimized PDF
+            manifest["uploaded_pdf"] = await run_stage("manifest", compute_file_hashes, upload_pdf_path)
+        else:
+            manifest.pop("uploaded_pdf", None)
+        await run_stage("manifest", save_manifest, manifest)
+    return uploads_succeeded
+
+def process_document(google_creds):
+    """
+    Runs `process_document_async()` on its own event loop, for synchronous callers
+    such as `watch_document()`.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          or None to skip Google Drive.
+
+    Returns:
+    bool: True if every upload succeeded, False otherwise.
+    """
+    import asyncio
+    return asyncio.run(process_document_async(google_creds))
+
+
+def get_file_signature(file_path):
+    """
+    Returns a cheap signature of a file that changes whenever the file is written.
+
+    Parameters:
+    file_path (str): The path of the file.
+
+    Returns:
+    tuple: (modification time in ns, size), or None if the file doesn't exist.
+    """
+    try:
+        file_stat = os.stat(file_path)
+        return file_stat.st_mtime_ns, file_stat.st_size
+    except OSError:
+        return None
+
+def watch_document(google_creds, poll_interval=WATCH_POLL_INTERVAL, debounce_seconds=WATCH_DEBOUNCE_SECONDS):
+    """
+    Watches the document in `context.training_folder` and converts and uploads it after every save.
+
+    The document is polled every `poll_interval` seconds. Once a write is seen,
+    the document has to stay unchanged for `debounce_seconds` (editors often write
+    a file several times in quick succession while saving) and be readable before
+    `process_document()` runs for that save. Runs until interrupted with Ctrl+C.
+
+    The document was deleted from OneDrive when it was downloaded, so it's uploaded
+    again when watching stops: processed if a save wasn't processed yet, and
+    otherwise just uploaded if no save was seen at all.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          or None to skip Google Drive.
+    poll_interval (float): Seconds between checks of the document.
+    debounce_seconds (float): Seconds the document must stay unchanged after a write.
+
+    Returns:
+    None.
+    """
+    print(GREEN + f'=> Watching "{context.docx_path}" for saves. Press Ctrl+C to stop watching.' + RESET)
+    last_processed_signature = get_file_signature(context.docx_path)
+    processed = False
+    try:
+        while True:
+            time.sleep(poll_interval)
+            signature = get_file_signature(context.docx_path)
+            if signature is None or signature == last_processed_signature:
+                continue
+
+            stable_since = time.monotonic()
+            while time.monotonic() - stable_since < debounce_seconds:
+                time.sleep(poll_interval)
+                current_signature = get_file_signature(context.docx_path)
+                if current_signature != signature:
+                    signature = current_signature
+                    stable_since = time.monotonic()
+            if signature is None:
+                continue
+            try:
+                with open(context.docx_path, "rb"):
+                    pass
+            except OSError:
+                continue # Still locked by the editor, try again on the next poll
+
+            print(DARK_CYAN + f'\n[Save detected at {datetime.now():%H:%M:%S}]' + RESET)
+            if not authenticate_onedrive(): # From the token cache, kept fresh in the background while watching
+                print(RED + "=> Failed to authenticate with OneDrive. Skipping this save." + RESET)
+            elif process_document(google_creds):
+                print(GREEN + f"=> Backup of the save from {datetime.now():%H:%M:%S} completed!" + RESET)
+            last_processed_signature = signature
+            processed = True
+    except KeyboardInterrupt:
+        print(GREEN + "\n=> Stopped watching." + RESET)
+
+    if get_file_signature(context.docx_path) not in (None, last_processed_signature):
+        print(DARK_CYAN + "\n[Back up the last save]" + RESET)
+        process_document(google_creds)
+    elif not processed and os.path.exists(context.docx_path):
+        print(DARK_CYAN + f'\n[Upload "{FILE_TO_DOWNLOAD_AND_EDIT}" (no save while watching)]' + RESET)
+        upload_document(google_creds)
+
+def upload_document(google_creds):
+    """
+    Uploads the edited document to its destinations without converting it, e.g.
+    when watch mode stops before the first save.
+
+    Parameters:
+    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
+                                                          Drive credentials object,
+                                                          or None to skip Google Drive.
+
+    Returns:
+    bool: True if every upload succeeded, False otherwise.
+    """
+    import asyncio
+
+    async def upload():
+        return await fan_out_upload(UploadScheduler(), "docx", FILE_TO_DOWNLOAD_AND_EDIT, context.docx_path, google_creds)
+
+    return print_upload_summary(asyncio.run(upload()))
+
+def list_batch_documents(access_token):
+    """
+    Lists the documents in ONEDRIVE_TARGET_FOLDER that match `context.batch_documents`.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+
+    Returns:
+    list: The sorted names of the matching .docx files, or None if the folder
+          couldn't be listed.
+    """
+    import requests
+    patterns = [pattern.lower() for pattern in context.batch_documents]
+    children_url = f"{context.graph_api_url}/me/drive/root:{quote(f'/{ONEDRIVE_TARGET_FOLDER}')}:/children"
+    params = {"$select": "name,file", "$top": 200}
+    document_names = []
+    try:
+        while children_url:
+            response = context.graph_client.get(children_url, access_token=access_token, params=params)
+            if response.status_code != 200:
+                print(RED + f'=> Error listing OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {response.status_code} {response.text}' + RESET)
+                return None
+            listing = response.json()
+            for item in listing.get("value", []):
+                name = item.get("name", "")
+                if "file" in item and name.lower().endswith(".docx") and any(fnmatch.fnmatchcase(name.lower(), pattern) for pattern in patterns):
+                    document_names.append(name)
+            children_url, params = listing.get("@odata.nextLink"), None # The next link already carries the query
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        print(RED + f'=> Error listing OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {e}' + RESET)
+        return None
+    return sorted(document_names, key=str.lower)
+
+def get_batch_document(document_name):
+    """
+    Returns the local paths and remote names of a batch document.
+
+    A document "Name.docx" is converted to "Name.pdf" (uploaded to Google Drive) and
+    its training pages are uploaded to OneDrive as "Name Training.pdf". All local
+    files live in `context.batch_folder`.
+
+    Parameters:
+    document_name (str): The name of the document in ONEDRIVE_TARGET_FOLDER.
+
+    Returns:
+    dict: {"name", "docx_path", "pdf_name", "pdf_path", "training_pdf_name", "training_pdf_path"}.
+    """
+    stem = os.path.splitext(document_name)[0]
+    pdf_name = stem + ".pdf"
+    training_pdf_name = f"{stem} {ONEDRIVE_TRAINING_PDF_FILENAME}"
+    return {
+        "name": document_name,
+        "docx_path": os.path.join(context.batch_folder, document_name),
+        "pdf_name": pdf_name,
+        "pdf_path": os.path.join(context.batch_folder, pdf_name),
+        "training_pdf_name": training_pdf_name,
+        "training_pdf_path": os.path.join(context.batch_folder, training_pdf_name)
+    }
+
+def load_batch_manifest():
+    """
+    Loads the hashes of the batch documents that were last backed up completely
+    from `context.batch_manifest_path`.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: A mapping of {document_name: hashes} (see `compute_file_hashes()`), empty
+          if the manifest doesn't exist or can't be read.
+    """
+    if not os.path.exists(context.batch_manifest_path):
+        return {}
+    try:
+        with open(context.batch_manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Error reading batch manifest '{context.batch_manifest_path}': {e}. Ignoring it." + RESET)
+        return {}
+
+def get_batch_worker_count(document_count):
+    """
+    Returns the number of conversion processes for a batch: `context.batch_workers`,
+    but no more than there are documents, and a single one if the converter drives
+    the user's application (see `Docx2PdfConverter`), where parallel conversions
+    would interrupt each other.
+
+    Parameters:
+    document_count (int): The number of documents in the batch.
+
+    Returns:
+    int: The number of worker processes.
+    """
+    if getattr(get_converter(), "shares_user_application", False):
+        return 1
+    return max(1, min(context.batch_workers, document_count))
+
+def init_batch_worker(worker_counter):
+    """
+    Initializes a worker process of the batch conversion pool.
+
+    Every worker keeps its own converter warm for all the documents it converts.
+    A LibreOffice listener gets its own port and profile, so the listeners of the
+    workers run side by side, and Microsoft Word runs as a private instance per
+    conversion. The converter is closed when the worker exits.
+
+    Parameters:
+    worker_counter (multiprocessing.Value): Counts the started workers, to number them.
+
+    Returns:
+    None.
+    """
+    import multiprocessing.util
+    with worker_counter.get_lock():
+        worker_counter.value += 1
+        worker_number = worker_counter.value
+    converter = get_converter()
+    if isinstance(converter, LibreOfficeConverter):
+        converter.port = context.unoserver_port + worker_number
+        converter.isolated_listener = True
+    multiprocessing.util.Finalize(None, converter.close, exitpriority=10) # atexit handlers don't run in pool workers
+
+def convert_batch_document(docx_path, pdf_path, training_pdf_path):
+    """
+    Converts a batch document to PDF and extracts its training pages. Runs in a
+    worker process of the batch conversion pool.
+
+    Parameters:
+    docx_path (str): The document.
+    pdf_path (str): The PDF to create.
+    training_pdf_path (str): The training PDF to create.
+
+    Returns:
+    bool: True if both PDFs were created, False otherwise.
+    """
+    return convert_document(docx_path, pdf_path) and extract_training_pdf(pdf_path, training_pdf_path)
+
+async def process_batch_document(document, google_drive_auth, conversion_pool, download_semaphore, upload_scheduler, manifest):
+    """
+    Downloads, converts and uploads a single batch document.
+
+    The downloads are limited by `download_semaphore`, the uploads of all documents
+    share `upload_scheduler` (so the training pages of every document go before the
+    other PDFs), and the conversion runs in `conversion_pool`. A document whose
+    hashes match the batch manifest was backed up completely before and is skipped
+    after the download (which itself is skipped if the local copy is current).
+
+    Parameters:
+    document (dict): The document, see `get_batch_document()`, with the "item_metadata"
+                     looked up by `get_onedrive_items_metadata()` (or None).
+    google_drive_auth: The Google Drive credentials, None, or a future resolving to either.
+    conversion_pool (concurrent.futures.ProcessPoolExecutor): The conversion processes.
+    download_semaphore (asyncio.Semaphore): Limits the downloads running at the same time.
+    upload_scheduler (UploadScheduler): Limits and orders the uploads running at the same time.
+    manifest (dict): The batch manifest, updated once the document was backed up completely.
+
+    Returns:
+    dict: A mapping of {destination_label: bool} (or a failed download or conversion),
+          empty if the document was unchanged.
+    """
+    import asyncio
+    name = document["name"]
+    async with download_semaphore:
+        downloaded = await run_stage(f"download {name}", download_file_from_onedrive,
+                                     get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, name, document["docx_path"],
+                                     None, document.get("item_metadata"))
+    if not downloaded:
+        return {f'Download of "{ONEDRIVE_TARGET_FOLDER}/{name}"': False}
+    docx_hashes = await run_stage("change detection", compute_file_hashes, document["docx_path"])
+    if manifest.get(name) == docx_hashes:
+        print(GREEN + f'=> "{name}" is unchanged since its last backup. Skipping it.' + RESET)
+        return {}
+
+    started = time.monotonic()
+    try: # Awaited without a worker thread, so waiting conversions don't hold up downloads and uploads
+        converted = await asyncio.wrap_future(conversion_pool.submit(
+            convert_batch_document, document["docx_path"], document["pdf_path"], document["training_pdf_path"]))
+    except Exception as e:
+        print(RED + f'=> Error converting "{name}" in the conversion pool: {e}' + RESET)
+        converted = False
+    run_metrics.record_stage(f"conversion {name}", started, "ok" if converted else "error")
+    if not converted:
+        return {f'Conversion of "{name}"': False}
+
+    fan_out_results = await asyncio.gather(
+        fan_out_upload(upload_scheduler, "training_pdf", document["training_pdf_name"], document["training_pdf_path"], google_drive_auth),
+        fan_out_upload(upload_scheduler, "pdf", document["pdf_name"], document["pdf_path"], google_drive_auth))
+    results = {**fan_out_results[0], **fan_out_results[1]}
+    if all(results.values()):
+        manifest[name] = docx_hashes
+        write_file_atomically(context.batch_manifest_path, json.dumps(manifest, indent=4))
+    return results
+
+async def run_batch_pipeline():
+    """
+    Backs up every document in ONEDRIVE_TARGET_FOLDER that matches the
+    "batch_documents" names or glob patterns of the configuration (`--batch`).
+
+    Unlike a normal run, the documents are neither edited nor deleted from OneDrive:
+    every document is downloaded, converted to PDF and its training pages extracted,
+    and the training PDF is uploaded to OneDrive and the full PDF to Google Drive
+    (see `get_batch_document()` for the names). Each document moves on as soon as
+    its previous step is done: up to UPLOAD_MAX_WORKERS downloads and uploads run
+    at the same time and `context.batch_workers` processes convert in parallel, so
+    the batch takes about as long as its slowest documents.
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True if every document was backed up (or unchanged), False otherwise.
+    """
+    import asyncio
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    if not context.batch_documents:
+        print(RED + '=> No "batch_documents" configured for this host. Add a list of document names or glob patterns, e.g. ["*2026.docx"].' + RESET)
+        return False
+    context.token_manager.start()
+
+    print(DARK_CYAN + "\n[OneDrive Authentication]" + RESET)
+    if not await run_stage("onedrive authentication", authenticate_onedrive):
+        print(RED + "=> Critical: Failed to authenticate with OneDrive. Exiting script." + RESET)
+        return False
+    google_drive_auth = asyncio.create_task(run_stage("google drive authentication", authenticate_google_drive))
+    await replay_spooled_uploads(google_drive_auth)
+
+    print(DARK_CYAN + f'\n[Back up the documents in "{ONEDRIVE_TARGET_FOLDER}" matching {", ".join(context.batch_documents)}]' + RESET)
+    document_names = await run_stage("batch listing", list_batch_documents, get_onedrive_access_token())
+    if not document_names:
+        if document_names is not None:
+            print(RED + "=> No documents match the configured batch_documents." + RESET)
+        return False
+    print(f"=> {len(document_names)} document(s): {', '.join(document_names)}")
+    os.makedirs(context.batch_folder, exist_ok=True)
+    os.makedirs(context.state_folder, exist_ok=True)
+
+    manifest = load_batch_manifest()
+    worker_count = get_batch_worker_count(len(document_names))
+    download_semaphore = asyncio.Semaphore(UPLOAD_MAX_WORKERS)
+    upload_scheduler = UploadScheduler()
+    documents = [get_batch_document(name) for name in document_names]
+    items_metadata = await run_stage("batch metadata", get_onedrive_items_metadata, get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, document_names)
+    for document in documents:
+        document["item_metadata"] = items_metadata.get(document["name"])
+    with ProcessPoolExecutor(max_workers=worker_count, initializer=init_batch_worker, initargs=(multiprocessing.Value("i", 0),)) as conversion_pool:
+        document_results = await asyncio.gather(*(
+            process_batch_document(document, google_drive_auth, conversion_pool, download_semaphore, upload_scheduler, manifest)
+            for document in documents
+        ))
+    results = {label: succeeded for document_result in document_results for label, succeeded in document_result.items()}
+    if not await google_drive_auth and needs_credentials("google_drive"):
+        print(RED + "=> Google Drive was skipped due to authentication failure." + RESET)
+
+    print(DARK_CYAN + "\n[Clean up local temporary files]" + RESET)
+    with run_metrics.stage("cleanup"):
+        for document in documents:
+            for file_path in (document["pdf_path"], document["training_pdf_path"]):
+                if os.path.exists(file_path):
+                    clean_local_folder(file_path)
+    context.token_manager.stop()
+
+    if not results:
+        print(GREEN + "=> Every document is unchanged since its last backup. Nothing to upload." + RESET)
+        return True
+    return print_upload_summary(results)
+
+def run_batch():
+    """
+    Runs `--batch` (see `run_batch_pipeline()`).
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True if every document was backed up (or unchanged), False otherwise.
+    """
+    import asyncio
+    return asyncio.run(run_batch_pipeline())
+
+def load_sync_state():
+    """
+    Loads the state of `--sync`: the delta link of the last sync, the folders of
+    ONEDRIVE_TARGET_FOLDER and the files it mirrored, all keyed by their item ID.
+
+    Parameters:
+    None
+
+    Returns:
+    dict: {"folder": str, "delta_link": str or None, "root_id": str or None,
+           "folders": {item_id: {"name", "parent_id"}},
+           "items": {item_id: {"name", "parent_id", "path", "eTag", "cTag", "size", ...}}}.
+          A fresh state if there's none yet, it can't be read or it belongs to another
+          folder. A state without folders (from an older version) keeps its files but
+          starts with a full sync.
+    """
+    fresh_state = {"folder": ONEDRIVE_TARGET_FOLDER, "delta_link": None, "root_id": None, "folders": {}, "items": {}}
+    try:
+        with open(context.sync_state_path, "r") as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError:
+        return fresh_state
+    except (OSError, json.JSONDecodeError) as e:
+        print(RED + f"=> Could not read the sync state ({e}). Starting a full sync." + RESET)
+        return fresh_state
+    if state.get("folder") != ONEDRIVE_TARGET_FOLDER:
+        return fresh_state
+    if "folders" not in state:
+        return {**fresh_state, "items": state.get("items", {})}
+    return state
+
+def get_sync_relative_path(state, parent_id, name):
+    """
+    Returns the path of an item relative to ONEDRIVE_TARGET_FOLDER.
+
+    Delta responses don't carry the path of an item (and a renamed folder doesn't
+    list its descendants), so the path is resolved from the item's parent ID and
+    the folders of the sync state, up to the folder itself.
+
+    Parameters:
+    state (dict): The sync state, see `load_sync_state()`.
+    parent_id (str): The ID of the item's parent folder.
+    name (str): The name of the item.
+
+    Returns:
+    str: The relative path with "/" separators, e.g. "Old/Program2025.docx", or None
+         for items outside of the folder (or below a folder that isn't known).
+    """
+    names = [name]
+    visited_ids = set()
+    while parent_id != state["root_id"]:
+        folder = state["folders"].get(parent_id)
+        if folder is None or parent_id in visited_ids:
+            return None
+        visited_ids.add(parent_id)
+        names.append(folder["name"])
+        parent_id = folder["parent_id"]
+    return "/".join(reversed(names))
+
+def get_onedrive_folder_id(access_token):
+    """
+    Looks up the item ID of ONEDRIVE_TARGET_FOLDER, the root of the paths of `--sync`.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+
+    Returns:
+    str: The item ID, or None if it couldn't be looked up.
+    """
+    import requests
+    folder_url = f"{context.graph_api_url}/me/drive/root:{quote(f'/{ONEDRIVE_TARGET_FOLDER}')}"
+    try:
+        response = context.graph_batcher.request("GET", folder_url, access_token, params={"$select": "id"})
+        if response.status_code == 200:
+            return response.json()["id"]
+        print(RED + f'=> Error looking up OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {response.status_code} {response.text}' + RESET)
+    except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
+        print(RED + f'=> Error looking up OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {e}' + RESET)
+    return None
+
+def get_mirrored_file_path(relative_path):
+    """
+    Returns the local path of a mirrored file in `context.sync_folder`.
+
+    Parameters:
+    relative_path (str): The path relative to ONEDRIVE_TARGET_FOLDER.
+
+    Returns:
+    str: The full local path.
+    """
+    return os.path.join(context.sync_folder, *relative_path.split("/"))
+
+def is_mirrored_file_changed(entry):
+    """
+    Checks whether a mirrored file was changed locally since the sync last wrote it.
+
+    A file with the size and modification time recorded by the last sync is
+    unchanged. Otherwise its MD5 is compared with the recorded one, so a file that
+    was only touched isn't reported.
+
+    Parameters:
+    entry (dict): The file's entry in the sync state.
+
+    Returns:
+    bool: True if the local file differs from the last synced version (or the sync
+          never wrote it), False if it's unchanged or missing.
+    """
+    local_path = get_mirrored_file_path(entry["path"])
+    try:
+        local_stat = os.stat(local_path)
+        if local_stat.st_size == entry.get("local_size") and local_stat.st_mtime_ns == entry.get("local_mtime_ns"):
+            return False
+        return "md5" not in entry or compute_file_hashes(local_path)["md5"] != entry["md5"]
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True # Rather keep a file that can't be read than replace it
+
+def record_mirrored_file(entry):
+    """
+    Records the size, modification time and MD5 of a file the sync just wrote,
+    see `is_mirrored_file_changed()`.
+
+    Parameters:
+    entry (dict): The file's entry in the sync state, updated in place.
+
+    Returns:
+    None
+    """
+    local_path = get_mirrored_file_path(entry["path"])
+    try:
+        local_stat = os.stat(local_path)
+        entry.update({"local_size": local_stat.st_size, "local_mtime_ns": local_stat.st_mtime_ns,
+                      "md5": compute_file_hashes(local_path)["md5"]})
+    except OSError as e:
+        print(RED + f'=> Error reading "{local_path}": {e}' + RESET)
+
+def remove_mirrored_file(entry):
+    """
+    Removes a mirrored file and its download cache from `context.sync_folder`.
+
+    A file that was changed locally since the last sync is kept (a conflict).
+
+    Parameters:
+    entry (dict): The file's entry in the sync state.
+
+    Returns:
+    bool: False if the file was kept because it was changed locally, True otherwise.
+    """
+    if "path" not in entry: # Never mirrored
+        return True
+    if is_mirrored_file_changed(entry):
+        print(RED + f'=> Conflict: "{entry["path"]}" was deleted from OneDrive but changed locally. Keeping the local file.' + RESET)
+        return False
+    local_path = get_mirrored_file_path(entry["path"])
+    for file_path in (local_path, get_download_cache_path(local_path)):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(RED + f'=> Error removing "{file_path}": {e}' + RESET)
+            return True
+    print(GREEN + f'=> Removed "{entry["path"]}", which was deleted from OneDrive.' + RESET)
+    return True
+
+def fetch_onedrive_changes(access_token, delta_link):
+    """
+    Requests the changes to ONEDRIVE_TARGET_FOLDER from the Microsoft Graph delta endpoint.
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+    delta_link (str): The delta link of the last sync, None to enumerate the whole folder.
+
+    Returns:
+    tuple: (changes, delta_link). `changes` is the list of changed driveItems and
+           `delta_link` the link for the next sync. (None, None) if the changes
+           couldn't be requested, and (None, "") if the delta link expired and a
+           full sync is needed.
+    """
+    import requests
+    if delta_link:
+        url, params = delta_link, None # The delta link already carries the query
+    else:
+        url = f"{context.graph_api_url}/me/drive/root:{quote(f'/{ONEDRIVE_TARGET_FOLDER}')}:/delta"
+        params = {"$select": "id,name,eTag,cTag,size,file,folder,deleted,parentReference"}
+    changes = []
+    try:
+        while url:
+            response = context.graph_client.get(url, access_token=access_token, params=params)
+            if response.status_code == 410: # The delta link expired (resyncRequired)
+                print(f'=> The last sync of "{ONEDRIVE_TARGET_FOLDER}" is too old for incremental changes. Starting a full sync.')
+                return None, ""
+            if response.status_code != 200:
+                print(RED + f'=> Error requesting changes of OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {response.status_code} {response.text}' + RESET)
+                return None, None
+            page = response.json()
+            changes.extend(page.get("value", []))
+            url, params = page.get("@odata.nextLink"), None
+            delta_link = page.get("@odata.deltaLink", delta_link)
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        print(RED + f'=> Error requesting changes of OneDrive folder "{ONEDRIVE_TARGET_FOLDER}": {e}' + RESET)
+        return None, None
+    return changes, delta_link
+
+def sync_onedrive_folder(access_token):
+    """
+    Mirrors ONEDRIVE_TARGET_FOLDER (including subfolders) into `context.sync_folder`
+    using the Microsoft Graph delta endpoint.
+
+    The first sync looks up the ID of the folder and enumerates it. Every later
+    sync sends the stored delta link and only receives the items changed since, so
+    an unchanged folder costs a single small request. Items are tracked by ID and
+    their paths resolved through their parent IDs (see `get_sync_relative_path()`).
+    Changed files are downloaded (skipped if the local copy is already current),
+    moved and renamed files (and the files of renamed folders) are moved locally and
+    deleted files are removed locally. Mirrored files that are missing locally are
+    downloaded again. A mirrored file that was changed locally since the last sync
+    is never replaced or removed, it's reported as a conflict instead (and so is a
+    local file the sync didn't create).
+
+    Parameters:
+    access_token (str): The valid OneDrive access token.
+
+    Returns:
+    bool: True if the mirror is current, False otherwise (including conflicts).
+    """
+    state = load_sync_state()
+    changes, delta_link = fetch_onedrive_changes(access_token, state["delta_link"])
+    if changes is None and delta_link == "":
+        state["delta_link"] = None
+        changes, delta_link = fetch_onedrive_changes(access_token, None)
+    if changes is None:
+        return False
+    full_sync = not state["delta_link"]
+    if full_sync or not state["root_id"]:
+        state["root_id"] = get_onedrive_folder_id(access_token)
+        if not state["root_id"]:
+            return False
+    folders, items = state["folders"], state["items"]
+    seen_ids = set()
+    conflicts = []
+    for item in changes:
+        item_id = item.get("id")
+        seen_ids.add(item_id)
+        if "deleted" in item:
+            folders.pop(item_id, None) # Its files are removed below, once their path can't be resolved any more
+            entry = items.pop(item_id, None)
+            if entry and not remove_mirrored_file(entry):
+                conflicts.append(entry["path"])
+            continue
+        if item_id == state["root_id"] or "name" not in item:
+            continue
+        parent_id = item.get("parentReference", {}).get("id")
+        if "folder" in item:
+            folders[item_id] = {"name": item["name"], "parent_id": parent_id}
+        elif "file" in item:
+            items.setdefault(item_id, {}).update({"name": item["name"], "parent_id": parent_id, "eTag": item.get("eTag"),
+                                                  "cTag": item.get("cTag"), "size": item.get("size")})
+    if full_sync: # A full enumeration lists every item, so the ones it didn't list are gone
+        for folder_id in [folder_id for folder_id in folders if folder_id not in seen_ids]:
+            del folders[folder_id]
+        for item_id in [item_id for item_id in items if item_id not in seen_ids]:
+            entry = items.pop(item_id)
+            if not remove_mirrored_file(entry):
+                conflicts.append(entry["path"])
+
+    # Resolve the paths, so moved and renamed files (and the files of renamed folders) are moved locally
+    for item_id, entry in list(items.items()):
+        relative_path = get_sync_relative_path(state, entry.get("parent_id"), entry.get("name"))
+        if relative_path is None: # Moved out of the folder, or its folder was deleted
+            del items[item_id]
+            if not remove_mirrored_file(entry):
+                conflicts.append(entry["path"])
+            continue
+        if entry.get("path") not in (None, relative_path):
+            old_path = get_mirrored_file_path(entry["path"])
+            new_path = get_mirrored_file_path(relative_path)
+            try:
+                if os.path.lexists(new_path):
+                    raise FileExistsError(new_path) # Never move over a local file, it's checked below
+                os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                os.replace(old_path, new_path)
+                os.replace(get_download_cache_path(old_path), get_download_cache_path(new_path))
+                print(GREEN + f'=> Moved "{entry["path"]}" to "{relative_path}".' + RESET)
+            except OSError:
+                for key in ("local_size", "local_mtime_ns", "md5"): # Downloaded again below
+                    entry.pop(key, None)
+        entry["path"] = relative_path
+
+    synced = True
+    for entry in items.values():
+        local_path = get_mirrored_file_path(entry["path"])
+        if is_download_cache_current(local_path, entry):
+            continue
+        if is_mirrored_file_changed(entry):
+            print(RED + f'=> Conflict: "{entry["path"]}" changed on OneDrive, but the local file differs from the last synced version. Keeping the local file.' + RESET)
+            conflicts.append(entry["path"])
+            continue
+        onedrive_folder, _, file_name = f"{ONEDRIVE_TARGET_FOLDER}/{entry['path']}".rpartition("/")
+        if download_file_from_onedrive(access_token, onedrive_folder, file_name, local_path, None, entry):
+            record_mirrored_file(entry)
+        else:
+            synced = False
+    if synced: # Otherwise the old delta link is kept, so the failed downloads are retried by the next sync
+        state["delta_link"] = delta_link
+    os.makedirs(context.state_folder, exist_ok=True)
+    write_file_atomically(context.sync_state_path, json.dumps(state, indent=4))
+    if not synced:
+        return False
+    if conflicts:
+        print(RED + f'=> {len(conflicts)} file(s) in "{context.sync_folder}" were changed locally and kept instead of being '
+              f'replaced or removed: {", ".join(conflicts)}. Move or delete them to get the OneDrive version.' + RESET)
+        return False
+    print(GREEN + f'=> "{context.sync_folder}" mirrors OneDrive folder "{ONEDRIVE_TARGET_FOLDER}" ({len(changes)} change(s), {len(items)} file(s)).' + RESET)
+    return True
+
+def run_sync():
+    """
+    Runs `--sync` (see `sync_onedrive_folder()`).
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True if the mirror is current, False otherwise.
+    """
+    context.token_manager.start()
+    print(DARK_CYAN + "\n[OneDrive Authentication]" + RESET)
+    access_token = run_in_stage("onedrive authentication", authenticate_onedrive)
+    if not access_token:
+        print(RED + "=> Critical: Failed to authenticate with OneDrive. Exiting script." + RESET)
+        context.token_manager.stop()
+        return False
+    print(DARK_CYAN + f'\n[Sync OneDrive folder "{ONEDRIVE_TARGET_FOLDER}"]' + RESET)
+    synced = run_in_stage("sync", sync_onedrive_folder, access_token)
+    context.token_manager.stop()
+    return synced
+
+def describe_token_expiry(expires_at, has_refresh_token):
+    """
+    Describes how long a stored access token stays valid.
+
+    Parameters:
+    expires_at (float): The expiry as a Unix timestamp, or None if unknown.
+    has_refresh_token (bool): True if the token can be refreshed without signing in.
+
+    Returns:
+    tuple: (usable, description). `usable` is False if a browser sign-in is needed.
+    """
+    if expires_at and expires_at > time.time():
+        return True, f"valid for another {int((expires_at - time.time()) // 60)} min"
+    if has_refresh_token:
+        return True, "expired, will be refreshed on the next run"
+    return False, "expired and not refreshable, a browser sign-in is needed"
+
+def check_setup():
+    """
+    Checks the configuration, credentials, tokens, converter and dependencies of
+    this host without any network call or heavy import, and prints the result.
+
+    Parameters:
+    None
+
+    Returns:
+    bool: True if a backup can run without a configuration change, False otherwise.
+    """
+    results = [] # [(ok, description)]
+    def report(ok, description):
+        results.append((ok, description))
+        print((GREEN + "  [OK]     " if ok else RED + "  [FAILED] ") + description + RESET)
+
+    print(DARK_CYAN + f"\n[Setup check for host '{hostname}']" + RESET)
+    host_configuration = context.load_host_configuration()
+    report(host_configuration is not None, f"Configuration in '{os.path.abspath(context.configuration_path)}'")
+    if host_configuration is None:
+        return False
+    context.apply_configuration(host_configuration)
+    report(os.path.isdir(context.training_folder), f"Training folder '{context.training_folder}'")
+    report(os.path.isdir(context.credentials_folder), f"Credentials folder '{context.credentials_folder}'")
+
+    report(context.load_onedrive_client_credentials() is not None, "OneDrive client credentials")
+    try:
+        with open(context.onedrive_token_path, "r") as token_file:
+            token_data = json.load(token_file)
+        usable, description = describe_token_expiry(token_data.get("expires_at"), bool(token_data.get("refresh_token")))
+        report(usable, "OneDrive token: " + description)
+    except (OSError, json.JSONDecodeError):
+        report(False, "OneDrive token: missing, a browser sign-in is needed")
+
+    if needs_credentials("google_drive"):
+        report(os.path.exists(context.google_credentials_path), f"Google client credentials '{context.google_credentials_path}'")
+        try:
+            with open(context.google_token_path, "r") as token_file:
+                token_data = json.load(token_file)
+            expiry = token_data.get("expiry")
+            expires_at = datetime.fromisoformat(expiry.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp() if expiry else None
+            usable, description = describe_token_expiry(expires_at, bool(token_data.get("refresh_token")))
+            report(usable, "Google Drive token: " + description)
+        except (OSError, json.JSONDecodeError, ValueError):
+            report(False, "Google Drive token: missing, a browser sign-in is needed")
+    for destination in get_destinations():
+        destination_check = destination.check()
+        if destination_check:
+            report(*destination_check)
+
+    if context.converter_backend == "libreoffice":
+        report(shutil.which(context.soffice_path) is not None, f"Converter 'libreoffice' ('{context.soffice_path}')")
+    elif context.converter_backend in CONVERTERS:
+        report(importlib.util.find_spec(context.converter_backend) is not None, f"Converter '{context.converter_backend}'")
+    else:
+        report(False, f"Converter '{context.converter_backend}': unknown, use one of {', '.join(CONVERTERS)}")
+    missing_modules = [module for module in ("requests", "googleapiclient", "google_auth_oauthlib", "pypdf")
+                       if importlib.util.find_spec(module) is None]
+    report(not missing_modules, "Python packages" + (f": missing {', '.join(missing_modules)}" if missing_modules else ""))
+    if context.pdf_optimization and context.pdf_max_image_dpi and importlib.util.find_spec("PIL") is None:
+        print("PDF optimization: images are not downsampled without Pillow (pip install pypdf[image])")
+
+    print(f"\nDocument: {'present' if os.path.exists(context.docx_path) else 'not downloaded'} at '{context.docx_path}'")
+    spooled_uploads = load_spooled_uploads()
+    if spooled_uploads:
+        print(f"Upload spool: {len(spooled_uploads)} pending ({', '.join(job['remote_name'] for job in spooled_uploads)}), "
+              'uploaded by "--replay" or the next run')
+    reports = sorted(name for name in os.listdir(context.reports_folder) if name.endswith(".json")) if os.path.isdir(context.reports_folder) else []
+    if reports:
+        try:
+            with open(os.path.join(context.reports_folder, reports[-1]), "r") as report_file:
+                last_report = json.load(report_file)
+            failed_stages = sorted({stage["name"] for stage in last_report.get("stages", []) if stage.get("status") != "ok"})
+            print(f"Last run: {last_report.get('started_at')}, {last_report.get('duration', 0):.1f}s"
+                  + (f", failed stages: {', '.join(failed_stages)}" if failed_stages else ""))
+        except (OSError, json.JSONDecodeError, TypeError, ValueError):
+            print(f"Last run: report '{reports[-1]}' can't be read")
+    return all(ok for ok, _ in results)
+
+def parse_arguments():
+    """
+    Parses the command line arguments of the script.
+
+    Parameters:
+    None
+
+    Returns:
+    argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Back up the training program to OneDrive and Google Drive.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Instead of waiting for Enter, convert and upload the document after every save until stopped with Ctrl+C.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the run with cProfile and save the stats next to the run report.")
+    parser.add_argument("--batch", action="store_true",
+                        help='Back up every document matching "batch_documents" in the configuration (download, convert and upload, without editing).')
+    parser.add_argument("--sync", action="store_true",
+                        help="Only mirror the OneDrive training folder into the Mirror folder in training_folder (incrementally, via delta links) and exit.")
+    parser.add_argument("--replay", action="store_true",
+                        help="Only upload what earlier runs left in the upload spool (e.g. while offline) and exit.")
+    parser.add_argument("--versions", action="store_true",
+                        help="Only list the revisions in the local version history and exit.")
+    parser.add_argument("--diff", nargs=2, type=int, metavar="REVISION",
+                        help="Only compare the metadata of two revisions of the version history and exit.")
+    parser.add_argument("--restore", type=int, metavar="REVISION",
+                        help='Only restore a revision of the version history (as "<name> (revision N)" in training_folder, see --restore-to) and exit.')
+    parser.add_argument("--restore-to", metavar="PATH",
+                        help="The path --restore writes the revision to.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run as a resident daemon that keeps tokens, clients and the converter warm and runs the jobs other invocations hand over.")
+    parser.add_argument("--status", action="store_true",
+                        help="Only show the queued, running and recent jobs of the daemon and exit.")
+    parser.add_argument("--stop-daemon", action="store_true",
+                        help="Only ask the daemon to stop after its pending jobs and exit.")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Run here even if a daemon is running, instead of handing the work to it.")
+    parser.add_argument("--check", action="store_true",
+                        help="Only check the configuration, credentials, tokens and converter of this host (offline) and exit.")
+    return parser.parse_args()
+
+
+def open_document_for_editing(wait_for_enter):
+    """
+    Opens the downloaded document in its editor (step 3) and waits until the user
+    confirms with Enter that it was edited, saved and closed.
+
+    Parameters:
+    wait_for_enter (bool): False to return right after opening it (watch mode).
+
+    Returns:
+    bool: True if the document exists, False otherwise.
+    """
+    print(DARK_CYAN + f'\n[Open "{FILE_TO_DOWNLOAD_AND_EDIT}" for Editing]' + RESET)
+    if not os.path.exists(context.docx_path):
+        print(RED + f'=> Critical: Document "{context.docx_path}" not found before attempting to open. Exiting script.' + RESET)
+        return False
+    try:
+        os.startfile(context.docx_path)
+    except Exception as e:
+        print(RED + f"=> Could not automatically open the file '{context.docx_path}': {e}" + RESET)
+        print(RED + f"=> Please open the file manually from your file explorer: {os.path.abspath(context.docx_path)}" + RESET)
+    if wait_for_enter:
+        run_in_stage("editing", input, GREEN + f'=> ACTION REQUIRED\nEdit "{FILE_TO_DOWNLOAD_AND_EDIT}", save the changes, '
+                     'and CLOSE THE DOCUMENT EDITOR!\nOnce done, press Enter in this console window to continue...' + RESET)
+    return True
+
+async def run_backup_pipeline(watch_mode):
+    """
+    Runs steps 1 to 6 of the backup workflow as an asyncio pipeline.
+
+    Every blocking step runs in a worker thread as a timed `run_metrics` stage and
+    starts as soon as its inputs are ready: `context.token_manager` loads and, if
+    needed, refreshes both tokens in the background from the start, the Google
+    Drive authentication (a browser sign-in if there's no usable token) starts
+    right after the OneDrive authentication and runs while the document is
+    downloaded and edited, and the document is deleted from
+    OneDrive while it is being edited. See `process_document_async()` for the
+    overlap of conversion and uploads.
+
+    Parameters:
+    watch_mode (bool): True to stop after the Google Drive authentication, so the
+                       caller can start `watch_document()`.
+
+    Returns:
+    google.oauth2.credentials.Credentials: The Google Drive credentials, or None
+                                           if the authentication failed.
+    """
+    import asyncio
+    # Loads both stored tokens (refreshing them if needed) in the background, and keeps them fresh from then on
+    context.token_manager.start()
+
+    # 1. OneDrive Authentication
+    print(DARK_CYAN + "\n[OneDrive Authentication]" + RESET)
+    if not await run_stage("onedrive authentication", authenticate_onedrive):
+        print(RED + "=> Critical: Failed to authenticate with OneDrive. Exiting script." + RESET)
+        exit(1)
+
+    # 4. Google Drive Authentication, in the background from here on
+    google_drive_auth = asyncio.create_task(run_stage("google drive authentication", authenticate_google_drive))
+
+    # Upload what earlier runs couldn't, before the document is downloaded again
+    await replay_spooled_uploads(google_drive_auth)
+
+    # 2. Download file from OneDrive (or use local if download fails but local exists)
+    print(DARK_CYAN + f'\n[Download/Prepare "{FILE_TO_DOWNLOAD_AND_EDIT}"]' + RESET)
+    download_success = await run_stage("download", download_file_from_onedrive,
+                                       get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, FILE_TO_DOWNLOAD_AND_EDIT, context.docx_path)
+
+    deletion = None
+    if not download_success:
+        print(f"=> Download of '{FILE_TO_DOWNLOAD_AND_EDIT}' from OneDrive failed.")
+        if os.path.exists(context.docx_path):
+            print(GREEN + f"=> Using existing local file: '{context.docx_path}'." + RESET)
+        else:
+            print(RED + f"=> Critical: Local file '{context.docx_path}' also not found. Cannot proceed. Exiting script." + RESET)
+            exit(1)
+    else:
+        # 2a. Delete from OneDrive only if download was successful, in the background while the document is edited
+        print(DARK_CYAN + f'\n[Delete "{FILE_TO_DOWNLOAD_AND_EDIT}" from OneDrive post-download]' + RESET)
+        deletion = asyncio.create_task(run_stage("delete", delete_file_from_onedrive,
+                                                 get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, FILE_TO_DOWNLOAD_AND_EDIT))
+
+    # 3. Open file for editing (Manual Step). Blocks the event loop on purpose, so Ctrl+C
+    # still interrupts input(). The background stages keep running in their worker threads meanwhile.
+    if not open_document_for_editing(wait_for_enter=not watch_mode):
+        exit(1)
+
+    if deletion and not await deletion:
+        print(RED + f"=> Warning: Failed to delete '{FILE_TO_DOWNLOAD_AND_EDIT}' from OneDrive. "
+              "This might cause issues if the file was intended to be exclusively processed." + RESET)
+
+    if watch_mode:
+        google_drive_creds = await google_drive_auth
+        if not google_drive_creds and needs_credentials("google_drive"):
+            print(RED + "=> Skipping Google Drive upload due to authentication failure." + RESET)
+        return google_drive_creds
+
+    # 5./6. Convert and upload once (Google Drive only waits for its authentication once it is needed)
+    if not os.path.exists(context.docx_path):
+        print(RED + f"=> Critical: Document '{context.docx_path}' not found after editing step. Cannot convert to PDF. Exiting script." + RESET)
+        exit(1)
+    await process_document_async(google_drive_auth)
+    google_drive_creds = await google_drive_auth
+    if not google_drive_creds and needs_credentials("google_drive"):
+        print(RED + "=> Google Drive was skipped due to authentication failure." + RESET)
+    return google_drive_creds
 
-    It first checks for a locally stored, valid access token. If found and valid,
-    it's returned. If expired, it attempts to refresh it. If no token exists or
-    refreshing fails, it initiates the full OAuth 2.0 authorization code grant flow,
-    prompting the user to authorize the application in their browser.
-    The obtained tokens (access and refresh) are saved locally for future use.
+def clean_generated_files():
+    """
+    Deletes the PDFs generated from the document (step 7), once they are uploaded (or spooled).
 
     Parameters:
     None
 
     Returns:
-    str: The access token if authentication is successful, otherwise None.
-         This token is used for subsequent API calls to OneDrive.
+    None.
     """
-    if os.path.exists(onedrive_token_path):
-        try:
-            with open(onedrive_token_path, "r") as token_file:
-                token_data = json.load(token_file)
-            access_token = token_data.get("access_token")
-            expires_at = token_data.get("expires_at")
-            stored_refresh_token = token_data.get("refresh_token")
-
-            if access_token and expires_at and expires_at > time.time():
-                print(GREEN + "=> OneDrive token authenticated successfully from stored file!" + RESET)
-                return access_token
-
-            if stored_refresh_token:
-                print("OneDrive token expired or invalid, attempting to refresh...")
-                refreshed_access_token, new_expires_at, new_refresh_token = refresh_access_token(stored_refresh_token)
-                if refreshed_access_token:
-                    print(GREEN + "=> OneDrive token refreshed successfully!" + RESET)
-                    with open(onedrive_token_path, "w") as new_token_file:
-                        new_token_data = {
-                            "access_token": refreshed_access_token,
-                            "expires_at": new_expires_at,
-                            "refresh_token": new_refresh_token
-                        }
-                        json.dump(new_token_data, new_token_file)
-                    return refreshed_access_token
-                else:
-                    print(RED + "=> Failed to refresh OneDrive token. Proceeding to full authentication!" + RESET)
-        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-            print(RED + f"=> Error reading or parsing OneDrive token file ({onedrive_token_path}): {e}. Proceeding to full authentication." + RESET)
+    print(DARK_CYAN + "\n[Clean up local temporary files]" + RESET)
+    with run_metrics.stage("cleanup"):
+        clean_local_folder(context.training_pdf_path) # The one-page PDF for OneDrive
+        clean_local_folder(context.pdf_path)          # The full converted PDF
+        if os.path.exists(context.optimized_pdf_path):
+            clean_local_folder(context.optimized_pdf_path) # The optimized copy of it that was uploaded
 
+def run_backup(watch_mode):
+    """
+    Runs the complete backup workflow, timing every stage in `run_metrics`.
 
-    auth_params = {
-        "client_id": onedrive_client_id,
-        "redirect_uri": REDIRECT_URI,
-        "scope": ONEDRIVE_SCOPES,
-        "response_type": "code"
-    }
+    Parameters:
+    watch_mode (bool): True to convert and upload after every save (see
+                       `watch_document()`) instead of waiting for Enter once.
 
-    full_auth_url = AUTH_URL + "?" + urllib.parse.urlencode(auth_params)
-    print("\nClick on this link to authenticate with OneDrive:\n")
-    print(DARK_CYAN + full_auth_url + RESET)
-    url_input = input("\nCopy the redirected URL from your browser and paste it here:\n\n")
+    Returns:
+    None.
+    """
+    import asyncio
+    if watch_mode and getattr(get_converter(), "shares_user_application", False):
+        print(RED + '=> Watch mode converts every save, which would go through the Word the document is edited in. '
+              'Set "converter": "libreoffice" in configuration.json to use --watch on this system.' + RESET)
+        exit(1)
+    google_drive_creds = asyncio.run(run_backup_pipeline(watch_mode))
 
-    try:
-        code = parse_qs(urlparse(url_input).query).get('code', [''])[0]
-        if not code:
-            print(RED + "=> Could not extract authorization code from the redirected URL." + RESET)
-            return None
-    except Exception as e:
-        print(RED + f"=> Error parsing the redirected URL: {e}" + RESET)
-        return None
+    if watch_mode:
+        # 5./6. Convert and upload after every save
+        print(DARK_CYAN + f'\n[Watch "{FILE_TO_DOWNLOAD_AND_EDIT}" for Saves]' + RESET)
+        watch_document(google_drive_creds)
 
-    access_token, expires_at, refresh_token = exchange_code_for_tokens(code)
+    # 7. Clean up local generated files
+    clean_generated_files()
+    context.token_manager.stop()
 
-    if access_token:
-        print(GREEN + "=> OneDrive authenticated successfully via new authorization!" + RESET)
-        with open(onedrive_token_path, "w") as token_file:
-            token_data = {
-                "access_token": access_token,
-                "expires_at": expires_at,
-                "refresh_token": refresh_token
-            }
-            json.dump(token_data, token_file)
-        return access_token
-    else:
-        print(RED + "=> Failed to obtain OneDrive tokens after authorization." + RESET)
-        return None
 
-def download_file_from_onedrive(access_token, onedrive_folder, onedrive_filename, local_target_path):
+# --- Backup Daemon ---
+
+def get_daemon_address():
     """
-    Downloads a specific file from a specified folder in OneDrive to a local path.
+    Returns the local address the daemon accepts jobs on: a named pipe on Windows,
+    a Unix domain socket elsewhere. Both are only reachable from this machine.
+    """
+    if sys.platform == "win32":
+        return rf"\\.\pipe\TrainingBackup-{hostname}"
+    return os.path.join(tempfile.gettempdir(), f"TrainingBackup-{hostname}-{os.getuid()}.sock")
 
-    Constructs the Microsoft Graph API URL for the file content and makes a GET
-    request. If successful, streams the file content to the specified local path.
-    Creates parent directories for the local path if they don't exist.
+def send_to_daemon(message):
+    """
+    Sends a request to the running daemon and returns its reply.
+
+    The connection is authenticated with the key in `context.daemon_key_path`, which
+    only the user running the daemon can read.
 
     Parameters:
-    access_token (str): The valid OneDrive access token.
-    onedrive_folder (str): The name of the folder in OneDrive containing the file.
-    onedrive_filename (str): The name of the file to download from OneDrive.
-    local_target_path (str): The full local file path where the downloaded file
-                             should be saved.
+    message (dict): The request, e.g. {"command": "status"}.
 
     Returns:
-    bool: True if the download was successful, False otherwise.
+    dict: The reply, or None if no daemon is running (or it didn't answer).
     """
-    local_dir = os.path.dirname(local_target_path)
-    if local_dir and not os.path.exists(local_dir):
-        try:
-            os.makedirs(local_dir, exist_ok=True)
-            print(f"Created directory: {local_dir}")
-        except OSError as e:
-            print(RED + f"Error creating directory {local_dir}: {e}" + RESET)
-            return False
-
-
-    item_path = f"/{onedrive_folder}/{onedrive_filename}"
-    encoded_item_path = quote(item_path)
-
-    download_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{encoded_item_path}:/content"
-    headers = {"Authorization": "Bearer " + access_token}
-
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
     try:
-        response = requests.get(download_url, headers=headers, stream=True)
-        if response.status_code == 200:
-            with open(local_target_path, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            print(GREEN + f'=> Downloaded "{onedrive_filename}" to "{local_target_path}" successfully!' + RESET)
-            return True
-        else:
-            error_message = f'=> Error downloading "{onedrive_filename}" from OneDrive: {response.status_code}'
-            try:
-                error_details = response.json()
-                if error_details.get("error", {}).get("code") == "itemNotFound":
-                    error_message += f' - File not found in OneDrive folder "{onedrive_folder}".'
-                else:
-                    error_message += f' - Response: {response.text}'
-            except json.JSONDecodeError:
-                 error_message += f' - Response: {response.text}'
-            print(RED + error_message + RESET)
-            return False
-    except requests.exceptions.RequestException as e:
-        print(RED + f"=> Network or request error during OneDrive download: {e}" + RESET)
-        return False
+        with open(context.daemon_key_path, "r") as key_file:
+            authkey = bytes.fromhex(key_file.read().strip())
+        with Client(get_daemon_address(), authkey=authkey) as connection:
+            connection.send(message)
+            return connection.recv()
+    except (OSError, EOFError, ValueError, AuthenticationError):
+        return None
 
-def delete_file_from_onedrive(access_token, onedrive_folder, onedrive_filename):
+def prepare_document_job():
     """
-    Deletes a specific file from a specified folder in OneDrive.
+    Daemon job "prepare": steps 1 to 2a of the workflow. Replays the upload spool,
+    downloads the document and deletes it from OneDrive.
 
-    Constructs the Microsoft Graph API URL for the item and makes a DELETE request.
-    A 404 (Not Found) status is treated as a successful deletion for the
-    purpose of this script's workflow (i.e., the file is no longer there).
+    Returns:
+    bool: True if the document is ready to be edited, False otherwise.
+    """
+    import asyncio
+    if not run_in_stage("onedrive authentication", authenticate_onedrive):
+        print(RED + "=> Critical: Failed to authenticate with OneDrive." + RESET)
+        return False
+    google_creds = run_in_stage("google drive authentication", authenticate_google_drive)
+    asyncio.run(replay_spooled_uploads(google_creds))
+    print(DARK_CYAN + f'\n[Download/Prepare "{FILE_TO_DOWNLOAD_AND_EDIT}"]' + RESET)
+    if run_in_stage("download", download_file_from_onedrive, get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, FILE_TO_DOWNLOAD_AND_EDIT, context.docx_path):
+        print(DARK_CYAN + f'\n[Delete "{FILE_TO_DOWNLOAD_AND_EDIT}" from OneDrive post-download]' + RESET)
+        run_in_stage("delete", delete_file_from_onedrive, get_onedrive_access_token(), ONEDRIVE_TARGET_FOLDER, FILE_TO_DOWNLOAD_AND_EDIT)
+    elif os.path.exists(context.docx_path):
+        print(GREEN + f"=> Download failed. Using existing local file: '{context.docx_path}'." + RESET)
+    else:
+        print(RED + f"=> Critical: Download failed and local file '{context.docx_path}' not found." + RESET)
+        return False
+    return True
 
-    Parameters:
-    access_token (str): The valid OneDrive access token.
-    onedrive_folder (str): The name of the folder in OneDrive from which to delete the file.
-    onedrive_filename (str): The name of the file to delete from OneDrive.
+def process_document_job():
+    """
+    Daemon job "process": steps 5 to 7 of the workflow. Converts the edited document,
+    uploads all artifacts and deletes the generated PDFs.
 
     Returns:
-    bool: True if the file was successfully deleted or if it was not found (which
-          also means it's "gone"). False if an an unexpected error occurred during deletion.
+    bool: True if every upload succeeded, False otherwise.
     """
-    item_path = f"/{onedrive_folder}/{onedrive_filename}"
-    encoded_item_path = quote(item_path)
-    delete_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{encoded_item_path}"
-    headers = {"Authorization": "Bearer " + access_token}
-
-    try:
-        response = requests.delete(delete_url, headers=headers)
-        if response.status_code == 204: # No Content - successful deletion
-            print(GREEN + f'=> Successfully deleted "{onedrive_filename}" from OneDrive folder "{onedrive_folder}"!' + RESET)
-            return True
-        elif response.status_code == 404: # Not Found
-            print(f'=> File "{onedrive_filename}" not found in OneDrive folder "{onedrive_folder}" for deletion (considered success for workflow).' + RESET)
-            return True # File is not there, so effectively "deleted" for our purposes
-        else:
-            print(RED + f'=> Error deleting "{onedrive_filename}" from OneDrive: {response.status_code}' + RESET)
-            print(RED + f'URL: {delete_url}' + RESET)
-            print(RED + f'Response: {response.text}\n' + RESET)
-            return False
-    except requests.exceptions.RequestException as e:
-        print(RED + f"=> Network or request error during OneDrive deletion: {e}" + RESET)
+    if not run_in_stage("onedrive authentication", authenticate_onedrive):
+        print(RED + "=> Critical: Failed to authenticate with OneDrive." + RESET)
         return False
+    google_creds = run_in_stage("google drive authentication", authenticate_google_drive)
+    succeeded = process_document(google_creds)
+    clean_generated_files()
+    return succeeded
+
+class BackupDaemon:
+    """
+    Runs jobs handed over by `Training-Backup` invocations (see `submit_to_daemon()`)
+    in one long-running process, so the SDK imports, the configuration, the tokens
+    (kept fresh by `context.token_manager`), the pooled Microsoft Graph session, the
+    Drive service and the converter are loaded once instead of once per invocation.
 
-def upload_to_onedrive(access_token):
+    Jobs on the same document run one after the other, in the order they were
+    submitted; jobs on different documents (the edited document, `--sync` and `--batch`)
+    run side by side. `status()` lists the queued, running and recently finished jobs.
+    A run report is written whenever the last running job finished. Every job records
+    into the metrics current when it started (`self.metrics`), which are only replaced
+    while no job runs, so a job starting on another queue meanwhile never records into
+    a report that was already written.
     """
-    Uploads specified files to the 'Training' folder in OneDrive.
+    JOBS = { # {kind: (job function, document the job works on)}
+        "prepare": (prepare_document_job, FILE_TO_DOWNLOAD_AND_EDIT),
+        "process": (process_document_job, FILE_TO_DOWNLOAD_AND_EDIT),
+        "sync": (run_sync, "mirror"),
+        "replay": (replay_uploads, FILE_TO_DOWNLOAD_AND_EDIT), # Uploads its artifacts
+        "batch": (run_batch, "batch documents")
+    }
 
-    Specifically, it attempts to upload:
-    1. "ThePRogram2026.docx" (from `docx_path`).
-    2. "Training.pdf" (which is created by extracting the last page of
-       "ThePRogram2026.pdf" located at `pdf_path`).
+    def __init__(self):
+        self.jobs = [] # Queued, running and the last DAEMON_RECENT_JOBS finished jobs, oldest first
+        self.queues = {} # {document: queue.Queue}
+        self.workers = []
+        self.running_count = 0
+        self.next_job_id = 1
+        self.metrics = run_metrics.default # Including the warm-up
+        self._lock = threading.Lock()
 
-    If "ThePRogram2026.pdf" doesn't exist or is empty, it will skip creating
-    "Training.pdf" and might only upload the .docx file if available.
-    It handles file existence checks before attempting uploads.
+    def warm_up(self):
+        """Loads the tokens, the Drive service and the converter before the first job."""
+        context.token_manager.start() # Held until the daemon stops, so the jobs' own start()/stop() keep it running
+        print(DARK_CYAN + "\n[Warm up]" + RESET)
+        if not run_in_stage("onedrive authentication", authenticate_onedrive):
+            print(RED + "=> OneDrive authentication failed. Jobs will try again." + RESET)
+        run_in_stage("google drive authentication", authenticate_google_drive)
+        try:
+            run_in_stage("converter warm-up", get_converter().warm_up)
+        except Exception as e:
+            print(RED + f"=> Could not prepare the converter ({e}). Conversions will try again." + RESET)
 
-    Parameters:
-    access_token (str): The valid OneDrive access token.
+    def submit(self, kind):
+        """
+        Queues a job behind the other jobs on its document.
 
-    Returns:
-    None. Prints status messages to the console.
-    """
-    files_to_upload_map = {} # {onedrive_filename: local_path}
+        Parameters:
+        kind (str): One of `JOBS`.
 
-    # Prepare "Training.pdf" (last page of the main PDF)
-    if os.path.exists(pdf_path):
+        Returns:
+        dict: The job.
+        """
+        import queue
+        document = self.JOBS[kind][1]
+        with self._lock:
+            job = {"id": self.next_job_id, "kind": kind, "document": document, "state": "queued",
+                   "submitted_at": time.time(), "started_at": None, "finished_at": None, "succeeded": None,
+                   "done": threading.Event()}
+            self.next_job_id += 1
+            self.jobs.append(job)
+            if document not in self.queues:
+                self.queues[document] = queue.Queue()
+                worker = threading.Thread(target=self.run_queue, args=(self.queues[document],), name=f"jobs {document}", daemon=True)
+                self.workers.append(worker)
+                worker.start()
+            self.queues[document].put(job)
+        print(DARK_CYAN + f'\n[Job {job["id"]}: {kind} queued]' + RESET)
+        return job
+
+    def run_queue(self, job_queue):
+        """Runs the jobs of one document, one after the other, until `None` is queued."""
+        while True:
+            job = job_queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def run_job(self, job):
+        with self._lock:
+            job.update({"state": "running", "started_at": time.time()})
+            self.running_count += 1
+            metrics = self.metrics
+        run_metrics.bind(metrics)
+        print(DARK_CYAN + f'\n[Job {job["id"]}: {job["kind"]} started]' + RESET)
+        succeeded = False
         try:
-            reader = PdfReader(pdf_path)
-            if reader.pages:
-                last_page = reader.pages[-1]
-                writer = PdfWriter()
-                writer.add_page(last_page)
-                with open(training_pdf_path, "wb") as output_pdf:
-                    writer.write(output_pdf)
-                files_to_upload_map[ONEDRIVE_TRAINING_PDF_FILENAME] = training_pdf_path
+            with metrics.stage(f"job {job['kind']}"):
+                succeeded = bool(self.JOBS[job["kind"]][0]())
+        except BaseException as e: # Including exit() in shared workflow code, which must not end the daemon
+            print(RED + f'=> Job {job["id"]} ({job["kind"]}) failed: {e!r}' + RESET)
+        with self._lock:
+            job.update({"state": "finished", "finished_at": time.time(), "succeeded": succeeded})
+            self.running_count -= 1
+            finished_jobs = [finished for finished in self.jobs if finished["state"] == "finished"]
+            for finished in finished_jobs[:-DAEMON_RECENT_JOBS]:
+                self.jobs.remove(finished)
+            if self.running_count == 0: # Swapped under the lock, so the next job records into the new metrics
+                finished_metrics = self.metrics
+                self.metrics = run_metrics.default = RunMetrics()
             else:
-                print(RED + f'=> "{PDF_OUTPUT_FILENAME}" contains no pages. Cannot create "{ONEDRIVE_TRAINING_PDF_FILENAME}".' + RESET)
-        except Exception as e:
-            print(RED + f"=> Error creating '{ONEDRIVE_TRAINING_PDF_FILENAME}' from '{PDF_OUTPUT_FILENAME}': {e}" + RESET)
-    else:
-        print(RED + f'=> "{PDF_OUTPUT_FILENAME}" not found. Cannot create "{ONEDRIVE_TRAINING_PDF_FILENAME}" for OneDrive upload.' + RESET)
+                finished_metrics = None
+        job["done"].set()
+        print((GREEN if succeeded else RED) + f'=> Job {job["id"]} ({job["kind"]}) {"succeeded" if succeeded else "failed"} '
+              f'after {job["finished_at"] - job["started_at"]:.1f}s.' + RESET)
+        if finished_metrics is not None:
+            self.write_report(job["id"], finished_metrics)
 
-    # Prepare "ThePRogram2026.docx"
-    if os.path.exists(docx_path):
-        files_to_upload_map[FILE_TO_DOWNLOAD_AND_EDIT] = docx_path
-    else:
-        print(RED + f'=> Main document "{FILE_TO_DOWNLOAD_AND_EDIT}" not found at "{docx_path}". Cannot upload to OneDrive.' + RESET)
-
-    if not files_to_upload_map:
-        print(RED + "=> No files are available or prepared for OneDrive upload. Skipping." + RESET)
-        return
+    def write_report(self, job_id, finished_metrics):
+        """Writes the run report of the jobs since the last one (up to job `job_id`) from their `finished_metrics`."""
+        report_name = f"run-{finished_metrics.started_at:%Y%m%d-%H%M%S}-daemon-{job_id}.json"
+        finished_metrics.write_report(os.path.join(context.reports_folder, report_name))
+        prune_reports()
 
-    for onedrive_filename, local_file_path_to_upload in files_to_upload_map.items():
-        if not os.path.exists(local_file_path_to_upload):
-            print(f'File "{local_file_path_to_upload}" for OneDrive upload as "{onedrive_filename}" not found. Skipping this file!')
-            continue
+    def status(self):
+        """Returns the queued, running and recently finished jobs, without their events."""
+        with self._lock:
+            return [{key: value for key, value in job.items() if key != "done"} for job in self.jobs]
 
-        item_path = f"/{ONEDRIVE_TARGET_FOLDER}/{onedrive_filename}"
-        encoded_item_path = quote(item_path)
-        upload_url = f"https://graph.microsoft.com/v1.0/me/drive/root:{encoded_item_path}:/content"
-        headers = {"Authorization": "Bearer " + access_token, "Content-Type": "application/octet-stream"}
+    def handle_connection(self, connection):
+        """Answers a single request of `send_to_daemon()`. Returns False for a stop request."""
+        message = connection.recv()
+        command = message.get("command")
+        if command == "submit" and message.get("job") in self.JOBS:
+            job = self.submit(message["job"])
+            if message.get("wait"): # The caller needs the result, e.g. the document before editing it
+                threading.Thread(target=self.answer_when_done, args=(job, connection), daemon=True).start()
+                return True
+            connection.send({"id": job["id"], "state": job["state"]})
+        elif command == "status":
+            connection.send({"pid": os.getpid(), "jobs": self.status()})
+        elif command == "stop":
+            with self._lock:
+                pending_count = sum(job["state"] != "finished" for job in self.jobs)
+            connection.send({"pid": os.getpid(), "pending": pending_count})
+            connection.close()
+            return False
+        else:
+            connection.send({"error": f"Unknown request {message!r}"})
+        connection.close()
+        return True
 
+    def answer_when_done(self, job, connection):
+        job["done"].wait()
         try:
-            with open(local_file_path_to_upload, "rb") as file_content:
-                response = requests.put(upload_url, headers=headers, data=file_content)
+            connection.send({"id": job["id"], "state": job["state"], "succeeded": job["succeeded"]})
+        except OSError:
+            pass # The client is gone (e.g. Ctrl+C), the job ran anyway
+        finally:
+            connection.close()
 
-            if response.status_code == 200 or response.status_code == 201: # 200 OK (updated), 201 Created
-                print(GREEN + f'=> Uploaded "{onedrive_filename}" to OneDrive folder "{ONEDRIVE_TARGET_FOLDER}" successfully!' + RESET)
-            else:
-                print(RED + f'Error uploading "{onedrive_filename}" to OneDrive: {response.status_code}' + RESET)
-                print(RED + f'URL: {upload_url}\nResponse: {response.text}\n' + RESET)
-        except requests.exceptions.RequestException as e:
-            print(RED + f"Network or request error during OneDrive upload of '{onedrive_filename}': {e}" + RESET)
-        except IOError as e:
-            print(RED + f"IOError reading file '{local_file_path_to_upload}' for upload: {e}" + RESET)
-        except Exception as e:
-            print(RED + f"An unexpected error occurred during OneDrive upload of '{onedrive_filename}': {e}" + RESET)
+    def serve(self):
+        """
+        Accepts requests until a stop request (or Ctrl+C), then finishes the
+        queued jobs and stops.
 
-def authenticate_google_drive():
-    """
-    Authenticates the user with Google Drive using OAuth 2.0.
+        Returns:
+        bool: True if the daemon ran, False if it couldn't start.
+        """
+        import secrets
+        from multiprocessing.connection import Listener
+        if send_to_daemon({"command": "status"}) is not None:
+            print(RED + "=> A Training Backup daemon is already running on this machine. Stop it with --stop-daemon first." + RESET)
+            return False
+        address = get_daemon_address()
+        if sys.platform != "win32" and os.path.exists(address):
+            os.remove(address) # Left behind by a daemon that didn't stop cleanly
+        authkey = secrets.token_bytes(32)
+        os.makedirs(context.state_folder, exist_ok=True)
+        if not write_file_atomically(context.daemon_key_path, authkey.hex()): # mkstemp files are only readable by their owner
+            return False
+        self.warm_up()
+        listener = Listener(address, authkey=authkey)
+        print(GREEN + f'\n=> Training Backup daemon (pid {os.getpid()}) is accepting jobs on "{address}". Stop it with --stop-daemon.' + RESET)
+        try:
+            while True:
+                try:
+                    connection = listener.accept()
+                except (OSError, EOFError) as e: # e.g. a client with the wrong key
+                    print(RED + f"=> Rejected a connection: {e}" + RESET)
+                    continue
+                try:
+                    if not self.handle_connection(connection):
+                        break
+                except (OSError, EOFError) as e:
+                    print(RED + f"=> Error answering a request: {e}" + RESET)
+                    connection.close()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            listener.close()
+            print(DARK_CYAN + "\n[Stop the daemon]" + RESET)
+            with self._lock:
+                for job_queue in self.queues.values():
+                    job_queue.put(None) # After the jobs queued so far
+            for worker in self.workers:
+                worker.join()
+            context.token_manager.stop()
+            clean_local_folder(context.daemon_key_path)
+        return True
 
-    Similar to OneDrive authentication, it checks for a local token, refreshes if
-    expired, or initiates a new authorization flow via the browser.
-    The obtained credentials are saved locally.
+def run_daemon():
+    """
+    Runs `--daemon` (see `BackupDaemon`).
 
     Parameters:
     None
 
     Returns:
-    google.oauth2.credentials.Credentials: A Credentials object if authentication
-                                           is successful, otherwise None. This object
-                                           is used to build the Google Drive API service.
+    bool: True if the daemon ran and stopped, False if it couldn't start.
     """
-    google_creds = None
-    if os.path.exists(google_token_path):
-        try:
-            google_creds = Credentials.from_authorized_user_file(google_token_path, GOOGLE_DRIVE_SCOPES)
-        except Exception as e:
-            print(RED + f"=> Error loading Google credentials from token file '{google_token_path}': {e}" + RESET)
-            google_creds = None
-
-    if not google_creds or not google_creds.valid:
-        if google_creds and google_creds.expired and google_creds.refresh_token:
-            print("Google Drive token expired, attempting to refresh...")
-            try:
-                google_creds.refresh(Request())
-                print(GREEN + "=> Google Drive token refreshed successfully!" + RESET)
-            except Exception as e:
-                print(RED + f"=> Error refreshing Google Drive token: {e}. Proceeding to full authentication." + RESET)
-                google_creds = None
-        else:
-            print("No valid Google Drive token found or refresh failed. Performing new Google Drive authentication flow...")
-
-        if not google_creds: # This block runs if creds are None (initial, load fail, or refresh fail)
-            try:
-                if not os.path.exists(google_credentials_path):
-                    print(RED + f"Google API credentials file ('{google_credentials_path}') not found. Cannot proceed with Google auth." + RESET)
-                    return None
-                flow = InstalledAppFlow.from_client_secrets_file(google_credentials_path, GOOGLE_DRIVE_SCOPES)
-                google_creds = flow.run_local_server(port=0)
-                print(GREEN + "=> Google Drive authenticated successfully via new authorization!" + RESET)
-            except Exception as e:
-                print(RED + f"Error during new Google authentication flow: {e}" + RESET)
-                return None
+    return BackupDaemon().serve()
 
-        # Save the credentials for the next run
-        if google_creds and google_creds.valid:
-            try:
-                with open(google_token_path, "w") as token:
-                    token.write(google_creds.to_json())
-            except Exception as e:
-                print(RED + f"Error saving Google token to '{google_token_path}': {e}" + RESET)
+def submit_to_daemon(kind, wait=False):
+    """
+    Hands a job over to the running daemon.
 
-    if google_creds and google_creds.valid:
-        print(GREEN + "=> Google Drive token authenticated successfully!" + RESET)
-        return google_creds
-    else:
-        print(RED + "=> Google Drive authentication ultimately failed." + RESET)
-        return None
+    Parameters:
+    kind (str): The job, one of `BackupDaemon.JOBS`.
+    wait (bool): True to wait until the job finished.
 
-def upload_to_google_drive(google_creds):
+    Returns:
+    bool: True if the job was queued (or, with `wait`, succeeded), False otherwise.
     """
-    Uploads the "ThePRogram2026.pdf" (from `pdf_path`) to a specified folder
-    (GOOGLE_DRIVE_UPLOAD_FOLDER) in Google Drive.
+    reply = send_to_daemon({"command": "submit", "job": kind, "wait": wait})
+    if reply is None or "error" in reply:
+        print(RED + f"=> Could not hand the {kind} job to the daemon: {reply['error'] if reply else 'it is not running'}." + RESET)
+        return False
+    if not wait:
+        print(GREEN + f'=> Handed the {kind} job to the daemon (job {reply["id"]}). Follow it with --status or in the daemon window.' + RESET)
+        return True
+    return bool(reply.get("succeeded"))
 
-    It will:
-    1. Check if the target folder exists in Google Drive. If not, it creates it.
-    2. Check if a file with the target name (GOOGLE_DRIVE_UPLOAD_FILENAME) already
-       exists in that folder. If so, it deletes the existing file.
-    3. Upload the local PDF file to the target folder.
+def run_backup_with_daemon():
+    """
+    Runs the backup workflow with the running daemon: the daemon downloads the
+    document, it is edited here, and the daemon converts and uploads it while this
+    invocation already returns.
 
     Parameters:
-    google_creds (google.oauth2.credentials.Credentials): The authenticated Google
-                                                          Drive credentials object.
+    None
 
     Returns:
-    None. Prints status messages to the console.
+    bool: True if the conversion and uploads were handed to the daemon, False otherwise.
     """
-    if not os.path.exists(pdf_path):
-         print(RED + f"=> Local file '{pdf_path}' (for Google Drive upload as '{GOOGLE_DRIVE_UPLOAD_FILENAME}') not found. Skipping upload." + RESET)
-         return
-
-    try:
-        service = build("drive", "v3", credentials=google_creds)
-
-        # 1. Find or create the target folder
-        folder_id = None
-        response = service.files().list(
-            q=f"name='{GOOGLE_DRIVE_UPLOAD_FOLDER}' and mimeType='application/vnd.google-apps.folder' and trashed=false",
-            spaces="drive",
-            fields="files(id, name)"
-        ).execute()
-
-        if not response["files"]:
-            print(f'Folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" not found in Google Drive, creating it...')
-            folder_metadata = { "name": GOOGLE_DRIVE_UPLOAD_FOLDER, "mimeType": "application/vnd.google-apps.folder" }
-            created_folder = service.files().create(body=folder_metadata, fields="id").execute()
-            folder_id = created_folder.get("id")
-            print(GREEN + f"Folder '{GOOGLE_DRIVE_UPLOAD_FOLDER}' created with ID: {folder_id}" + RESET)
-        else:
-            folder_id = response["files"][0]["id"]
-
-        if not folder_id:
-            print(RED + f"Could not obtain folder ID for '{GOOGLE_DRIVE_UPLOAD_FOLDER}'. Cannot upload." + RESET)
-            return
+    print(f"=> Preparing \"{FILE_TO_DOWNLOAD_AND_EDIT}\" in the Training Backup daemon...")
+    if not submit_to_daemon("prepare", wait=True):
+        print(RED + f'=> Critical: The daemon could not prepare "{FILE_TO_DOWNLOAD_AND_EDIT}". See the daemon window.' + RESET)
+        return False
+    if not open_document_for_editing(wait_for_enter=True):
+        return False
+    return submit_to_daemon("process")
 
-        # 2. Delete existing file if it exists in the folder
-        response = service.files().list(
-            q=f"name='{GOOGLE_DRIVE_UPLOAD_FILENAME}' and parents in '{folder_id}' and trashed=false",
-            spaces="drive", fields="files(id, name)"
-        ).execute()
-        for existing_file in response.get("files", []):
-            existing_file_id = existing_file["id"]
-            service.files().delete(fileId=existing_file_id).execute()
-            print(GREEN + f'=> Successfully deleted existing file "{existing_file["name"]}"!' + RESET)
-
-        # 3. Upload the new file
-        file_metadata = { "name": GOOGLE_DRIVE_UPLOAD_FILENAME, "parents": [folder_id] }
-        media = MediaFileUpload(pdf_path, mimetype='application/pdf', resumable=True)
-        upload_file = service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-        print(GREEN + f'=> Uploaded "{GOOGLE_DRIVE_UPLOAD_FILENAME}" to Google Drive folder "{GOOGLE_DRIVE_UPLOAD_FOLDER}" successfully!' + RESET)
+def print_daemon_status():
+    """
+    Prints the jobs of the running daemon (`--status`).
 
-    except HttpError as e:
-        error_content = e.content.decode() if e.content else "No additional error content."
-        print(RED + f"=> An HTTP error occurred with Google Drive API: {e._get_reason()}\nDetails: {error_content}" + RESET)
-    except Exception as e:
-        print(RED + f"=> An unexpected error occurred during Google Drive operations: {str(e)}" + RESET)
+    Parameters:
+    None
 
-def clean_local_folder(file_path_to_delete):
+    Returns:
+    bool: True if a daemon is running, False otherwise.
     """
-    Deletes a specified file from the local filesystem.
+    reply = send_to_daemon({"command": "status"})
+    if reply is None:
+        print(RED + "=> No Training Backup daemon is running. Start one with --daemon." + RESET)
+        return False
+    print(GREEN + f"=> Training Backup daemon (pid {reply['pid']}) is running." + RESET)
+    if not reply["jobs"]:
+        print("=> No jobs yet.")
+    for job in reply["jobs"]:
+        if job["state"] == "finished":
+            state = ("succeeded" if job["succeeded"] else "failed") + f" after {job['finished_at'] - job['started_at']:.1f}s"
+        elif job["state"] == "running":
+            state = f"running for {time.time() - job['started_at']:.1f}s"
+        else:
+            state = "queued"
+        print(f"  {job['id']:>4}  {job['kind']:<8}  {datetime.fromtimestamp(job['submitted_at']):%H:%M:%S}  {state}")
+    return True
 
-    Checks if the file exists before attempting deletion. Prints a success message
-    if deleted, or a message if the file does not exist.
+def stop_daemon():
+    """
+    Asks the running daemon to stop once its queued jobs are done (`--stop-daemon`).
 
     Parameters:
-    file_path_to_delete (str): The absolute or relative path to the file
-                               that should be deleted.
+    None
 
     Returns:
-    None.
+    bool: True if a daemon was running, False otherwise.
     """
-    file_name_only = os.path.basename(file_path_to_delete)
-    if os.path.exists(file_path_to_delete):
-        try:
-            os.remove(file_path_to_delete)
-            print(GREEN + f'=> Local file "{file_name_only}" deleted successfully from "{os.path.dirname(file_path_to_delete)}"!' + RESET)
-        except OSError as e:
-            print(RED + f'=> Error deleting local file "{file_name_only}": {e}' + RESET)
-    else:
-        print(f'=> Local file "{file_name_only}" does not exist at "{file_path_to_delete}", no need to delete.')
+    reply = send_to_daemon({"command": "stop"})
+    if reply is None:
+        print(RED + "=> No Training Backup daemon is running." + RESET)
+        return False
+    print(GREEN + f"=> The Training Backup daemon (pid {reply['pid']}) stops after its {reply['pending']} pending job(s)." + RESET)
+    return True
 
 
 # --- Main Script Execution ---
 if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.check:
+        sys.exit(0 if check_setup() else 1)
 
-    # 1. OneDrive Authentication
-    print(DARK_CYAN + "\n[OneDrive Authentication]" + RESET)
-    one_drive_access_token = authenticate_onedrive()
-    if not one_drive_access_token:
-        print(RED + "=> Critical: Failed to authenticate with OneDrive. Exiting script." + RESET)
-        exit(1)
-
-    # 2. Download file from OneDrive (or use local if download fails but local exists)
-    print(DARK_CYAN + f'\n[Download/Prepare "{FILE_TO_DOWNLOAD_AND_EDIT}"]' + RESET)
-    download_success = download_file_from_onedrive(
-        one_drive_access_token,
-        ONEDRIVE_TARGET_FOLDER,
-        FILE_TO_DOWNLOAD_AND_EDIT,
-        docx_path
-    )
-
-    if not download_success:
-        print(f"=> Download of '{FILE_TO_DOWNLOAD_AND_EDIT}' from OneDrive failed.")
-        if os.path.exists(docx_path):
-            print(GREEN + f"=> Using existing local file: '{docx_path}'." + RESET)
-        else:
-            print(RED + f"=> Critical: Local file '{docx_path}' also not found. Cannot proceed. Exiting script." + RESET)
-            exit(1)
-    else:
-        # 2a. Delete from OneDrive only if download was successful
-        print(DARK_CYAN + f'\n[Delete "{FILE_TO_DOWNLOAD_AND_EDIT}" from OneDrive post-download]' + RESET)
-        delete_success = delete_file_from_onedrive(
-            one_drive_access_token,
-            ONEDRIVE_TARGET_FOLDER,
-            FILE_TO_DOWNLOAD_AND_EDIT
-        )
-        if not delete_success:
-            print(RED + f"=> Warning: Failed to delete '{FILE_TO_DOWNLOAD_AND_EDIT}' from OneDrive. "
-                  "This might cause issues if the file was intended to be exclusively processed." + RESET)
-
-    # 3. Open file for editing (Manual Step)
-    print(DARK_CYAN + f'\n[Open "{FILE_TO_DOWNLOAD_AND_EDIT}" for Editing]' + RESET)
-    if not os.path.exists(docx_path): # Should be true if we reached here
-        print(RED + f'=> Critical: Document "{docx_path}" not found before attempting to open. Exiting script.' + RESET)
-        exit(1)
-    try:
-        os.startfile(docx_path)
-    except Exception as e:
-        print(RED + f"=> Could not automatically open the file '{docx_path}': {e}" + RESET)
-        print(RED + f"=> Please open the file manually from your file explorer: {os.path.abspath(docx_path)}" + RESET)
-
-    input(GREEN + f'=> ACTION REQUIRED\nEdit "{FILE_TO_DOWNLOAD_AND_EDIT}", save the changes, '
-          'and CLOSE THE DOCUMENT EDITOR!\nOnce done, press Enter in this console window to continue...' + RESET)
-
-    # 4. Convert DOCX to PDF
-    print(DARK_CYAN + '\n[Convert ".docx" to ".pdf"]' + RESET)
-    if not os.path.exists(docx_path):
-        print(RED + f"=> Critical: Document '{docx_path}' not found after editing step. Cannot convert to PDF. Exiting script." + RESET)
-        exit(1)
+    profiler = cProfile.Profile() if arguments.profile else None
+    if profiler:
+        profiler.enable()
+    succeeded = True
+    daemon_job = next((kind for kind in ("replay", "batch", "sync") if getattr(arguments, kind)), None)
+    local_only = arguments.no_daemon or arguments.daemon or arguments.watch or arguments.status or arguments.stop_daemon
+    use_daemon = not local_only and send_to_daemon({"command": "status"}) is not None
     try:
-        convert(docx_path, pdf_path)
-        if os.path.exists(pdf_path):
-            print(GREEN + f'=> Converted "{os.path.basename(docx_path)}" to "{os.path.basename(pdf_path)}" successfully!' + RESET)
-        else:
-            print(RED + f"=> Conversion reported success, but PDF file '{pdf_path}' was not found. Check conversion tool." + RESET)
-    except Exception as e:
-        print(RED + f"=> Error during DOCX to PDF conversion: {e}" + RESET)
-        print(RED + "Attempting to proceed with uploads, but PDF-related parts might fail or use stale/missing data." + RESET)
-
-    # 5. Upload to OneDrive
-    print(DARK_CYAN + "\n[Upload to OneDrive]" + RESET)
-    upload_to_onedrive(one_drive_access_token)
-
-    # 6. Google Drive Operations (Auth and Upload)
-    if os.path.exists(pdf_path):
-        print(DARK_CYAN + "\n[Google Drive Authentication]" + RESET)
-        google_drive_creds = authenticate_google_drive()
-        if google_drive_creds:
-            print(DARK_CYAN + "\n[Google Drive Upload]" + RESET)
-            upload_to_google_drive(google_drive_creds)
+        if arguments.status:
+            succeeded = print_daemon_status()
+        elif arguments.stop_daemon:
+            succeeded = stop_daemon()
+        elif arguments.daemon:
+            succeeded = run_daemon()
+        elif use_daemon and daemon_job: # The daemon's run reports cover the job
+            succeeded = submit_to_daemon(daemon_job)
+        elif use_daemon and not (arguments.versions or arguments.diff or arguments.restore is not None):
+            succeeded = run_backup_with_daemon()
+        elif arguments.replay:
+            succeeded = replay_uploads()
+        elif arguments.batch:
+            succeeded = run_batch()
+        elif arguments.sync:
+            succeeded = run_sync()
+        elif arguments.versions:
+            succeeded = list_revisions()
+        elif arguments.diff:
+            succeeded = diff_revisions(*arguments.diff)
+        elif arguments.restore is not None:
+            succeeded = restore_revision(arguments.restore, arguments.restore_to)
         else:
-            print(RED + "=> Skipping Google Drive upload due to authentication failure." + RESET)
-    else:
-        print(RED + f"=> Skipping Google Drive operations as '{os.path.basename(pdf_path)}' was not found or failed to convert." + RESET)
-
-    # 7. Clean up local generated files
-    print(DARK_CYAN + "\n[Clean up local temporary files]" + RESET)
-    clean_local_folder(training_pdf_path) # The one-page PDF for OneDrive
-    clean_local_folder(pdf_path)          # The full converted PDF
\ No newline at end of file
+            run_backup(arguments.watch)
+    finally:
+        if profiler:
+            profiler.disable()
+        # Without a configuration there's no reports folder (and nothing to report), and the daemon reports its own jobs
+        if context.configuration_loaded and not (use_daemon or arguments.daemon or arguments.status or arguments.stop_daemon):
+            report_name = f"run-{run_metrics.started_at:%Y%m%d-%H%M%S}"
+            run_metrics.write_report(os.path.join(context.reports_folder, report_name + ".json"))
+            if profiler:
+                profile_path = os.path.join(context.reports_folder, report_name + ".prof")
+                profiler.dump_stats(profile_path)
+                print(f'=> Profile written to "{profile_path}". Inspect it with "python -m pstats {profile_path}".')
+            prune_reports()
+    if not succeeded:
+        sys.exit(1)
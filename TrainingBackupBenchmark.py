@@ -0,0 +1,860 @@
+"""
+Offline benchmark for TrainingBackup.py.
+
+Runs the backup pipeline (download, delete, conversion, page extraction and all
+uploads) against local stand-ins for Microsoft Graph and the Google Drive API,
+using generated .docx/.pdf fixtures of several sizes. The stand-ins can add
+latency, limit bandwidth and fail a share of requests, so download, split and
+upload throughput can be measured and compared between changes without touching
+the real cloud services or needing Microsoft Word.
+
+Usage:
+    python TrainingBackupBenchmark.py [--sizes small medium large] [--runs 3]
+                                      [--latency 0.02] [--bandwidth 0] [--failure-rate 0]
+                                      [--output results.json] [--verbose]
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import shutil
+import zipfile
+import hashlib
+import argparse
+import tempfile
+import threading
+import contextlib
+import statistics
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Constants ---
+FIXTURE_SIZES = { # Approximate size in bytes of the .docx and .pdf fixtures
+    "small": 256 * 1024,
+    "medium": 6 * 1024 * 1024,
+    "large": 24 * 1024 * 1024
+}
+FIXTURE_PDF_PAGES = {"small": 4, "medium": 20, "large": 60}
+BENCHMARK_TOKEN = "benchmark"
+
+
+# --- Network Conditions ---
+
+class NetworkConditions:
+    """
+    The simulated network the local stand-ins answer over.
+
+    Parameters:
+    latency (float): Seconds added to every request.
+    bandwidth (int): Bytes per second for request and response bodies, 0 for unlimited.
+    failure_rate (float): Share of requests (0.0 - 1.0) answered with "503 Service Unavailable".
+    seed (int): Seed for the failure injection, for repeatable runs.
+    """
+
+    def __init__(self, latency=0.0, bandwidth=0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, byte_count):
+        """Sleeps for the latency plus the transfer time of `byte_count` bytes."""
+        transfer_time = byte_count / self.bandwidth if self.bandwidth else 0.0
+        if self.latency or transfer_time:
+            time.sleep(self.latency + transfer_time)
+
+    def should_fail(self):
+        """Returns True if the current request should fail."""
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+
+# --- Local Stand-In Servers ---
+
+class MockHandler(BaseHTTPRequestHandler):
+    """
+    Base request handler of the stand-in servers.
+
+    Applies the server's `NetworkConditions` to every request and dispatches it
+    to `handle_request(method, path, query, body)` of the server.
+    """
+    protocol_version = "HTTP/1.1" # Keep-alive, so connection reuse shows up in the results
+
+    def log_message(self, format, *args):
+        pass
+
+    def dispatch(self, method):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        conditions = self.server.conditions
+        conditions.delay(len(body))
+        if not self.path.startswith("/discovery/") and conditions.should_fail(): # Discovery isn't API traffic
+            self.send_json(503, {"error": {"code": "serviceNotAvailable", "message": "Injected failure"}}, {"Retry-After": "1"})
+            return
+        split_url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(split_url.query))
+        self.server.handle_request(self, method, urllib.parse.unquote(split_url.path), query, body)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PATCH(self):
+        self.dispatch("PATCH")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def send_bytes(self, status, data=b"", content_type="application/octet-stream", headers=None):
+        self.server.conditions.delay(len(data))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 204:
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if status != 204:
+            self.wfile.write(data)
+
+    def send_json(self, status, payload, headers=None):
+        self.send_bytes(status, json.dumps(payload).encode(), "application/json", headers)
+
+class BatchItemHandler:
+    """
+    Collects the response to one request of a JSON $batch instead of sending it,
+    so the request can go through the same `handle_request()` as a direct one.
+
+    Parameters:
+    headers (dict): The request headers.
+    """
+
+    def __init__(self, headers=None):
+        self.headers = headers or {}
+        self.response = None
+
+    def send_bytes(self, status, data=b"", content_type="application/octet-stream", headers=None):
+        body = json.loads(data) if content_type == "application/json" else (data.decode("latin-1") or None)
+        self.response = {"status": status, "headers": dict(headers or {}), "body": body}
+
+    def send_json(self, status, payload, headers=None):
+        self.response = {"status": status, "headers": dict(headers or {}), "body": payload}
+
+class MockServer(ThreadingHTTPServer):
+    """
+    A threaded local HTTP server on a free port of 127.0.0.1.
+
+    Parameters:
+    conditions (NetworkConditions): The simulated network.
+    """
+    daemon_threads = True
+
+    def __init__(self, conditions):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.conditions = conditions
+        self.lock = threading.Lock()
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.reset()
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)): # Clients closing pooled connections
+            super().handle_error(request, client_address)
+
+    def reset(self):
+        raise NotImplementedError
+
+    def handle_request(self, handler, method, path, query, body):
+        raise NotImplementedError
+
+class MockGraphServer(MockServer):
+    """
+    Stand-in for the Microsoft Graph drive endpoints used by TrainingBackup.py.
+
+    Implements item metadata (GET/DELETE /me/drive/root:{path}), folder listings
+    (GET ...:/children), content download and simple upload (GET/PUT ...:/content)
+    resumable upload sessions
+    (POST ...:/createUploadSession and GET/PUT/DELETE on the session URL), delta
+    queries (GET ...:/delta, with deleted items and "token" delta links) and JSON
+    batching (POST /$batch), which fails its requests individually.
+
+    Like the real service, items only reference their parent by ID (no path), and
+    a moved or renamed folder is the only item of the move in the next delta.
+    """
+
+    def reset(self):
+        with self.lock:
+            self.items = {}      # {item_path.lower(): item}
+            self.folders = {"": {"id": "root", "name": "root", "parent_path": None, "sequence": 0}} # {folder_path.lower(): folder}
+            self.sessions = {}   # {session_id: session}
+            self.tombstones = {} # {item_path.lower(): deleted item}
+            self.sequence = 0    # Increased by every change, delta tokens are sequence numbers
+
+    @property
+    def api_url(self):
+        return self.base_url + "/v1.0"
+
+    def put_item(self, item_path, content):
+        """
+        Stores a file in the simulated OneDrive.
+
+        Parameters:
+        item_path (str): The item path, e.g. "/Training/ThePRogram2026.docx".
+        content (bytes): The file content.
+
+        Returns:
+        dict: The item's metadata.
+        """
+        with self.lock:
+            previous_item = self.items.get(item_path.lower())
+            self.create_folders(item_path.rsplit("/", 1)[0])
+            self.sequence += 1
+            item = {
+                "id": previous_item["id"] if previous_item else uuid.uuid4().hex,
+                "name": item_path.rsplit("/", 1)[-1],
+                "version": previous_item["version"] + 1 if previous_item else 1,
+                "parent_path": item_path.rsplit("/", 1)[0],
+                "sequence": self.sequence,
+                "content": content,
+                "quick_xor_hash": quick_xor_hash_of_bytes(content)
+            }
+            self.items[item_path.lower()] = item
+            self.tombstones.pop(item_path.lower(), None)
+            return self.item_metadata(item)
+
+    def create_folders(self, folder_path):
+        """Creates a folder and its missing parent folders. Called with `self.lock` held."""
+        if folder_path.lower() in self.folders:
+            return
+        self.create_folders(folder_path.rsplit("/", 1)[0])
+        self.sequence += 1
+        self.folders[folder_path.lower()] = {"id": uuid.uuid4().hex, "name": folder_path.rsplit("/", 1)[-1],
+                                             "parent_path": folder_path.rsplit("/", 1)[0], "sequence": self.sequence}
+
+    def move_folder(self, folder_path, new_folder_path):
+        """
+        Moves or renames a folder in the simulated OneDrive, with everything in it.
+
+        Parameters:
+        folder_path (str): The folder path, e.g. "/Training/Old".
+        new_folder_path (str): The new path, e.g. "/Training/Archive". Its parent must exist.
+        """
+        with self.lock:
+            old_prefix, new_prefix = folder_path.lower(), new_folder_path.lower()
+            for table in (self.folders, self.items):
+                for path in [path for path in table if path == old_prefix or path.startswith(old_prefix + "/")]:
+                    entry = table.pop(path)
+                    if entry["parent_path"].lower().startswith(old_prefix):
+                        entry["parent_path"] = new_folder_path + entry["parent_path"][len(folder_path):]
+                    table[new_prefix + path[len(old_prefix):]] = entry
+            self.sequence += 1
+            folder = self.folders[new_prefix]
+            self.tombstones[old_prefix] = {"id": folder["id"], "sequence": self.sequence} # For delta queries it was moved out of
+            folder.update({"name": new_folder_path.rsplit("/", 1)[-1], "parent_path": new_folder_path.rsplit("/", 1)[0], "sequence": self.sequence})
+
+    def item_metadata(self, item):
+        return {
+            "id": item["id"],
+            "name": item["name"],
+            "size": len(item["content"]),
+            "eTag": f'"{{{item["id"]}}},{item["version"]}"',
+            "cTag": f'"c:{{{item["id"]}}},{item["version"]}"',
+            "parentReference": {"id": self.folders[item["parent_path"].lower()]["id"]},
+            "file": {"hashes": {"quickXorHash": item["quick_xor_hash"]}}
+        }
+
+    def folder_metadata(self, folder):
+        metadata = {"id": folder["id"], "name": folder["name"], "folder": {}}
+        if folder["parent_path"] is not None:
+            metadata["parentReference"] = {"id": self.folders[folder["parent_path"].lower()]["id"]}
+        return metadata
+
+    def handle_request(self, handler, method, path, query, body):
+        if path.startswith("/upload-sessions/"):
+            self.handle_upload_session(handler, method, path.rsplit("/", 1)[-1], body)
+            return
+        if path == "/v1.0/$batch" and method == "POST":
+            self.handle_batch(handler, body)
+            return
+        prefix = "/v1.0/me/drive/root:"
+        if not path.startswith(prefix):
+            handler.send_json(404, {"error": {"code": "invalidRequest"}})
+            return
+        item_path, _, action = path[len(prefix):].partition(":/")
+        with self.lock:
+            item = self.items.get(item_path.lower())
+
+        if action == "content" and method == "GET":
+            if item:
+                handler.send_bytes(200, item["content"])
+            else:
+                handler.send_json(404, {"error": {"code": "itemNotFound"}})
+        elif action == "content" and method == "PUT":
+            handler.send_json(201 if item is None else 200, self.put_item(item_path, body))
+        elif action == "createUploadSession" and method == "POST":
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = {"item_path": item_path, "received": bytearray()}
+            handler.send_json(200, {
+                "uploadUrl": f"{self.base_url}/upload-sessions/{session_id}",
+                "expirationDateTime": "2099-01-01T00:00:00Z"
+            })
+        elif action == "children" and method == "GET":
+            with self.lock:
+                children = [self.item_metadata(child) for child_path, child in self.items.items()
+                            if child_path.rsplit("/", 1)[0] == item_path.lower()]
+            handler.send_json(200, {"value": children})
+        elif action == "delta" and method == "GET":
+            token = int(query.get("token", 0))
+            folder_prefix = item_path.lower() + "/"
+            with self.lock:
+                changes = [self.folder_metadata(changed) for changed_path, changed in self.folders.items()
+                           if (changed_path == item_path.lower() or changed_path.startswith(folder_prefix))
+                           and (changed["sequence"] > token or not token)]
+                changes += [self.item_metadata(changed) for changed_path, changed in self.items.items()
+                            if changed_path.startswith(folder_prefix) and changed["sequence"] > token]
+                if token: # A full enumeration only lists existing items
+                    changed_ids = {changed["id"] for changed in changes}
+                    changes += [{"id": deleted["id"], "deleted": {"state": "deleted"}} for deleted_path, deleted in self.tombstones.items()
+                                if deleted_path.startswith(folder_prefix) and deleted["sequence"] > token and deleted["id"] not in changed_ids]
+                delta_link = f"{self.api_url}/me/drive/root:{urllib.parse.quote(item_path)}:/delta?token={self.sequence}"
+            handler.send_json(200, {"value": changes, "@odata.deltaLink": delta_link})
+        elif action == "" and method == "GET":
+            with self.lock:
+                folder = self.folders.get(item_path.lower())
+                metadata = self.item_metadata(item) if item else self.folder_metadata(folder) if folder else None
+            if metadata:
+                handler.send_json(200, metadata)
+            else:
+                handler.send_json(404, {"error": {"code": "itemNotFound"}})
+        elif action == "" and method == "DELETE":
+            with self.lock:
+                deleted = self.items.pop(item_path.lower(), None)
+                if deleted:
+                    self.sequence += 1
+                    self.tombstones[item_path.lower()] = {"id": deleted["id"], "sequence": self.sequence}
+            if deleted:
+                handler.send_bytes(204)
+            else:
+                handler.send_json(404, {"error": {"code": "itemNotFound"}})
+        else:
+            handler.send_json(400, {"error": {"code": "invalidRequest"}})
+
+    def handle_batch(self, handler, body):
+        batch_requests = json.loads(body).get("requests", [])
+        if len(batch_requests) > 20:
+            handler.send_json(400, {"error": {"code": "invalidRequest", "message": "Too many requests in the batch"}})
+            return
+        responses = []
+        for batch_request in batch_requests:
+            item_handler = BatchItemHandler(batch_request.get("headers"))
+            if self.conditions.should_fail():
+                item_handler.send_json(503, {"error": {"code": "serviceNotAvailable", "message": "Injected failure"}}, {"Retry-After": "1"})
+            else:
+                split_url = urllib.parse.urlsplit(batch_request["url"])
+                query = dict(urllib.parse.parse_qsl(split_url.query))
+                item_body = json.dumps(batch_request["body"]).encode() if "body" in batch_request else b""
+                self.handle_request(item_handler, batch_request["method"], "/v1.0" + urllib.parse.unquote(split_url.path), query, item_body)
+            responses.append({"id": batch_request["id"], **item_handler.response})
+        handler.send_json(200, {"responses": responses})
+
+    def handle_upload_session(self, handler, method, session_id, body):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            handler.send_json(404, {"error": {"code": "itemNotFound"}})
+            return
+        if method == "DELETE":
+            with self.lock:
+                self.sessions.pop(session_id, None)
+            handler.send_bytes(204)
+            return
+        if method == "PUT":
+            content_range = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", handler.headers.get("Content-Range", ""))
+            if not content_range or int(content_range.group(1)) != len(session["received"]):
+                handler.send_json(416, {"error": {"code": "invalidRange"}})
+                return
+            session["received"].extend(body)
+            if len(session["received"]) >= int(content_range.group(3)):
+                with self.lock:
+                    self.sessions.pop(session_id, None)
+                handler.send_json(201, self.put_item(session["item_path"], bytes(session["received"])))
+                return
+        handler.send_json(202 if method == "PUT" else 200, {"nextExpectedRanges": [f"{len(session['received'])}-"]})
+
+class MockDriveServer(MockServer):
+    """
+    Stand-in for the Google Drive API v3 endpoints used by TrainingBackup.py.
+
+    Serves a discovery document pointing at itself and implements files.list
+    (with the name/mimeType/parents queries the script uses), files.get,
+    files.create for folders, files.delete and resumable media uploads for
+    files.create and files.update.
+    """
+
+    def reset(self):
+        with self.lock:
+            self.files = {}   # {file_id: file}
+            self.uploads = {} # {upload_id: {"metadata", "received"}}
+
+    @property
+    def discovery_url(self):
+        return self.base_url + "/discovery/v1/apis/{api}/{apiVersion}/rest"
+
+    def discovery_document(self):
+        import googleapiclient
+        document_path = os.path.join(os.path.dirname(googleapiclient.__file__), "discovery_cache", "documents", "drive.v3.json")
+        with open(document_path, "r", encoding="utf-8") as document_file:
+            document = json.load(document_file)
+        root_url = self.base_url + "/"
+        document.update({"rootUrl": root_url, "mtlsRootUrl": root_url, "baseUrl": root_url + document["servicePath"]})
+        return document
+
+    @staticmethod
+    def file_resource(drive_file):
+        return {key: value for key, value in drive_file.items() if key != "content"}
+
+    def create_file(self, metadata, content=None):
+        file_id = uuid.uuid4().hex
+        drive_file = {
+            "id": file_id,
+            "name": metadata.get("name"),
+            "mimeType": metadata.get("mimeType", "application/pdf"),
+            "parents": metadata.get("parents", []),
+            "trashed": False,
+            "content": content
+        }
+        if content is not None:
+            drive_file["md5Checksum"] = hashlib.md5(content).hexdigest()
+        with self.lock:
+            self.files[file_id] = drive_file
+        return drive_file
+
+    def update_file(self, file_id, content):
+        with self.lock:
+            drive_file = self.files.get(file_id)
+            if drive_file is not None:
+                drive_file.update({"content": content, "md5Checksum": hashlib.md5(content).hexdigest()})
+            return drive_file
+
+    def find_files(self, query):
+        name = re.search(r"name='([^']*)'", query)
+        mime_type = re.search(r"mimeType='([^']*)'", query)
+        parent = re.search(r"'([^']*)' in parents|parents in '([^']*)'", query)
+        with self.lock:
+            files = list(self.files.values())
+        return [
+            self.file_resource(drive_file)
+            for drive_file in files
+            if (not name or drive_file["name"] == name.group(1))
+            and (not mime_type or drive_file["mimeType"] == mime_type.group(1))
+            and (not parent or (parent.group(1) or parent.group(2)) in drive_file["parents"])
+            and not ("trashed=false" in query and drive_file["trashed"])
+        ]
+
+    def handle_request(self, handler, method, path, query, body):
+        if path.startswith("/discovery/"):
+            handler.send_json(200, self.discovery_document())
+        elif path == "/drive/v3/files" and method == "GET":
+            handler.send_json(200, {"files": self.find_files(query.get("q", ""))})
+        elif path == "/drive/v3/files" and method == "POST":
+            handler.send_json(200, {"id": self.create_file(json.loads(body or b"{}"))["id"]})
+        elif path.startswith("/drive/v3/files/") and method == "GET":
+            with self.lock:
+                drive_file = self.files.get(path.rsplit("/", 1)[-1])
+            if drive_file:
+                handler.send_json(200, self.file_resource(drive_file))
+            else:
+                handler.send_json(404, {"error": {"code": 404, "message": "File not found"}})
+        elif path.startswith("/drive/v3/files/") and method == "DELETE":
+            with self.lock:
+                deleted = self.files.pop(path.rsplit("/", 1)[-1], None)
+            if deleted:
+                handler.send_bytes(204)
+            else:
+                handler.send_json(404, {"error": {"code": 404, "message": "File not found"}})
+        elif path.startswith("/upload/drive/v3/files/") and method == "PATCH":
+            file_id = path.rsplit("/", 1)[-1]
+            with self.lock:
+                exists = file_id in self.files
+            if not exists:
+                handler.send_json(404, {"error": {"code": 404, "message": "File not found"}})
+                return
+            upload_id = uuid.uuid4().hex
+            with self.lock:
+                self.uploads[upload_id] = {"file_id": file_id, "received": bytearray()}
+            location = f"{self.base_url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            handler.send_json(200, {}, {"Location": location})
+        elif path == "/upload/drive/v3/files" and "upload_id" not in query:
+            upload_id = uuid.uuid4().hex
+            with self.lock:
+                self.uploads[upload_id] = {"metadata": json.loads(body or b"{}"), "received": bytearray()}
+            location = f"{self.base_url}/upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+            handler.send_json(200, {}, {"Location": location})
+        elif path == "/upload/drive/v3/files":
+            self.handle_media_upload(handler, query["upload_id"], body)
+        else:
+            handler.send_json(400, {"error": {"code": 400, "message": f"Unsupported request {method} {path}"}})
+
+    def handle_media_upload(self, handler, upload_id, body):
+        with self.lock:
+            upload = self.uploads.get(upload_id)
+        if upload is None:
+            handler.send_json(404, {"error": {"code": 404, "message": "Upload not found"}})
+            return
+        upload["received"].extend(body)
+        content_range = re.fullmatch(r"bytes (?:\d+-\d+|\*)/(\d+)", handler.headers.get("Content-Range", ""))
+        if content_range and len(upload["received"]) < int(content_range.group(1)):
+            headers = {"Range": f"bytes=0-{len(upload['received']) - 1}"} if upload["received"] else {}
+            handler.send_bytes(308, headers=headers)
+            return
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+        if "file_id" in upload:
+            drive_file = self.update_file(upload["file_id"], bytes(upload["received"]))
+            if drive_file is None:
+                handler.send_json(404, {"error": {"code": 404, "message": "File not found"}})
+                return
+        else:
+            drive_file = self.create_file(upload["metadata"], bytes(upload["received"]))
+        handler.send_json(200, self.file_resource(drive_file))
+
+
+# --- Fixtures ---
+
+def quick_xor_hash_of_bytes(content):
+    """
+    Computes the OneDrive quickXorHash of in-memory content with `compute_file_hashes()`.
+
+    Parameters:
+    content (bytes): The content to hash.
+
+    Returns:
+    str: The base64 quickXorHash.
+    """
+    import TrainingBackup
+    with tempfile.NamedTemporaryFile(delete=False) as content_file:
+        content_file.write(content)
+    try:
+        return TrainingBackup.compute_file_hashes(content_file.name)["quick_xor_hash"]
+    finally:
+        os.remove(content_file.name)
+
+def generate_docx(path, size, seed):
+    """
+    Writes a minimal .docx of roughly `size` bytes.
+
+    The bulk of the size is an uncompressed embedded "image" of random bytes,
+    like the photos and charts in a real program document.
+
+    Parameters:
+    path (str): The path of the .docx.
+    size (int): The approximate size in bytes.
+    seed (int): Seed of the random content, so each "edit" produces a different file.
+
+    Returns:
+    None.
+    """
+    content_types = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+        '<Override PartName="/word/document.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+        '</Types>'
+    )
+    relationships = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="word/document.xml"/>'
+        '</Relationships>'
+    )
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f'<w:body><w:p><w:r><w:t>Benchmark program, revision {seed}</w:t></w:r></w:p></w:body>'
+        '</w:document>'
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", content_types)
+        docx.writestr("_rels/.rels", relationships)
+        docx.writestr("word/document.xml", document)
+        docx.writestr("word/media/image1.jpeg", random.Random(seed).randbytes(size), compress_type=zipfile.ZIP_STORED)
+
+def generate_pdf(path, size, page_count, seed):
+    """
+    Writes a PDF of roughly `size` bytes with one full-page image per page.
+
+    Parameters:
+    path (str): The path of the PDF.
+    size (int): The approximate size in bytes.
+    page_count (int): The number of pages.
+    seed (int): Seed of the random image content.
+
+    Returns:
+    None.
+    """
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject, StreamObject
+
+    content_random = random.Random(seed)
+    writer = PdfWriter()
+    for page_number in range(page_count):
+        image = StreamObject()
+        image._data = content_random.randbytes(size // page_count)
+        image.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(1240),
+            NameObject("/Height"): NumberObject(1754),
+            NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject("/DCTDecode")
+        })
+        content = DecodedStreamObject()
+        content.set_data(b"q 595 0 0 842 0 0 cm /Im0 Do Q")
+        page = writer.add_blank_page(595, 842)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): writer._add_object(image)})
+        })
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as pdf_file:
+        writer.write(pdf_file)
+
+class FixtureConverter:
+    """
+    Stands in for a DOCX to PDF converter by copying the PDF fixture of the current size.
+
+    Registered as the "benchmark" converter, so conversion time is the copy plus
+    `conversion_delay` instead of depending on Microsoft Word or LibreOffice.
+    """
+    pdf_fixture_path = None
+    conversion_delay = 0.0
+
+    def convert(self, docx_path, pdf_path):
+        time.sleep(self.conversion_delay)
+        shutil.copyfile(FixtureConverter.pdf_fixture_path, pdf_path)
+
+    def warm_up(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# --- Benchmark ---
+
+def create_workspace(graph_server, drive_server):
+    """
+    Creates a temporary working folder with a configuration for this host that
+    points TrainingBackup.py at the stand-ins, and imports the module from it.
+
+    Parameters:
+    graph_server (MockGraphServer): The Microsoft Graph stand-in.
+    drive_server (MockDriveServer): The Google Drive stand-in.
+
+    Returns:
+    tuple: (workspace_folder, TrainingBackup module).
+    """
+    workspace_folder = tempfile.mkdtemp(prefix="TrainingBackupBenchmark-")
+    training_folder = os.path.join(workspace_folder, "Training")
+    credentials_folder = os.path.join(workspace_folder, "Credentials")
+    os.makedirs(training_folder)
+    os.makedirs(credentials_folder)
+
+    configuration = {
+        socket.gethostname(): {
+            "training_folder": training_folder,
+            "credentials_folder": credentials_folder,
+            "graph_api_url": graph_server.api_url,
+            "google_drive_discovery_url": drive_server.discovery_url,
+            "converter": "benchmark"
+        }
+    }
+    with open(os.path.join(workspace_folder, "configuration.json"), "w") as configuration_file:
+        json.dump(configuration, configuration_file)
+    with open(os.path.join(credentials_folder, "onedrive_credentials.json"), "w") as credentials_file:
+        json.dump({"client_id": BENCHMARK_TOKEN, "client_secret": BENCHMARK_TOKEN}, credentials_file)
+    with open(os.path.join(credentials_folder, "onedrive_token.json"), "w") as token_file:
+        json.dump({"access_token": BENCHMARK_TOKEN, "expires_at": time.time() + 7 * 24 * 3600, "refresh_token": BENCHMARK_TOKEN}, token_file)
+
+    os.chdir(workspace_folder)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import TrainingBackup
+    TrainingBackup.CONVERTERS["benchmark"] = FixtureConverter
+    return workspace_folder, TrainingBackup
+
+def run_pipeline(training_backup, graph_server, drive_server, fixture_folder, size_name, run_number, verbose):
+    """
+    Runs one backup of a document of the given size against the stand-ins.
+
+    Parameters:
+    training_backup (module): The imported TrainingBackup module.
+    graph_server (MockGraphServer): The Microsoft Graph stand-in.
+    drive_server (MockDriveServer): The Google Drive stand-in.
+    fixture_folder (str): The folder with the generated fixtures.
+    size_name (str): One of FIXTURE_SIZES.
+    run_number (int): The number of the run, used to vary the "edited" document. The
+                      stand-ins are reset before the first run of each size only.
+    verbose (bool): True to show the output of the pipeline.
+
+    Returns:
+    dict: The measurements of the run.
+    """
+    tb = training_backup
+    if run_number == 0: # Later runs of a size start from the remote state (and cached IDs) of the previous run
+        graph_server.reset()
+        drive_server.reset()
+        if os.path.exists(tb.context.google_drive_ids_path):
+            os.remove(tb.context.google_drive_ids_path)
+    for entry in os.listdir(tb.context.training_folder):
+        entry_path = os.path.join(tb.context.training_folder, entry)
+        shutil.rmtree(entry_path) if os.path.isdir(entry_path) else os.remove(entry_path)
+    with open(os.path.join(fixture_folder, f"{size_name}.docx"), "rb") as docx_fixture:
+        graph_server.put_item(f"/{tb.ONEDRIVE_TARGET_FOLDER}/{tb.FILE_TO_DOWNLOAD_AND_EDIT}", docx_fixture.read())
+    FixtureConverter.pdf_fixture_path = os.path.join(fixture_folder, f"{size_name}.pdf")
+
+    tb.run_metrics.default = tb.RunMetrics()
+    from google.oauth2.credentials import Credentials
+    google_creds = Credentials(token=BENCHMARK_TOKEN)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    started = time.monotonic()
+    with output:
+        with tb.run_metrics.stage("download"):
+            tb.download_file_from_onedrive(BENCHMARK_TOKEN, tb.ONEDRIVE_TARGET_FOLDER, tb.FILE_TO_DOWNLOAD_AND_EDIT, tb.context.docx_path)
+        with tb.run_metrics.stage("delete"):
+            tb.delete_file_from_onedrive(BENCHMARK_TOKEN, tb.ONEDRIVE_TARGET_FOLDER, tb.FILE_TO_DOWNLOAD_AND_EDIT)
+        generate_docx(tb.context.docx_path, FIXTURE_SIZES[size_name], seed=run_number + 1) # The "edit"
+        succeeded = tb.process_document(google_creds)
+    total_duration = time.monotonic() - started
+
+    report = tb.run_metrics.build_report()
+    stage_durations = {}
+    for stage in report["stages"]:
+        stage_durations[stage["name"]] = stage_durations.get(stage["name"], 0.0) + stage["duration"]
+    upload_stages = [stage for stage in report["stages"] if stage["name"].startswith("upload ")]
+    if upload_stages: # The uploads overlap each other and other stages, so measure from the first start to the last end
+        stage_durations["upload"] = (max(stage["started_at"] + stage["duration"] for stage in upload_stages)
+                                     - min(stage["started_at"] for stage in upload_stages))
+    download_bytes = sum(request["bytes_received"] for request in report["requests"] if request["stage"] == "download")
+    upload_bytes = sum(request["bytes_sent"] for request in report["requests"] if (request["stage"] or "").startswith("upload"))
+    failed_requests = sum(1 for request in report["requests"] if request["status"] is None or request["status"] >= 500)
+    retries = sum(totals["retries"] for totals in report["stage_totals"].values())
+
+    def throughput(byte_count, stage_name):
+        duration = stage_durations.get(stage_name)
+        return byte_count / duration / (1024 * 1024) if duration else 0.0
+
+    return {
+        "size": size_name,
+        "run": run_number,
+        "succeeded": bool(succeeded),
+        "total_duration": total_duration,
+        "stage_durations": stage_durations,
+        "download_mb_per_s": throughput(download_bytes, "download"),
+        "upload_mb_per_s": throughput(upload_bytes, "upload"),
+        "requests": len(report["requests"]),
+        "failed_requests": failed_requests,
+        "retries": retries
+    }
+
+def summarize(results):
+    """
+    Prints the median of every measurement per fixture size.
+
+    Parameters:
+    results (list): The measurements returned by `run_pipeline()`.
+
+    Returns:
+    dict: {size_name: {measurement: median}}.
+    """
+    summary = {}
+    print(f"\n{'size':<8}{'ok':>6}{'total s':>10}{'download MB/s':>15}{'split s':>10}{'upload s':>10}{'upload MB/s':>13}{'requests':>10}{'failed':>8}{'retries':>9}")
+    for size_name in FIXTURE_SIZES:
+        size_results = [result for result in results if result["size"] == size_name]
+        if not size_results:
+            continue
+        size_summary = {
+            "succeeded": sum(result["succeeded"] for result in size_results),
+            "runs": len(size_results),
+            "total_duration": statistics.median(result["total_duration"] for result in size_results),
+            "download_mb_per_s": statistics.median(result["download_mb_per_s"] for result in size_results),
+            "split_duration": statistics.median(result["stage_durations"].get("page extraction", 0.0) for result in size_results),
+            "upload_duration": statistics.median(result["stage_durations"].get("upload", 0.0) for result in size_results),
+            "upload_mb_per_s": statistics.median(result["upload_mb_per_s"] for result in size_results),
+            "requests": statistics.median(result["requests"] for result in size_results),
+            "failed_requests": statistics.median(result["failed_requests"] for result in size_results),
+            "retries": statistics.median(result["retries"] for result in size_results)
+        }
+        summary[size_name] = size_summary
+        print(f"{size_name:<8}{size_summary['succeeded']:>3}/{size_summary['runs']:<2}{size_summary['total_duration']:>10.3f}"
+              f"{size_summary['download_mb_per_s']:>15.2f}{size_summary['split_duration']:>10.3f}{size_summary['upload_duration']:>10.3f}"
+              f"{size_summary['upload_mb_per_s']:>13.2f}{size_summary['requests']:>10.0f}{size_summary['failed_requests']:>8.0f}{size_summary['retries']:>9.0f}")
+    return summary
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark TrainingBackup.py against local stand-ins for Microsoft Graph and Google Drive.")
+    parser.add_argument("--sizes", nargs="+", choices=list(FIXTURE_SIZES), default=list(FIXTURE_SIZES), help="Fixture sizes to benchmark.")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per fixture size (the median is reported).")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds of latency added to every request.")
+    parser.add_argument("--bandwidth", type=int, default=0, help="Bytes per second for request and response bodies (0 = unlimited).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests (0.0 - 1.0) that fail with 503.")
+    parser.add_argument("--conversion-delay", type=float, default=0.0, help="Seconds the stand-in converter takes per conversion.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for fixtures and failure injection.")
+    parser.add_argument("--output", help="Write all measurements and the summary to this JSON file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the pipeline.")
+    return parser.parse_args()
+
+
+# --- Main Script Execution ---
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    output_path = os.path.abspath(arguments.output) if arguments.output else None
+
+    conditions = NetworkConditions(arguments.latency, arguments.bandwidth, arguments.failure_rate, arguments.seed)
+    graph_server = MockGraphServer(conditions)
+    drive_server = MockDriveServer(conditions)
+    graph_server.start()
+    drive_server.start()
+
+    workspace_folder, training_backup = create_workspace(graph_server, drive_server)
+    FixtureConverter.conversion_delay = arguments.conversion_delay
+    fixture_folder = os.path.join(workspace_folder, "Fixtures")
+    os.makedirs(fixture_folder)
+    try:
+        for size_name in arguments.sizes:
+            generate_docx(os.path.join(fixture_folder, f"{size_name}.docx"), FIXTURE_SIZES[size_name], arguments.seed)
+            generate_pdf(os.path.join(fixture_folder, f"{size_name}.pdf"), FIXTURE_SIZES[size_name], FIXTURE_PDF_PAGES[size_name], arguments.seed)
+
+        results = []
+        for size_name in arguments.sizes:
+            for run_number in range(arguments.runs):
+                result = run_pipeline(training_backup, graph_server, drive_server, fixture_folder, size_name, run_number, arguments.verbose)
+                results.append(result)
+                print(f"{size_name} run {run_number + 1}/{arguments.runs}: {result['total_duration']:.3f}s "
+                      f"({'ok' if result['succeeded'] else 'FAILED'})")
+        summary = summarize(results)
+
+        if output_path:
+            with open(output_path, "w") as output_file:
+                json.dump({"arguments": vars(arguments), "summary": summary, "results": results}, output_file, indent=4)
+            print(f'\n=> Results written to "{output_path}".')
+    finally:
+        graph_server.shutdown()
+        drive_server.shutdown()
+        os.chdir(os.path.dirname(workspace_folder))
+        shutil.rmtree(workspace_folder, ignore_errors=True)
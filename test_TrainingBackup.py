@@ -0,0 +1,102 @@
+"""
+Tests for the Microsoft Word converter of TrainingBackup.py (`Docx2PdfConverter`).
+
+Word isn't available here, so `win32com.client` and `pythoncom` are replaced with
+stand-ins that record how Word is driven.
+
+Usage:
+    python -m pytest test_TrainingBackup.py
+"""
+import sys
+import types
+
+import pytest
+
+import TrainingBackup
+
+
+class FakeDocument:
+    def __init__(self, word, path, read_only):
+        self.word = word
+        self.path = path
+        self.read_only = read_only
+
+    def SaveAs(self, path, FileFormat):
+        self.word.calls.append(("SaveAs", path, FileFormat))
+
+    def Close(self, save_changes):
+        self.word.calls.append(("Close", save_changes))
+
+class FakeDocuments:
+    def __init__(self, word):
+        self.word = word
+
+    def Open(self, path, ReadOnly=False, AddToRecentFiles=True, Visible=True):
+        self.word.calls.append(("Open", path, ReadOnly))
+        return FakeDocument(self.word, path, ReadOnly)
+
+class FakeWord:
+    def __init__(self, private):
+        self.private = private
+        self.calls = []
+        self.Documents = FakeDocuments(self)
+
+    def Quit(self):
+        self.calls.append(("Quit",))
+
+
+@pytest.fixture
+def fake_word(monkeypatch):
+    """Replaces the COM modules with stand-ins and returns the list of Word instances started."""
+    instances = []
+    win32com_client = types.ModuleType("win32com.client")
+    win32com_client.Dispatch = lambda name: instances.append(FakeWord(private=False)) or instances[-1]
+    win32com_client.DispatchEx = lambda name: instances.append(FakeWord(private=True)) or instances[-1]
+    win32com = types.ModuleType("win32com")
+    win32com.client = win32com_client
+    pythoncom = types.ModuleType("pythoncom")
+    pythoncom.CoInitialize = pythoncom.CoUninitialize = lambda: None
+    monkeypatch.setitem(sys.modules, "win32com", win32com)
+    monkeypatch.setitem(sys.modules, "win32com.client", win32com_client)
+    monkeypatch.setitem(sys.modules, "pythoncom", pythoncom)
+    monkeypatch.setattr(TrainingBackup, "sys", types.SimpleNamespace(**{**vars(sys), "platform": "win32"})) # Only as seen by TrainingBackup
+    return instances
+
+@pytest.fixture
+def converter(monkeypatch):
+    """Selects the Word converter, as on Windows."""
+    monkeypatch.setattr(TrainingBackup.Docx2PdfConverter, "shares_user_application", False)
+    monkeypatch.setattr(TrainingBackup, "_converter", TrainingBackup.Docx2PdfConverter())
+    monkeypatch.setitem(vars(TrainingBackup.context), "batch_workers", 4) # Without loading a configuration
+    return TrainingBackup._converter
+
+
+def test_word_conversion_uses_a_private_instance(fake_word, converter, tmp_path):
+    converter.convert(str(tmp_path / "a.docx"), str(tmp_path / "a.pdf"))
+    assert len(fake_word) == 1 and fake_word[0].private
+    calls = fake_word[0].calls
+    assert calls[0] == ("Open", str(tmp_path / "a.docx"), True)
+    assert calls[1] == ("SaveAs", str(tmp_path / "a.pdf"), TrainingBackup.WORD_FORMAT_PDF)
+    assert calls[2:] == [("Close", 0), ("Quit",)]
+
+def test_word_conversions_dont_share_an_instance(fake_word, converter, tmp_path):
+    for name in ("a", "b"):
+        converter.convert(str(tmp_path / f"{name}.docx"), str(tmp_path / f"{name}.pdf"))
+    assert len(fake_word) == 2 and all(word.private for word in fake_word)
+    assert all(word.calls[-1] == ("Quit",) for word in fake_word)
+
+def test_word_instance_quits_if_conversion_fails(fake_word, converter, tmp_path, monkeypatch):
+    def fail(self, path, FileFormat):
+        raise OSError("disk full")
+    monkeypatch.setattr(FakeDocument, "SaveAs", fail)
+    with pytest.raises(OSError):
+        converter.convert(str(tmp_path / "a.docx"), str(tmp_path / "a.pdf"))
+    assert fake_word[0].calls[-2:] == [("Close", 0), ("Quit",)]
+
+def test_batch_converts_in_parallel_with_private_word_instances(converter):
+    assert TrainingBackup.get_batch_worker_count(10) == 4
+    assert TrainingBackup.get_batch_worker_count(2) == 2
+
+def test_batch_converts_one_at_a_time_in_the_users_word(converter, monkeypatch):
+    monkeypatch.setattr(TrainingBackup.Docx2PdfConverter, "shares_user_application", True)
+    assert TrainingBackup.get_batch_worker_count(10) == 1